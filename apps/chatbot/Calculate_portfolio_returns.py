@@ -1,6 +1,212 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import date
+from pathlib import Path
+import httpx
+import numpy as np
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 
+# API endpoint
+_URL = 'https://investment-chatbot-1.vercel.app/api/portfolio/calculate'
+
+# Request headers
+_HEADERS = {
+    'Content-Type': 'application/json'
+}
+
+# Shared session so repeated calls reuse the same keep-alive connection
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=50,
+    # allowed_methods=None lets the status retries apply to POST; the calculation is side-effect free
+    max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504], allowed_methods=None)
+))
+
+def _async_client():
+    """New httpx client for concurrent calls; it is bound to the running event loop, so never shared across asyncio.run calls"""
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=30,
+        headers=_HEADERS,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+    )
+
+# Two-tier result cache: in-memory LRU in front of one JSON file per key on disk.
+# Both tiers hold the encoded result, so every hit decodes a fresh dict callers may mutate
+_MEM_CACHE_SIZE = 2048
+_MEM_CACHE = OrderedDict()  # key -> (expires_at, encoded result)
+_DISK_CACHE_DIR = Path(__file__).resolve().parent / '.cache' / 'portret'
+_DISK_CACHE_MAX_FILES = 10000
+_DISK_PRUNE_EVERY = 256  # disk writes between prunes
+_disk_writes = 0
+
+# Results ending before the current month are settled; later ones change as new monthly rows land
+_CLOSED_MONTH_TTL = 7 * 86400
+_OPEN_MONTH_TTL = 3600
+
+def _cache_ttl(endDate):
+    """Seconds a result for endDate stays fresh"""
+    if str(endDate)[:7] < date.today().strftime('%Y-%m'):
+        return _CLOSED_MONTH_TTL
+    return _OPEN_MONTH_TTL
+
+def _cache_key(assets, weights, startDate, endDate):
+    """Build a stable key from normalized inputs (sorted pairs, rounded weights)"""
+    pairs = sorted((str(a).upper(), round(float(w), 6)) for a, w in zip(assets, weights))
+    normalized = [pairs, str(startDate)[:10], str(endDate)[:10]]
+    return hashlib.blake2b(json.dumps(normalized).encode()).hexdigest()
+
+def _mem_cache_put(key, expires_at, body):
+    """Store an encoded result in the in-memory LRU"""
+    _MEM_CACHE[key] = (expires_at, body)
+    _MEM_CACHE.move_to_end(key)
+    if len(_MEM_CACHE) > _MEM_CACHE_SIZE:
+        _MEM_CACHE.popitem(last=False)
+
+def _cache_get(key, ttl):
+    """Look up a result younger than ttl seconds in memory, then on disk"""
+    now = time.time()
+    entry = _MEM_CACHE.get(key)
+    if entry is not None:
+        expires_at, body = entry
+        if now < expires_at:
+            _MEM_CACHE.move_to_end(key)
+            return orjson.loads(body)
+        del _MEM_CACHE[key]
+    
+    path = _DISK_CACHE_DIR / f"{key}.json"
+    try:
+        written = path.stat().st_mtime
+        if now - written >= ttl:
+            return None
+        body = path.read_bytes()
+        result = orjson.loads(body)
+    except (OSError, orjson.JSONDecodeError):
+        return None
+    
+    _mem_cache_put(key, written + ttl, body)
+    return result
+
+def _prune_disk_cache():
+    """Delete disk entries past the longest TTL, then the oldest beyond _DISK_CACHE_MAX_FILES"""
+    entries = []
+    for path in _DISK_CACHE_DIR.glob('*.json'):
+        try:
+            entries.append((path.stat().st_mtime, path))
+        except OSError:
+            pass
+    entries.sort()
+    
+    cutoff = time.time() - _CLOSED_MONTH_TTL
+    excess = len(entries) - _DISK_CACHE_MAX_FILES
+    for i, (mtime, path) in enumerate(entries):
+        if mtime >= cutoff and i >= excess:
+            break
+        path.unlink(missing_ok=True)
+
+def _cache_put(key, ttl, result):
+    """Store a successful result in memory and on disk"""
+    global _disk_writes
+    body = orjson.dumps(result)
+    _mem_cache_put(key, time.time() + ttl, body)
+    
+    try:
+        _DISK_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        (_DISK_CACHE_DIR / f"{key}.json").write_bytes(body)
+    except OSError:
+        return  # Disk cache is best-effort
+    
+    _disk_writes += 1
+    if _disk_writes % _DISK_PRUNE_EVERY == 1:
+        try:
+            _prune_disk_cache()
+        except OSError:
+            pass
+
+def cache_clear():
+    """Clear both the in-memory and on-disk result caches"""
+    _MEM_CACHE.clear()
+    if _DISK_CACHE_DIR.exists():
+        for path in _DISK_CACHE_DIR.glob('*.json'):
+            path.unlink(missing_ok=True)
+
+def _validate_inputs(assets, weights, startDate, endDate):
+    """Return an error result if the inputs are invalid, otherwise None"""
+    if not assets or not weights or not startDate or not endDate:
+        return {
+            "success": False,
+            "error": "Missing required parameters"
+        }
+    
+    if len(assets) != len(weights):
+        return {
+            "success": False,
+            "error": f"Assets and weights must have same length"
+        }
+    
+    total = np.asarray(weights, dtype=np.float64).sum()
+    if not np.isfinite(total) or total <= 0:
+        return {
+            "success": False,
+            "error": "Weights must be finite numbers with a positive sum"
+        }
+    
+    return None
+
+def _normalize_portfolio(assets, weights):
+    """Scale weights to sum to 1.0 (rounded to 8 dp) and sort (asset, weight) pairs by ticker"""
+    w = np.asarray(weights, dtype=np.float64)
+    w = np.round(w / w.sum(), 8)
+    pairs = sorted(zip(assets, w.tolist()))
+    return [a for a, _ in pairs], [x for _, x in pairs]
+
+def _prepare_request(assets, weights, startDate, endDate):
+    """
+    Validate and normalize the inputs.
+    
+    Returns (result, None, None) when no request is needed (invalid inputs or a cache hit),
+    otherwise (None, (cache key, TTL), request payload).
+    """
+    error = _validate_inputs(assets, weights, startDate, endDate)
+    if error:
+        return error, None, None
+    
+    # Send a canonical payload so equivalent portfolios share cache entries
+    assets, weights = _normalize_portfolio(assets, weights)
+    
+    # Serve repeat calculations from cache
+    key = _cache_key(assets, weights, startDate, endDate)
+    ttl = _cache_ttl(endDate)
+    cached = _cache_get(key, ttl)
+    if cached is not None:
+        return cached, None, None
+    
+    payload = {
+        'assets': assets,
+        'weights': weights,
+        'startDate': startDate,
+        'endDate': endDate
+    }
+    return None, (key, ttl), payload
+
+def _parse_response(cache_slot, content):
+    """Decode the API response body, caching successful calculations under cache_slot's (key, TTL)"""
+    result = orjson.loads(content)
+    
+    # Only successful calculations are cached
+    if result.get('success'):
+        key, ttl = cache_slot
+        _cache_put(key, ttl, result)
+    
+    return result
+
 def calculate_portfolio_returns(assets, weights, startDate, endDate):
     """
     Calculates historical total returns for a portfolio of ETFs.
@@ -15,44 +221,59 @@ def calculate_portfolio_returns(assets, weights, startDate, endDate):
         Dictionary with complete portfolio calculation results
     """
     try:
-        # Validate inputs
-        if not assets or not weights or not startDate or not endDate:
-            return {
-                "success": False,
-                "error": "Missing required parameters"
-            }
-        
-        if len(assets) != len(weights):
-            return {
-                "success": False,
-                "error": f"Assets and weights must have same length"
-            }
+        result, cache_slot, payload = _prepare_request(assets, weights, startDate, endDate)
+        if result is not None:
+            return result
         
-        # API endpoint
-        url = 'https://investment-chatbot-1.vercel.app/api/portfolio/calculate'
-        
-        # Request headers
-        headers = {
-            'Content-Type': 'application/json'
-        }
+        # Make POST request
+        response = _SESSION.post(_URL, headers=_HEADERS, json=payload, timeout=30)
+        response.raise_for_status()
+        return _parse_response(cache_slot, response.content)
         
-        # Request payload
-        payload = {
-            'assets': assets,
-            'weights': weights,
-            'startDate': startDate,
-            'endDate': endDate
+    except Exception as e:
+        return {
+            "success": False,
+            "error": f"Error: {str(e)}"
         }
+
+
+async def calculate_portfolio_returns_async(assets, weights, startDate, endDate, client=None):
+    """
+    Async version of calculate_portfolio_returns.
+    
+    Takes the same arguments and returns the same dictionary shape. Pass an httpx.AsyncClient
+    to share its connections across concurrent calls; otherwise one is opened for this call.
+    """
+    try:
+        result, cache_slot, payload = _prepare_request(assets, weights, startDate, endDate)
+        if result is not None:
+            return result
         
         # Make POST request
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
+        if client is None:
+            async with _async_client() as client:
+                response = await client.post(_URL, json=payload)
+        else:
+            response = await client.post(_URL, json=payload)
         response.raise_for_status()
-        
-        # Return the full JSON response
-        return response.json()
+        return _parse_response(cache_slot, response.content)
         
     except Exception as e:
         return {
             "success": False,
             "error": f"Error: {str(e)}"
         }
+
+async def calculate_portfolio_returns_batch(payloads):
+    """
+    Calculates returns for several portfolios concurrently.
+    
+    Args:
+        payloads: List of dicts with 'assets', 'weights', 'startDate' and 'endDate' keys
+    
+    Returns:
+        List of result dictionaries in the same order as payloads
+    """
+    # One client per batch, opened and closed inside the caller's event loop
+    async with _async_client() as client:
+        return await asyncio.gather(*(calculate_portfolio_returns_async(**p, client=client) for p in payloads))
@@ -1,11 +1,17 @@
 import yfinance as yf
+import httpx
+import numpy as np
 import pandas as pd
+import polars as pl
 from supabase import create_client, Client
+import asyncio
+import functools
 import logging
 import os
-from datetime import datetime
+from datetime import date, datetime
+from pathlib import Path
 import time
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 import json
 
 # Configure logging
@@ -15,98 +21,351 @@ logger = logging.getLogger(__name__)
 # Environment variables
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
+# Optional direct Postgres connection string for the COPY fast path
+SUPABASE_DB_URL = os.getenv('SUPABASE_DB_URL')
+
+# Uploads larger than this go through COPY when SUPABASE_DB_URL is set
+COPY_THRESHOLD = 500
+
+# Same-day cache of Yahoo downloads, one Parquet file per (ticker, day)
+YF_CACHE_DIR = Path(os.getenv('YF_CACHE_DIR', str(Path.home() / '.cache' / 'fargason' / 'yf')))
+YF_CACHE_MAX_AGE_DAYS = 30
 
 def create_supabase_client() -> Client:
     """Create Supabase client"""
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
+@functools.lru_cache(maxsize=1)
+def get_supabase_client() -> Client:
+    """Return the process-wide Supabase client, creating it on first use"""
+    return create_supabase_client()
+
+# Tickers known to exist in the database, with the time they were confirmed
+ASSET_EXISTS_TTL = 300  # seconds
+_asset_exists_cache: Dict[str, float] = {}
+
+def _mark_assets_exist(tickers: List[str]) -> None:
+    """Record tickers as present in the database"""
+    now = time.time()
+    for ticker in tickers:
+        _asset_exists_cache[ticker] = now
+
+def check_assets_exist(client: Client, tickers: List[str]) -> set:
+    """Return the subset of tickers that already exist in database, using one query for uncached tickers"""
+    now = time.time()
+    existing = {t for t in tickers if now - _asset_exists_cache.get(t, float('-inf')) < ASSET_EXISTS_TTL}
+    uncached = [t for t in dict.fromkeys(tickers) if t not in existing]
+    
+    if uncached:
+        try:
+            # Distinct tickers server-side (see sql/existing_asset_tickers.sql): one row per ticker, never capped
+            result = client.rpc('existing_asset_tickers', {'tickers': uncached}).execute()
+            found = {row['asset_ticker'] for row in result.data}
+            _mark_assets_exist(list(found))
+            existing |= found
+        except Exception as e:
+            logger.error(f"Error checking asset existence: {e}")
+    
+    return existing
+
 def check_asset_exists(client: Client, ticker: str) -> bool:
     """Check if asset already exists in database"""
+    return ticker in check_assets_exist(client, [ticker])
+
+def prune_yf_cache() -> None:
+    """Delete cached Yahoo downloads older than YF_CACHE_MAX_AGE_DAYS"""
+    cutoff = time.time() - YF_CACHE_MAX_AGE_DAYS * 86400
+    for path in YF_CACHE_DIR.glob('*.parquet'):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            pass
+
+def _yf_cache_path(ticker: str) -> Path:
+    """Parquet cache file for today's download of ticker"""
+    return YF_CACHE_DIR / f"{ticker}-{date.today():%Y%m%d}.parquet"
+
+def _cache_close_history(ticker: str, prices: pl.DataFrame) -> None:
+    """Persist a downloaded close history to the same-day cache"""
     try:
-        result = client.table('asset_returns').select('asset_ticker').eq('asset_ticker', ticker).limit(1).execute()
-        return len(result.data) > 0
-    except Exception as e:
-        logger.error(f"Error checking asset existence: {e}")
-        return False
+        YF_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        prices.write_parquet(_yf_cache_path(ticker), compression='zstd', compression_level=3)
+    except OSError as e:
+        logger.warning(f"Could not cache download for {ticker}: {e}")
+
+def _close_frame(close: pd.Series) -> pl.DataFrame:
+    """Convert a pandas Close series indexed by date into a (Date, Close) Polars frame"""
+    return pl.from_pandas(close.rename('Close').rename_axis('Date').reset_index())
+
+def _download_monthly(tickers: Union[str, List[str]], **kwargs) -> pd.DataFrame:
+    """Download adjusted monthly bars - Yahoo aggregates them server-side"""
+    return yf.download(
+        tickers,
+        start='2000-01-01',
+        end=datetime.today().strftime('%Y-%m-%d'),
+        interval='1mo',
+        auto_adjust=True,
+        progress=False,
+        **kwargs
+    )
+
+def download_close_history(ticker: str) -> Optional[pl.DataFrame]:
+    """Return monthly adjusted closes (Date, Close) for ticker, reusing today's cached download"""
+    cache_path = _yf_cache_path(ticker)
+    if cache_path.exists():
+        logger.info(f"Using cached download for {ticker}")
+        return pl.read_parquet(cache_path)
+    
+    data = _download_monthly(ticker, threads=False)
+    
+    if data.empty:
+        logger.warning(f"No data for {ticker}")
+        return None
+    
+    # Check if we have the Close column (already adjusted for dividends)
+    if 'Close' not in data.columns:
+        logger.error(f"No Close price data for {ticker}")
+        return None
+    
+    close = data['Close']
+    if isinstance(close, pd.DataFrame):
+        # Newer yfinance returns (Price, Ticker) columns even for one ticker
+        close = close.iloc[:, 0]
+    prices = _close_frame(close)
+    
+    _cache_close_history(ticker, prices)
+    prune_yf_cache()
+    return prices
+
+def build_asset_frame(ticker: str, prices: pl.DataFrame) -> Optional[pd.DataFrame]:
+    """Turn a (Date, Close) history into the validated asset_returns frame for ticker"""
+    # Month-end close and simple returns as one lazy Polars plan. Grouping by month also
+    # folds the extra mid-month bar Yahoo sometimes appends for the current month.
+    monthly = (
+        prices
+        .lazy()
+        .drop_nulls('Close')
+        .with_columns(pl.col('Date').cast(pl.Date))
+        .sort('Date')
+        .group_by_dynamic('Date', every='1mo')
+        .agg(pl.col('Close').last())
+        .with_columns(
+            # Monthly bars are stamped at month start; keep month-end dates like the stored data
+            pl.col('Date').dt.month_end().dt.strftime('%Y-%m-%d').alias('return_date'),
+            (pl.col('Close') / pl.col('Close').shift(1) - 1).alias('monthly_return')
+        )
+        .drop_nulls('monthly_return')
+        .collect()
+    )
+    # |r| < 1 needs no more than float32 precision; payloads are rounded to 6 dp on upload
+    monthly_returns_values = monthly['monthly_return'].to_numpy().astype(np.float32, copy=False)
+    
+    if len(monthly_returns_values) < 12:  # Need at least 1 year
+        logger.warning(f"Insufficient data for {ticker} ({len(monthly_returns_values)} months)")
+        return None
+    
+    # Create dataframe with same structure as original (3 columns only), one array per column
+    n = len(monthly_returns_values)
+    df = pd.DataFrame({
+        'asset_ticker': np.full(n, ticker, dtype=object),
+        'return_date': monthly['return_date'].to_numpy(),
+        'monthly_return': monthly_returns_values
+    })
+    
+    logger.info(f"✓ Got {len(df)} months of data for {ticker} ({df['return_date'].min()} to {df['return_date'].max()})")
+    return df
 
 def fetch_and_validate_asset(ticker: str) -> Optional[pd.DataFrame]:
     """Fetch and validate asset data using the proven approach"""
     logger.info(f"Fetching {ticker}...")
     
     try:
-        # Create a Ticker object and use history() - Close is already dividend-adjusted
-        stock = yf.Ticker(ticker)
-        data = stock.history(start='2000-01-01', end=datetime.today().strftime('%Y-%m-%d'))
-        
-        if data.empty:
-            logger.warning(f"No data for {ticker}")
+        prices = download_close_history(ticker)
+        if prices is None:
             return None
         
-        # Check if we have the Close column (already adjusted for dividends)
-        if 'Close' not in data.columns:
-            logger.error(f"No Close price data for {ticker}")
-            return None
-        
-        # Use 'ME' for month-end resampling (same as original)
-        monthly_prices = data['Close'].resample('ME').last()
-        monthly_returns = monthly_prices.pct_change().dropna()
-        
-        if len(monthly_returns) < 12:  # Need at least 1 year
-            logger.warning(f"Insufficient data for {ticker} ({len(monthly_returns)} months)")
-            return None
-        
-        # Create dataframe with same structure as original (3 columns only)
-        df = pd.DataFrame({
-            'asset_ticker': ticker,
-            'return_date': monthly_returns.index.strftime('%Y-%m-%d'),
-            'monthly_return': monthly_returns.values
-        })
-        
-        logger.info(f"✓ Got {len(df)} months of data ({df['return_date'].min()} to {df['return_date'].max()})")
-        return df
+        return build_asset_frame(ticker, prices)
         
     except Exception as e:
         logger.error(f"Error fetching {ticker}: {e}")
         return None
 
-def upload_asset_data(client: Client, df: pd.DataFrame, ticker: str) -> bool:
-    """Upload asset data to Supabase using the proven batch approach"""
+def fetch_and_validate_assets(tickers: List[str]) -> Dict[str, pd.DataFrame]:
+    """Fetch and validate many assets with a single multi-ticker Yahoo download"""
+    logger.info(f"Fetching {len(tickers)} tickers...")
+    
+    histories = {}
+    to_download = []
+    for ticker in tickers:
+        cache_path = _yf_cache_path(ticker)
+        if cache_path.exists():
+            histories[ticker] = pl.read_parquet(cache_path)
+        else:
+            to_download.append(ticker)
+    
+    if to_download:
+        try:
+            data = _download_monthly(to_download, group_by='ticker', threads=True)
+            for ticker in to_download:
+                if ticker not in data.columns.get_level_values(0):
+                    continue
+                close = data[ticker]['Close'].dropna()
+                if close.empty:
+                    continue
+                histories[ticker] = _close_frame(close)
+                _cache_close_history(ticker, histories[ticker])
+            prune_yf_cache()
+        except Exception as e:
+            logger.error(f"Error in bulk download: {e}")
+    
+    results = {}
+    for ticker in tickers:
+        if ticker not in histories:
+            logger.warning(f"No data for {ticker}")
+            continue
+        try:
+            df = build_asset_frame(ticker, histories[ticker])
+        except Exception as e:
+            logger.error(f"Error processing {ticker}: {e}")
+            continue
+        if df is not None:
+            results[ticker] = df
+    
+    return results
+
+def _payload_returns(df: pd.DataFrame) -> np.ndarray:
+    """Monthly returns as float64 rounded to 6 dp, so float32 storage serializes to short values"""
+    return np.round(df['monthly_return'].to_numpy(dtype=np.float64), 6)
+
+def bulk_copy_asset_data(df: pd.DataFrame) -> None:
+    """Load asset data over a direct Postgres connection using binary COPY"""
+    import psycopg
+    
+    dates = pd.to_datetime(df['return_date']).dt.date.to_numpy()
+    rows = zip(df['asset_ticker'].to_numpy(), dates, _payload_returns(df))
+    
+    with psycopg.connect(SUPABASE_DB_URL) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "CREATE TEMP TABLE tmp_asset_returns "
+                "(asset_ticker text, return_date date, monthly_return double precision) ON COMMIT DROP"
+            )
+            with cur.copy(
+                "COPY tmp_asset_returns (asset_ticker, return_date, monthly_return) FROM STDIN WITH (FORMAT binary)"
+            ) as copy:
+                copy.set_types(['text', 'date', 'float8'])
+                for ticker, return_date, monthly_return in rows:
+                    copy.write_row((ticker, return_date, float(monthly_return)))
+            
+            # Same semantics as the REST upsert: new rows inserted, existing rows updated
+            cur.execute(
+                "INSERT INTO asset_returns (asset_ticker, return_date, monthly_return) "
+                "SELECT asset_ticker, return_date, monthly_return FROM tmp_asset_returns "
+                "ON CONFLICT (asset_ticker, return_date) DO UPDATE SET monthly_return = EXCLUDED.monthly_return"
+            )
+
+# Upload tuning - batches are sent concurrently over one HTTP/2 connection
+UPLOAD_BATCH_SIZE = 1000
+UPLOAD_CONCURRENCY = 10
+UPLOAD_MAX_RETRIES = 3
+
+async def _upsert_batch(http: httpx.AsyncClient, semaphore: asyncio.Semaphore,
+                        batch: List[Dict], batch_num: int, total_batches: int) -> None:
+    """Upsert one batch through PostgREST, retrying 5xx responses with exponential backoff"""
+    async with semaphore:
+        for attempt in range(UPLOAD_MAX_RETRIES + 1):
+            # Upsert like the original - existing rows are merged rather than duplicated
+            response = await http.post(
+                '/rest/v1/asset_returns',
+                params={'on_conflict': 'asset_ticker,return_date'},
+                json=batch
+            )
+            if response.status_code >= 500 and attempt < UPLOAD_MAX_RETRIES:
+                delay = 0.5 * (2 ** attempt)
+                logger.warning(f"Batch {batch_num} failed with HTTP {response.status_code}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            response.raise_for_status()
+            logger.info(f"✓ Batch {batch_num}/{total_batches} uploaded ({len(batch)} rows)")
+            return
+
+async def _upsert_records(records: List[Dict]) -> None:
+    """Send all record batches concurrently to the asset_returns REST endpoint"""
+    batches = [records[i:i + UPLOAD_BATCH_SIZE] for i in range(0, len(records), UPLOAD_BATCH_SIZE)]
+    total_batches = len(batches)
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+    headers = {
+        'apikey': SUPABASE_KEY,
+        'Authorization': f'Bearer {SUPABASE_KEY}',
+        'Content-Type': 'application/json',
+        'Prefer': 'resolution=merge-duplicates,return=minimal'
+    }
+    
+    async with httpx.AsyncClient(base_url=SUPABASE_URL, http2=True, timeout=60, headers=headers) as http:
+        await asyncio.gather(*(
+            _upsert_batch(http, semaphore, batch, batch_num, total_batches)
+            for batch_num, batch in enumerate(batches, start=1)
+        ))
+
+def rpc_add_returns(client: Client, df: pd.DataFrame) -> None:
+    """Upsert asset data in one call to the add_returns RPC (see sql/add_returns.sql)"""
+    client.rpc('add_returns', {
+        'tickers': df['asset_ticker'].tolist(),
+        'dates': df['return_date'].tolist(),
+        'returns': _payload_returns(df).tolist()
+    }).execute()
+
+async def upload_asset_data_async(client: Client, dfs: Union[pd.DataFrame, List[pd.DataFrame]], ticker: str) -> bool:
+    """Upload one or more asset DataFrames to Supabase as a single bulk upsert"""
+    if isinstance(dfs, pd.DataFrame):
+        dfs = [dfs]
+    df = dfs[0] if len(dfs) == 1 else pd.concat(dfs, ignore_index=True)
     logger.info(f"Uploading {len(df)} records for {ticker}...")
     
+    if SUPABASE_DB_URL and len(df) > COPY_THRESHOLD:
+        try:
+            await asyncio.to_thread(bulk_copy_asset_data, df)
+            logger.info(f"✓ Successfully copied {len(df)} records for {ticker}")
+            _mark_assets_exist(df['asset_ticker'].unique().tolist())
+            return True
+        except Exception as e:
+            logger.warning(f"COPY fast path failed for {ticker}, falling back to upsert: {e}")
+    
     try:
-        records = df.to_dict('records')
+        await asyncio.to_thread(rpc_add_returns, client, df)
+        logger.info(f"✓ Successfully uploaded {len(df)} records for {ticker} via add_returns")
+        _mark_assets_exist(df['asset_ticker'].unique().tolist())
+        return True
+    except Exception as e:
+        logger.warning(f"add_returns RPC failed for {ticker}, falling back to batched upsert: {e}")
+    
+    try:
+        records = [
+            {'asset_ticker': t, 'return_date': d, 'monthly_return': r}
+            for t, d, r in zip(df['asset_ticker'].tolist(), df['return_date'].tolist(), _payload_returns(df).tolist())
+        ]
         
-        # Upload in batches like the original (batch size 1000)
-        batch_size = 1000
-        total_batches = (len(records) + batch_size - 1) // batch_size
-        uploaded_count = 0
+        await _upsert_records(records)
         
-        for i in range(0, len(records), batch_size):
-            batch = records[i:i + batch_size]
-            batch_num = (i // batch_size) + 1
-            
-            try:
-                # Use upsert like the original - this will skip existing data
-                result = client.table('asset_returns').upsert(batch).execute()
-                uploaded_count += len(batch)
-                logger.info(f"✓ Batch {batch_num}/{total_batches} uploaded ({len(batch)} rows)")
-            except Exception as e:
-                logger.error(f"✗ ERROR in batch {batch_num}: {e}")
-                return False
-        
-        logger.info(f"✓ Successfully uploaded {uploaded_count} records for {ticker}")
+        logger.info(f"✓ Successfully uploaded {len(records)} records for {ticker}")
+        _mark_assets_exist(df['asset_ticker'].unique().tolist())
         return True
         
     except Exception as e:
         logger.error(f"Error uploading {ticker}: {e}")
         return False
 
+def upload_asset_data(client: Client, dfs: Union[pd.DataFrame, List[pd.DataFrame]], ticker: str) -> bool:
+    """Synchronous wrapper around upload_asset_data_async"""
+    return asyncio.run(upload_asset_data_async(client, dfs, ticker))
+
 def add_new_asset(ticker: str) -> Dict[str, any]:
     """Add a new asset to the database"""
     logger.info(f"Processing request for new asset: {ticker}")
     
     try:
-        client = create_supabase_client()
+        client = get_supabase_client()
         
         # Check if asset already exists
         if check_asset_exists(client, ticker):
@@ -153,12 +412,96 @@ def add_new_asset(ticker: str) -> Dict[str, any]:
             'action': 'error'
         }
 
+async def add_new_assets_async(tickers: List[str], concurrency: int = 8) -> Dict[str, Dict[str, any]]:
+    """Add several assets at once, fetching them concurrently and uploading in one pass"""
+    logger.info(f"Processing request for {len(tickers)} new assets")
+    
+    results = {}
+    
+    try:
+        client = get_supabase_client()
+        
+        # Skip assets that already exist
+        existing = check_assets_exist(client, tickers)
+        pending = []
+        for ticker in tickers:
+            if ticker in existing:
+                results[ticker] = {
+                    'success': True,
+                    'message': f'{ticker} already exists in database',
+                    'action': 'exists'
+                }
+            else:
+                pending.append(ticker)
+        
+        # One multi-ticker download covers most tickers; yfinance is blocking, so run it in a thread
+        fetched = await asyncio.to_thread(fetch_and_validate_assets, pending) if pending else {}
+        
+        # Retry tickers the bulk download missed individually, bounded by a semaphore
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def fetch(ticker: str) -> Optional[pd.DataFrame]:
+            async with semaphore:
+                return await asyncio.to_thread(fetch_and_validate_asset, ticker)
+        
+        missing = [ticker for ticker in pending if ticker not in fetched]
+        frames = await asyncio.gather(*(fetch(ticker) for ticker in missing))
+        
+        for ticker, df in zip(missing, frames):
+            if df is None:
+                results[ticker] = {
+                    'success': False,
+                    'message': f'Could not fetch valid data for {ticker}',
+                    'action': 'fetch_failed'
+                }
+            else:
+                fetched[ticker] = df
+        
+        if fetched:
+            # Upload everything in a single bulk pass
+            uploaded = await upload_asset_data_async(client, list(fetched.values()), ', '.join(fetched))
+            
+            for ticker, df in fetched.items():
+                if uploaded:
+                    results[ticker] = {
+                        'success': True,
+                        'message': f'Successfully added {ticker} with {len(df)} data points',
+                        'action': 'added',
+                        'data_points': len(df),
+                        'date_range': {
+                            'start': df['return_date'].min(),
+                            'end': df['return_date'].max()
+                        }
+                    }
+                else:
+                    results[ticker] = {
+                        'success': False,
+                        'message': f'Failed to upload {ticker} to database',
+                        'action': 'upload_failed'
+                    }
+        
+        return results
+        
+    except Exception as e:
+        logger.error(f"Error processing batch: {e}")
+        for ticker in tickers:
+            results.setdefault(ticker, {
+                'success': False,
+                'message': f'Error processing {ticker}: {str(e)}',
+                'action': 'error'
+            })
+        return results
+
 if __name__ == "__main__":
     # Test the function
     import sys
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 2:
+        tickers = [arg.upper() for arg in sys.argv[1:]]
+        results = asyncio.run(add_new_assets_async(tickers))
+        print(json.dumps(results, indent=2))
+    elif len(sys.argv) > 1:
         ticker = sys.argv[1].upper()
         result = add_new_asset(ticker)
         print(json.dumps(result, indent=2))
     else:
-        print("Usage: python dynamic_asset_fetcher.py <TICKER>")
+        print("Usage: python add_new_asset.py <TICKER> [<TICKER> ...]")
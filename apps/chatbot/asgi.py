@@ -0,0 +1,5 @@
+# asgi.py
+from portfolio_mcp_server import app
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=8000)
@@ -1,15 +1,38 @@
-from flask import Flask, request, jsonify
-import requests
+import hashlib
+from typing import Annotated, List
+from quart import Quart, Response, request
+import httpx
+import msgspec
+import orjson
 
-app = Flask(__name__)
+app = Quart(__name__)
 
 # Your Vercel API endpoint
 API_ENDPOINT = "https://investment-chatbot-1.vercel.app/api/portfolio/calculate"
 
+def ojsonify(obj):
+    """Serialize obj with orjson into a JSON response"""
+    return Response(orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY), mimetype='application/json')
+
+@app.before_serving
+async def create_client():
+    """Open one pooled HTTP/2 client shared by all tool calls"""
+    app.client = httpx.AsyncClient(
+        http2=True,
+        timeout=30,
+        headers={"Content-Type": "application/json"},
+        limits=httpx.Limits(max_keepalive_connections=32)
+    )
+
+@app.after_serving
+async def close_client():
+    """Close the shared HTTP client"""
+    await app.client.aclose()
+
 @app.route('/mcp/v1/initialize', methods=['POST'])
-def initialize():
+async def initialize():
     """MCP initialization"""
-    return jsonify({
+    return ojsonify({
         "protocolVersion": "2024-11-05",
         "capabilities": {
             "tools": {}
@@ -20,60 +43,79 @@ def initialize():
         }
     })
 
-@app.route('/mcp/v1/tools/list', methods=['POST'])
-def list_tools():
-    """List available tools"""
-    return jsonify({
-        "tools": [
-            {
-                "name": "calculate_portfolio_returns",
-                "description": (
-                    "Calculates historical total returns for a portfolio of ETFs with specified "
-                    "asset allocation over a given time period. Returns total return, annualized "
-                    "return, volatility, and Sharpe ratio. Use when users ask about portfolio "
-                    "performance or want to compare asset allocations. "
-                    "Available assets: SPY (S&P 500), AGG (US Bonds), VTI (Total US Stock), "
-                    "VXUS (International), BND (Bonds), GLD (Gold), VNQ (Real Estate)."
-                ),
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "assets": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                            "description": "Array of ETF tickers (e.g., ['SPY', 'AGG'])"
-                        },
-                        "weights": {
-                            "type": "array",
-                            "items": {"type": "number"},
-                            "description": "Weights in decimal format summing to 1.0 (e.g., [0.6, 0.4])"
-                        },
-                        "startDate": {
-                            "type": "string",
-                            "description": "Start date in YYYY-MM-DD format (e.g., '2020-01-01')"
-                        },
-                        "endDate": {
-                            "type": "string",
-                            "description": "End date in YYYY-MM-DD format (e.g., '2023-12-31')"
-                        }
+# Static tools list, serialized once at import since MCP clients poll it
+_TOOLS = {
+    "tools": [
+        {
+            "name": "calculate_portfolio_returns",
+            "description": (
+                "Calculates historical total returns for a portfolio of ETFs with specified "
+                "asset allocation over a given time period. Returns total return, annualized "
+                "return, volatility, and Sharpe ratio. Use when users ask about portfolio "
+                "performance or want to compare asset allocations. "
+                "Available assets: SPY (S&P 500), AGG (US Bonds), VTI (Total US Stock), "
+                "VXUS (International), BND (Bonds), GLD (Gold), VNQ (Real Estate)."
+            ),
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "assets": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Array of ETF tickers (e.g., ['SPY', 'AGG'])"
                     },
-                    "required": ["assets", "weights", "startDate", "endDate"]
-                }
+                    "weights": {
+                        "type": "array",
+                        "items": {"type": "number"},
+                        "description": "Weights in decimal format summing to 1.0 (e.g., [0.6, 0.4])"
+                    },
+                    "startDate": {
+                        "type": "string",
+                        "description": "Start date in YYYY-MM-DD format (e.g., '2020-01-01')"
+                    },
+                    "endDate": {
+                        "type": "string",
+                        "description": "End date in YYYY-MM-DD format (e.g., '2023-12-31')"
+                    }
+                },
+                "required": ["assets", "weights", "startDate", "endDate"]
             }
-        ]
-    })
+        }
+    ]
+}
+_TOOLS_BYTES = orjson.dumps(_TOOLS)
+_TOOLS_ETAG = '"' + hashlib.blake2b(_TOOLS_BYTES, digest_size=8).hexdigest() + '"'
+_TOOLS_HEADERS = {'ETag': _TOOLS_ETAG, 'Cache-Control': 'public, max-age=3600'}
+
+@app.route('/mcp/v1/tools/list', methods=['POST'])
+async def list_tools():
+    """List available tools"""
+    if request.headers.get('If-None-Match') == _TOOLS_ETAG:
+        return Response(b'', status=304, headers=_TOOLS_HEADERS)
+    return Response(_TOOLS_BYTES, mimetype='application/json', headers=_TOOLS_HEADERS)
+
+class CallToolArgs(msgspec.Struct):
+    """Arguments for calculate_portfolio_returns"""
+    assets: Annotated[List[str], msgspec.Meta(min_length=1)]
+    weights: Annotated[List[float], msgspec.Meta(min_length=1)]
+    startDate: Annotated[str, msgspec.Meta(min_length=1)]
+    endDate: Annotated[str, msgspec.Meta(min_length=1)]
+
+class CallToolReq(msgspec.Struct):
+    """Tool call envelope; arguments are decoded once the tool name is known"""
+    name: str
+    arguments: msgspec.Raw = msgspec.Raw(b'{}')
 
 @app.route('/mcp/v1/tools/call', methods=['POST'])
-def call_tool():
+async def call_tool():
     """Execute a tool"""
     
     try:
-        data = request.json
-        tool_name = data.get("name")
-        arguments = data.get("arguments", {})
+        req = msgspec.json.decode(await request.get_data(), type=CallToolReq)
+        tool_name = req.name
         
         if tool_name != "calculate_portfolio_returns":
-            return jsonify({
+            return ojsonify({
                 "isError": True,
                 "content": [
                     {
@@ -83,50 +125,46 @@ def call_tool():
                 ]
             }), 404
         
-        # Get parameters
-        assets = arguments.get("assets")
-        weights = arguments.get("weights")
-        start_date = arguments.get("startDate")
-        end_date = arguments.get("endDate")
-        
-        # Validate
-        if not all([assets, weights, start_date, end_date]):
-            return jsonify({
-                "content": [
-                    {
-                        "type": "text",
-                        "text": '{"success": false, "error": "Missing required parameters"}'
-                    }
-                ]
-            })
+        # Decode and validate parameters in one pass
+        arguments = msgspec.json.decode(req.arguments, type=CallToolArgs)
         
         # Call your Vercel API
-        response = requests.post(
+        response = await app.client.post(
             API_ENDPOINT,
             json={
-                "assets": assets,
-                "weights": weights,
-                "startDate": start_date,
-                "endDate": end_date
-            },
-            headers={"Content-Type": "application/json"},
-            timeout=30
+                "assets": arguments.assets,
+                "weights": arguments.weights,
+                "startDate": arguments.startDate,
+                "endDate": arguments.endDate
+            }
         )
         
         response.raise_for_status()
-        result = response.json()
+        result = orjson.loads(response.content)
         
-        return jsonify({
+        return ojsonify({
             "content": [
                 {
                     "type": "text",
-                    "text": str(result)
+                    "text": orjson.dumps(result).decode()
                 }
             ]
         })
         
+    except msgspec.DecodeError as e:
+        # DecodeError covers malformed JSON as well as its ValidationError subclass
+        return ojsonify({
+            "isError": True,
+            "content": [
+                {
+                    "type": "text",
+                    "text": orjson.dumps({"success": False, "error": f"Invalid parameters: {e}"}).decode()
+                }
+            ]
+        }), 400
+        
     except Exception as e:
-        return jsonify({
+        return ojsonify({
             "isError": True,
             "content": [
                 {
@@ -137,9 +175,9 @@ def call_tool():
         })
 
 @app.route('/health', methods=['GET'])
-def health():
+async def health():
     """Health check"""
-    return jsonify({"status": "ok"})
+    return ojsonify({"status": "ok"})
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=8000)
\ No newline at end of file
@@ -2,6 +2,7 @@
 from typing import List, Dict, Any
 from fastmcp import FastMCP
 import httpx
+import orjson
 
 mcp = FastMCP("portfolio-server")
 
@@ -20,7 +21,7 @@ async def calculatePortfolioReturns(
             headers={"Content-Type": "application/json"},
         )
         r.raise_for_status()
-        return r.json()
+        return orjson.loads(r.content)
 
 if __name__ == "__main__":
     # HTTP transport (works with Hosted → MCP Server in Agent Builder)
@@ -0,0 +1,11 @@
+-- Bulk upsert of monthly returns from parallel arrays, used by add_new_asset.py.
+-- One RPC call replaces many batched REST upserts.
+create or replace function add_returns(tickers text[], dates date[], returns double precision[])
+returns void
+language sql
+as $$
+    insert into asset_returns (asset_ticker, return_date, monthly_return)
+    select * from unnest(tickers, dates, returns)
+    on conflict (asset_ticker, return_date) do update
+        set monthly_return = excluded.monthly_return;
+$$;
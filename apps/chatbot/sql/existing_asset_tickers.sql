@@ -0,0 +1,9 @@
+-- Which of the given tickers already have rows in asset_returns, used by add_new_asset.py.
+-- Returns at most one row per ticker instead of every monthly row (which PostgREST would cap).
+create or replace function existing_asset_tickers(tickers text[])
+returns table (asset_ticker text)
+language sql
+stable
+as $$
+    select distinct r.asset_ticker from asset_returns r where r.asset_ticker = any(tickers);
+$$;
@@ -1,10 +1,19 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request
+from cachetools import TTLCache
+import orjson
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import atexit
 import os
 import logging
+from logging.handlers import QueueHandler, QueueListener
+import math
+import queue
+import re
 from datetime import datetime, timedelta
 from functools import wraps
+import threading
 import time
 from typing import Dict, List, Optional, Any
 import hashlib
@@ -14,6 +23,16 @@ import hmac
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Hand records to a background listener so request threads never block on stderr
+_log_queue = queue.SimpleQueue()
+_root_logger = logging.getLogger()
+_log_listener = QueueListener(_log_queue, *_root_logger.handlers, respect_handler_level=True)
+for _handler in _root_logger.handlers[:]:
+    _root_logger.removeHandler(_handler)
+_root_logger.addHandler(QueueHandler(_log_queue))
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
 app = Flask(__name__)
 
 # Configuration from environment variables
@@ -21,7 +40,24 @@ API_ENDPOINT = os.getenv('PORTFOLIO_API_ENDPOINT', 'https://fargason-capital-pla
 API_KEY = os.getenv('PORTFOLIO_API_KEY', '')  # Add API key for authentication
 RATE_LIMIT_REQUESTS = int(os.getenv('RATE_LIMIT_REQUESTS', '100'))  # requests per hour
 RATE_LIMIT_WINDOW = int(os.getenv('RATE_LIMIT_WINDOW', '3600'))  # 1 hour in seconds
-ALLOWED_ORIGINS = os.getenv('ALLOWED_ORIGINS', '*').split(',')
+ALLOWED_ORIGINS = frozenset(os.getenv('ALLOWED_ORIGINS', '*').split(','))
+
+# Fixed-length digest of the expected key, so comparisons never leak its length
+_EXPECTED_DIGEST = hashlib.sha256(API_KEY.encode()).digest() if API_KEY else None
+
+# CORS decisions and headers resolved once at import
+_CORS_ALLOW_ALL = '*' in ALLOWED_ORIGINS
+_CORS_HEADERS_ANY = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, X-API-Key',
+    'Access-Control-Max-Age': '86400'
+}
+_CORS_HEADERS_DENY = {
+    'Access-Control-Allow-Origin': 'null',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, X-API-Key'
+}
 
 # Server info
 SERVER_INFO = {
@@ -30,104 +66,277 @@ SERVER_INFO = {
     "description": "Enhanced MCP server for portfolio calculations with security and rate limiting"
 }
 
-# Rate limiting storage (in production, use Redis or similar)
-rate_limit_storage = {}
+# Outgoing headers for portfolio API calls
+_UPSTREAM_HEADERS = {
+    "Content-Type": "application/json",
+    "User-Agent": f"Portfolio-MCP-Server/{SERVER_INFO['version']}"
+}
 
-def format_user_friendly_error(technical_error: str, request_args: Dict[str, Any]) -> str:
-    """Converts technical error messages into user-friendly responses"""
-    assets = request_args.get('assets', [])
-    start_date = request_args.get('startDate', 'unknown')
-    end_date = request_args.get('endDate', 'unknown')
-    
+# Shared upstream session so tool calls reuse keep-alive connections
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=64,
+    # allowed_methods=None lets the status retries apply to POST; the calculation is side-effect free
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504], allowed_methods=None)
+))
+
+# Rate limiting storage (in production, use Redis or similar), bounded and expiring per window
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv('RATE_LIMIT_MAX_CLIENTS', '100000'))
+rate_limit_storage = TTLCache(maxsize=RATE_LIMIT_MAX_CLIENTS, ttl=RATE_LIMIT_WINDOW)
+rate_limit_lock = threading.Lock()
+
+# Successful upstream results (tool text) keyed by normalized calculation arguments
+_CALC_CACHE = TTLCache(maxsize=int(os.getenv('CALC_CACHE_SIZE', '512')), ttl=int(os.getenv('CALC_CACHE_TTL', '3600')))
+_CALC_CACHE_LOCK = threading.Lock()
+
+# Static MCP results, serialized once at import
+_INITIALIZE_RESULT = {
+    "protocolVersion": "2024-11-05",
+    "capabilities": {
+        "tools": {
+            "listChanged": True
+        },
+        "logging": {}
+    },
+    "serverInfo": SERVER_INFO
+}
+_INITIALIZE_RESULT_BYTES = orjson.dumps(_INITIALIZE_RESULT)
+
+_TOOLS_LIST_RESULT = {
+    "tools": [
+        {
+            "name": "calculate_portfolio_returns",
+            "description": (
+                "Calculates historical total returns for a portfolio of ETFs with specified "
+                "asset allocation over a given time period. Returns total return, annualized "
+                "return, volatility, and Sharpe ratio. Use when users ask about portfolio "
+                "performance or want to compare asset allocations. "
+                "Available assets: SPY (S&P 500), AGG (US Bonds), VTI (Total US Stock), "
+                "VXUS (International), BND (Bonds), GLD (Gold), VNQ (Real Estate), "
+                "QQQ (Nasdaq), EEM (Emerging Markets), TLT (Long Treasury), and more."
+            ),
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "assets": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Array of ETF tickers (e.g., ['SPY', 'AGG'])",
+                        "minItems": 1,
+                        "maxItems": 10
+                    },
+                    "weights": {
+                        "type": "array",
+                        "items": {"type": "number", "minimum": 0, "maximum": 1},
+                        "description": "Weights in decimal format summing to 1.0 (e.g., [0.6, 0.4])",
+                        "minItems": 1,
+                        "maxItems": 10
+                    },
+                    "startDate": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "Start date in YYYY-MM-DD format (e.g., '2020-01-01')"
+                    },
+                    "endDate": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "End date in YYYY-MM-DD format (e.g., '2023-12-31')"
+                    },
+                    "rebalanceMonths": {
+                        "type": "integer",
+                        "description": "Rebalancing frequency in months (-1 for never, 12 for annual)",
+                        "minimum": -1,
+                        "maximum": 12,
+                        "default": -1
+                    }
+                },
+                "required": ["assets", "weights", "startDate", "endDate"]
+            }
+        }
+    ]
+}
+_TOOLS_LIST_RESULT_BYTES = orjson.dumps(_TOOLS_LIST_RESULT)
+_REQUIRED_TOOL_ARGS = tuple(_TOOLS_LIST_RESULT["tools"][0]["inputSchema"]["required"])
+
+_TOOLS_HTTP_RESULT = {
+    "tools": [
+        {
+            "name": "calculate_portfolio_returns",
+            "description": "Calculates historical total returns for a portfolio of ETFs",
+            "version": SERVER_INFO["version"],
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "assets": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Array of ETF tickers"
+                    },
+                    "weights": {
+                        "type": "array",
+                        "items": {"type": "number"},
+                        "description": "Weights summing to 1.0"
+                    },
+                    "startDate": {
+                        "type": "string",
+                        "description": "Start date YYYY-MM-DD"
+                    },
+                    "endDate": {
+                        "type": "string",
+                        "description": "End date YYYY-MM-DD"
+                    }
+                },
+                "required": ["assets", "weights", "startDate", "endDate"]
+            }
+        }
+    ]
+}
+_TOOLS_HTTP_BYTES = orjson.dumps(_TOOLS_HTTP_RESULT)
+
+_HEALTH_TEMPLATE = orjson.dumps({
+    "status": "healthy",
+    "server": SERVER_INFO["name"],
+    "version": SERVER_INFO["version"],
+    "protocol": "MCP JSON-RPC 2.0",
+    "timestamp": None,
+    "uptime": "N/A",  # Would need to track start time
+    "rate_limit": {
+        "requests_per_hour": RATE_LIMIT_REQUESTS,
+        "window_seconds": RATE_LIMIT_WINDOW
+    },
+    "api_endpoint": API_ENDPOINT
+}).replace(b'%', b'%%').replace(b'"timestamp":null', b'"timestamp":%s')
+
+def _rpc_result_bytes(request_id: Any, result_bytes: bytes) -> bytes:
+    """Wrap a pre-serialized result in a JSON-RPC envelope"""
+    return b'{"jsonrpc":"2.0","id":%s,"result":%s}' % (orjson.dumps(request_id), result_bytes)
+
+def _err(request_id: Any, code: int, message: str) -> bytes:
+    """Serialize a JSON-RPC error envelope"""
+    return orjson.dumps({"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}})
+
+def _text_result(request_id: Any, text: str) -> bytes:
+    """Serialize a JSON-RPC tool result holding a single text content item"""
+    return _rpc_result_bytes(request_id, b'{"content":[{"type":"text","text":%s}]}' % orjson.dumps(text))
+
+def ojson(obj: Any, status: int = 200) -> Response:
+    """Serialize obj with orjson into a JSON response"""
+    return Response(orjson.dumps(obj), status=status, mimetype='application/json')
+
+# User-friendly error templates, checked in priority order by format_user_friendly_error
+_ERROR_TEMPLATES = {
     # No data found errors
-    if 'No data found' in technical_error or 'No overlapping data' in technical_error:
-        return (
-            f"I apologize, but I don't have complete historical data for the portfolio you requested. "
-            f"The assets you requested ({', '.join(assets)}) may not have overlapping data available "
-            f"for the date range {start_date} to {end_date}. "
-            f"\n\nWould you like to try:\n"
-            f"• A more recent date range (some ETFs have limited historical data)\n"
-            f"• Different assets that have longer histories\n"
-            f"• Checking which assets I have data for"
-        )
-    
+    'nodata': (
+        "I apologize, but I don't have complete historical data for the portfolio you requested. "
+        "The assets you requested ({assets}) may not have overlapping data available "
+        "for the date range {start_date} to {end_date}. "
+        "\n\nWould you like to try:\n"
+        "• A more recent date range (some ETFs have limited historical data)\n"
+        "• Different assets that have longer histories\n"
+        "• Checking which assets I have data for"
+    ),
     # Weight validation errors
-    if 'Weights must sum to' in technical_error:
-        return (
-            "I apologize, but there was an issue with the portfolio weights. The allocation percentages "
-            "need to add up to exactly 100%. Let me help you create a properly balanced portfolio. "
-            "What allocation would you like?"
-        )
-    
+    'weights': (
+        "I apologize, but there was an issue with the portfolio weights. The allocation percentages "
+        "need to add up to exactly 100%. Let me help you create a properly balanced portfolio. "
+        "What allocation would you like?"
+    ),
     # Missing data errors
-    if 'Missing required fields' in technical_error or 'Missing required parameters' in technical_error:
-        return (
-            "I apologize, but I'm missing some information needed to calculate the portfolio returns. "
-            "Could you please provide:\n"
-            "• The assets/ETFs you want to include\n"
-            "• The allocation percentage for each\n"
-            "• The date range you're interested in"
-        )
-    
+    'missing': (
+        "I apologize, but I'm missing some information needed to calculate the portfolio returns. "
+        "Could you please provide:\n"
+        "• The assets/ETFs you want to include\n"
+        "• The allocation percentage for each\n"
+        "• The date range you're interested in"
+    ),
     # Database/configuration errors
-    if 'database' in technical_error.lower() or 'configuration' in technical_error.lower():
-        return (
-            "I apologize, but I'm experiencing a technical issue accessing the market data. "
-            "This is a temporary problem on our end. Please try again in a few moments, "
-            "or feel free to ask me other investment questions in the meantime."
-        )
-    
+    'db': (
+        "I apologize, but I'm experiencing a technical issue accessing the market data. "
+        "This is a temporary problem on our end. Please try again in a few moments, "
+        "or feel free to ask me other investment questions in the meantime."
+    ),
     # Timeout errors
-    if 'timeout' in technical_error.lower():
-        return (
-            "I apologize, but the calculation is taking longer than expected. This can happen with "
-            "very long date ranges. Would you like to try with a shorter time period? "
-            "For example, analyzing 5-10 years of data instead of 20+ years often works better."
-        )
-    
+    'timeout': (
+        "I apologize, but the calculation is taking longer than expected. This can happen with "
+        "very long date ranges. Would you like to try with a shorter time period? "
+        "For example, analyzing 5-10 years of data instead of 20+ years often works better."
+    ),
     # Asset validation errors
-    if 'asset' in technical_error.lower() or 'ticker' in technical_error.lower():
-        return (
-            "I apologize, but I may not have data for one or more of the assets you requested. "
-            "I have historical data for many popular ETFs like SPY, VTI, AGG, GLD, and others. "
-            "Would you like me to list the available assets, or would you like to try with different ETFs?"
-        )
-    
+    'asset': (
+        "I apologize, but I may not have data for one or more of the assets you requested. "
+        "I have historical data for many popular ETFs like SPY, VTI, AGG, GLD, and others. "
+        "Would you like me to list the available assets, or would you like to try with different ETFs?"
+    ),
     # Default fallback
-    return (
-        f"I apologize, but I encountered an issue while calculating the portfolio returns. "
-        f"The technical details are: \"{technical_error}\". "
-        f"\n\nWould you like to try again with different parameters, or can I help you with something else?"
+    'default': (
+        "I apologize, but I encountered an issue while calculating the portfolio returns. "
+        "The technical details are: \"{technical_error}\". "
+        "\n\nWould you like to try again with different parameters, or can I help you with something else?"
     )
+}
+
+_ERROR_RULES = (
+    (re.compile(r'No data found|No overlapping data'), 'nodata'),
+    (re.compile(r'Weights must sum to'), 'weights'),
+    (re.compile(r'Missing required (?:fields|parameters)'), 'missing'),
+    (re.compile(r'database|configuration', re.IGNORECASE), 'db'),
+    (re.compile(r'timeout', re.IGNORECASE), 'timeout'),
+    (re.compile(r'asset|ticker', re.IGNORECASE), 'asset')
+)
+
+def format_user_friendly_error(technical_error: str, request_args: Dict[str, Any]) -> str:
+    """Converts technical error messages into user-friendly responses"""
+    key = next((key for pattern, key in _ERROR_RULES if pattern.search(technical_error)), 'default')
+    
+    if key == 'nodata':
+        return _ERROR_TEMPLATES[key].format(
+            assets=', '.join(request_args.get('assets', [])),
+            start_date=request_args.get('startDate', 'unknown'),
+            end_date=request_args.get('endDate', 'unknown')
+        )
+    if key == 'default':
+        return _ERROR_TEMPLATES[key].format(technical_error=technical_error)
+    return _ERROR_TEMPLATES[key]
 
 def validate_api_key(api_key: str) -> bool:
     """Validate API key"""
-    if not API_KEY:
+    if _EXPECTED_DIGEST is None:
         return True  # No API key required if not set
     
-    return hmac.compare_digest(api_key, API_KEY)
+    provided = hashlib.sha256(api_key.encode()).digest()
+    return hmac.compare_digest(provided, _EXPECTED_DIGEST)
 
 def rate_limit_exceeded(client_ip: str) -> bool:
     """Check if client has exceeded rate limit"""
-    now = time.time()
-    window_start = now - RATE_LIMIT_WINDOW
+    # Fixed-window counter: one [window_index, count] pair per client
+    window = int(time.time() // RATE_LIMIT_WINDOW)
     
-    # Clean old entries
-    if client_ip in rate_limit_storage:
-        rate_limit_storage[client_ip] = [
-            req_time for req_time in rate_limit_storage[client_ip] 
-            if req_time > window_start
-        ]
-    else:
-        rate_limit_storage[client_ip] = []
-    
-    # Check if limit exceeded
-    if len(rate_limit_storage[client_ip]) >= RATE_LIMIT_REQUESTS:
-        return True
-    
-    # Add current request
-    rate_limit_storage[client_ip].append(now)
-    return False
+    with rate_limit_lock:
+        entry = rate_limit_storage.get(client_ip)
+        
+        # Start a new count when the window rolls over
+        if entry is None or entry[0] != window:
+            rate_limit_storage[client_ip] = [window, 1]
+            return False
+        
+        # Check if limit exceeded
+        if entry[1] >= RATE_LIMIT_REQUESTS:
+            return True
+        
+        # Add current request
+        entry[1] += 1
+        return False
+
+def _calc_cache_key(assets: List[str], weights: List[float], arguments: Dict[str, Any]) -> bytes:
+    """Build a hashable cache key from the calculation arguments"""
+    return orjson.dumps([
+        assets,
+        [round(w, 6) for w in weights],
+        arguments.get("startDate"),
+        arguments.get("endDate"),
+        arguments.get("rebalanceMonths", -1)
+    ])
 
 def require_auth(f):
     """Decorator to require API key authentication"""
@@ -136,15 +345,9 @@ def require_auth(f):
         api_key = request.headers.get('X-API-Key', '')
         
         if not validate_api_key(api_key):
-            logger.warning(f"Invalid API key from {request.remote_addr}")
-            return jsonify({
-                "jsonrpc": "2.0",
-                "id": request.json.get("id") if request.json else None,
-                "error": {
-                    "code": -32001,
-                    "message": "Invalid API key"
-                }
-            }), 401
+            logger.warning("Invalid API key from %s", request.remote_addr)
+            # Rejected before JSON-RPC parsing, so there is no id to echo
+            return Response(_err(None, -32001, "Invalid API key"), status=401, mimetype='application/json')
         
         return f(*args, **kwargs)
     return decorated_function
@@ -156,15 +359,9 @@ def check_rate_limit(f):
         client_ip = request.remote_addr
         
         if rate_limit_exceeded(client_ip):
-            logger.warning(f"Rate limit exceeded for {client_ip}")
-            return jsonify({
-                "jsonrpc": "2.0",
-                "id": request.json.get("id") if request.json else None,
-                "error": {
-                    "code": -32002,
-                    "message": f"Rate limit exceeded. Maximum {RATE_LIMIT_REQUESTS} requests per hour."
-                }
-            }), 429
+            logger.warning("Rate limit exceeded for %s", client_ip)
+            # Rejected before JSON-RPC parsing, so there is no id to echo
+            return Response(_err(None, -32002, f"Rate limit exceeded. Maximum {RATE_LIMIT_REQUESTS} requests per hour."), status=429, mimetype='application/json')
         
         return f(*args, **kwargs)
     return decorated_function
@@ -187,28 +384,168 @@ def validate_request_data(data: Dict) -> Optional[Dict]:
 
 def log_request(method: str, params: Dict, client_ip: str, duration: float):
     """Log request details"""
-    logger.info(f"MCP Request: {method} from {client_ip} ({duration:.3f}s)")
+    logger.info("MCP Request: %s from %s (%.3fs)", method, client_ip, duration)
     if method == "tools/call":
         tool_name = params.get("name", "unknown")
-        logger.info(f"  Tool: {tool_name}")
+        logger.info("  Tool: %s", tool_name)
 
 def handle_cors():
     """Handle CORS headers"""
     origin = request.headers.get('Origin', '')
     
-    if ALLOWED_ORIGINS == ['*'] or origin in ALLOWED_ORIGINS:
-        return {
-            'Access-Control-Allow-Origin': origin if origin else '*',
-            'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type, X-API-Key',
-            'Access-Control-Max-Age': '86400'
+    if not (_CORS_ALLOW_ALL or origin in ALLOWED_ORIGINS):
+        return _CORS_HEADERS_DENY
+    if not origin:
+        return _CORS_HEADERS_ANY
+    
+    # Echo the caller's origin; only this header varies per request
+    return {**_CORS_HEADERS_ANY, 'Access-Control-Allow-Origin': origin}
+
+def _handle_initialize(request_id: Any, params: Dict[str, Any]):
+    """initialize: report server capabilities"""
+    return _rpc_result_bytes(request_id, _INITIALIZE_RESULT_BYTES)
+
+def _handle_tools_list(request_id: Any, params: Dict[str, Any]):
+    """tools/list: return the static tool schema"""
+    return _rpc_result_bytes(request_id, _TOOLS_LIST_RESULT_BYTES)
+
+def _handle_tools_call(request_id: Any, params: Dict[str, Any]):
+    """tools/call: validate arguments and run the portfolio calculation"""
+    tool_name = params.get("name")
+    arguments = params.get("arguments", {})
+    
+    if tool_name != "calculate_portfolio_returns":
+        return _err(request_id, -32601, f"Unknown tool: {tool_name}")
+    
+    # Validate tool arguments
+    missing_args = [arg for arg in _REQUIRED_TOOL_ARGS if arg not in arguments]
+    
+    if missing_args:
+        return _err(request_id, -32602, f"Missing required parameters: {', '.join(missing_args)}")
+    
+    # Validate asset and weight arrays
+    assets = arguments.get("assets", [])
+    weights = arguments.get("weights", [])
+    
+    # Reject non-numeric weights up front (bool is an int subclass) and sum them once
+    numeric = isinstance(weights, list) and all(
+        isinstance(w, (int, float)) and not isinstance(w, bool) and math.isfinite(w)
+        for w in weights
+    )
+    total = math.fsum(weights) if numeric else None
+    
+    if len(assets) != len(weights):
+        return _err(request_id, -32602, "Assets and weights arrays must have the same length")
+    if not numeric:
+        return _err(request_id, -32602, "Weights must be finite numbers")
+    if abs(total - 1.0) > 0.01:
+        return _err(request_id, -32602, f"Weights must sum to 1.0 (currently {total:.3f})")
+    
+    # Identical historical queries are deterministic, serve them from cache
+    cache_key = _calc_cache_key(assets, weights, arguments)
+    with _CALC_CACHE_LOCK:
+        cached_text = _CALC_CACHE.get(cache_key)
+    
+    if cached_text is not None:
+        return _text_result(request_id, cached_text)
+    
+    # Call the portfolio calculator API
+    try:
+        api_response = SESSION.post(
+            API_ENDPOINT,
+            json={
+                "assets": assets,
+                "weights": weights,
+                "startDate": arguments.get("startDate"),
+                "endDate": arguments.get("endDate"),
+                "rebalanceMonths": arguments.get("rebalanceMonths", -1),
+                "generateCSV": False  # Disable CSV for MCP calls
+            },
+            headers=_UPSTREAM_HEADERS,
+            timeout=30
+        )
+        
+        # Parse response regardless of status code
+        raw = api_response.content
+        try:
+            result = orjson.loads(raw)
+        except ValueError:
+            # If JSON parsing fails, return graceful error message
+            logger.error("Failed to parse API response from %s", API_ENDPOINT)
+            error_result = {
+                "success": False,
+                "error": "I apologize, but I encountered a technical error while trying to calculate the portfolio returns. The server returned an invalid response. Please try again, or try with a different date range or asset combination."
+            }
+            return _text_result(request_id, orjson.dumps(error_result).decode())
+        
+        # Check if API returned an error in response body
+        if result.get("success") == False:
+            logger.warning("Portfolio calculation returned error: %s", result.get('error'))
+            
+            # Format user-friendly error message
+            user_friendly_error = format_user_friendly_error(
+                result.get('error', 'Unknown error'),
+                arguments
+            )
+            
+            # Return error as successful MCP response (so chatbot doesn't break)
+            error_result = {
+                "success": False,
+                "error": user_friendly_error,
+                "originalError": result.get('error')
+            }
+            return _text_result(request_id, orjson.dumps(error_result).decode())
+        
+        if result.get('userMessage'):
+            # Success with fallbacks - make the userMessage prominent
+            formatted_result = result.copy()
+            formatted_result['_note'] = result['userMessage']
+            logger.info("Portfolio calculation used fallbacks: %s", result.get('userMessage'))
+            text = orjson.dumps(formatted_result).decode()
+        else:
+            # Success case - upstream body is already JSON text, pass it through as-is
+            text = raw.decode()
+        
+        # Only cache confirmed successes; an error body on a 5xx must not outlive the outage
+        if api_response.ok and result.get("success") is True:
+            with _CALC_CACHE_LOCK:
+                _CALC_CACHE[cache_key] = text
+        return _text_result(request_id, text)
+    
+    except requests.exceptions.Timeout:
+        logger.error("API request timeout to %s", API_ENDPOINT)
+        user_friendly_error = format_user_friendly_error("Request timeout", arguments)
+        error_result = {
+            "success": False,
+            "error": user_friendly_error
         }
-    else:
-        return {
-            'Access-Control-Allow-Origin': 'null',
-            'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type, X-API-Key'
+    
+    except requests.exceptions.RequestException as e:
+        logger.error("API request failed: %s", e)
+        user_friendly_error = "I apologize, but I'm having trouble connecting to the portfolio calculator right now. This might be a temporary network issue. Please try again in a moment."
+        error_result = {
+            "success": False,
+            "error": user_friendly_error,
+            "technicalDetails": str(e)
+        }
+    
+    except Exception as e:
+        logger.error("Unexpected error in tool call: %s", e)
+        user_friendly_error = "I apologize, but I'm having trouble processing your request right now. This might be a temporary issue. Please try again in a moment."
+        error_result = {
+            "success": False,
+            "error": user_friendly_error,
+            "technicalDetails": str(e)
         }
+    
+    return _text_result(request_id, orjson.dumps(error_result).decode())
+
+# JSON-RPC method dispatch table
+_METHODS = {
+    "initialize": _handle_initialize,
+    "tools/list": _handle_tools_list,
+    "tools/call": _handle_tools_call
+}
 
 @app.route('/', methods=['POST'])
 @require_auth
@@ -217,395 +554,69 @@ def handle_mcp_request():
     """Handle MCP JSON-RPC requests with enhanced security and logging"""
     start_time = time.time()
     client_ip = request.remote_addr
+    data = None
     
     try:
-        data = request.json
+        data = request.get_json(silent=True, cache=True)
         validation_error = validate_request_data(data)
         
         if validation_error:
-            return jsonify({
-                "jsonrpc": "2.0",
-                "id": data.get("id") if data else None,
-                "error": validation_error
-            }), 400
+            request_id = data.get("id") if isinstance(data, dict) else None
+            body = _err(request_id, validation_error["code"], validation_error["message"])
+            return Response(body, status=400, mimetype='application/json')
         
         method = data.get("method")
         request_id = data.get("id")
         params = data.get("params", {})
         
-        # Handle different MCP methods
-        if method == "initialize":
-            response = {
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "result": {
-                    "protocolVersion": "2024-11-05",
-                    "capabilities": {
-                        "tools": {
-                            "listChanged": True
-                        },
-                        "logging": {}
-                    },
-                    "serverInfo": SERVER_INFO
-                }
-            }
-            
-        elif method == "tools/list":
-            response = {
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "result": {
-                    "tools": [
-                        {
-                            "name": "calculate_portfolio_returns",
-                            "description": (
-                                "Calculates historical total returns for a portfolio of ETFs with specified "
-                                "asset allocation over a given time period. Returns total return, annualized "
-                                "return, volatility, and Sharpe ratio. Use when users ask about portfolio "
-                                "performance or want to compare asset allocations. "
-                                "Available assets: SPY (S&P 500), AGG (US Bonds), VTI (Total US Stock), "
-                                "VXUS (International), BND (Bonds), GLD (Gold), VNQ (Real Estate), "
-                                "QQQ (Nasdaq), EEM (Emerging Markets), TLT (Long Treasury), and more."
-                            ),
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {
-                                    "assets": {
-                                        "type": "array",
-                                        "items": {"type": "string"},
-                                        "description": "Array of ETF tickers (e.g., ['SPY', 'AGG'])",
-                                        "minItems": 1,
-                                        "maxItems": 10
-                                    },
-                                    "weights": {
-                                        "type": "array",
-                                        "items": {"type": "number", "minimum": 0, "maximum": 1},
-                                        "description": "Weights in decimal format summing to 1.0 (e.g., [0.6, 0.4])",
-                                        "minItems": 1,
-                                        "maxItems": 10
-                                    },
-                                    "startDate": {
-                                        "type": "string",
-                                        "format": "date",
-                                        "description": "Start date in YYYY-MM-DD format (e.g., '2020-01-01')"
-                                    },
-                                    "endDate": {
-                                        "type": "string",
-                                        "format": "date",
-                                        "description": "End date in YYYY-MM-DD format (e.g., '2023-12-31')"
-                                    },
-                                    "rebalanceMonths": {
-                                        "type": "integer",
-                                        "description": "Rebalancing frequency in months (-1 for never, 12 for annual)",
-                                        "minimum": -1,
-                                        "maximum": 12,
-                                        "default": -1
-                                    }
-                                },
-                                "required": ["assets", "weights", "startDate", "endDate"]
-                            }
-                        }
-                    ]
-                }
-            }
-            
-        elif method == "tools/call":
-            tool_name = params.get("name")
-            arguments = params.get("arguments", {})
-            
-            if tool_name != "calculate_portfolio_returns":
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "error": {
-                        "code": -32601,
-                        "message": f"Unknown tool: {tool_name}"
-                    }
-                }
-            else:
-                # Validate tool arguments
-                required_args = ["assets", "weights", "startDate", "endDate"]
-                missing_args = [arg for arg in required_args if arg not in arguments]
-                
-                if missing_args:
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": request_id,
-                        "error": {
-                            "code": -32602,
-                            "message": f"Missing required parameters: {', '.join(missing_args)}"
-                        }
-                    }
-                else:
-                    # Validate asset and weight arrays
-                    assets = arguments.get("assets", [])
-                    weights = arguments.get("weights", [])
-                    
-                    if len(assets) != len(weights):
-                        response = {
-                            "jsonrpc": "2.0",
-                            "id": request_id,
-                            "error": {
-                                "code": -32602,
-                                "message": "Assets and weights arrays must have the same length"
-                            }
-                        }
-                    elif abs(sum(weights) - 1.0) > 0.01:
-                        response = {
-                            "jsonrpc": "2.0",
-                            "id": request_id,
-                            "error": {
-                                "code": -32602,
-                                "message": f"Weights must sum to 1.0 (currently {sum(weights):.3f})"
-                            }
-                        }
-                    else:
-                        # Call the portfolio calculator API
-                        try:
-                            api_response = requests.post(
-                                API_ENDPOINT,
-                                json={
-                                    "assets": assets,
-                                    "weights": weights,
-                                    "startDate": arguments.get("startDate"),
-                                    "endDate": arguments.get("endDate"),
-                                    "rebalanceMonths": arguments.get("rebalanceMonths", -1),
-                                    "generateCSV": False  # Disable CSV for MCP calls
-                                },
-                                headers={
-                                    "Content-Type": "application/json",
-                                    "User-Agent": f"Portfolio-MCP-Server/{SERVER_INFO['version']}"
-                                },
-                                timeout=30
-                            )
-                            
-                            # Parse response regardless of status code
-                            try:
-                                result = api_response.json()
-                            except ValueError:
-                                # If JSON parsing fails, return graceful error message
-                                error_result = {
-                                    "success": False,
-                                    "error": "I apologize, but I encountered a technical error while trying to calculate the portfolio returns. The server returned an invalid response. Please try again, or try with a different date range or asset combination."
-                                }
-                                response = {
-                                    "jsonrpc": "2.0",
-                                    "id": request_id,
-                                    "result": {
-                                        "content": [
-                                            {
-                                                "type": "text",
-                                                "text": json.dumps(error_result, indent=2)
-                                            }
-                                        ]
-                                    }
-                                }
-                                logger.error(f"Failed to parse API response from {API_ENDPOINT}")
-                            else:
-                                # Check if API returned an error in response body
-                                if result.get("success") == False:
-                                    # Format user-friendly error message
-                                    user_friendly_error = format_user_friendly_error(
-                                        result.get('error', 'Unknown error'),
-                                        arguments
-                                    )
-                                    
-                                    # Return error as successful MCP response (so chatbot doesn't break)
-                                    error_result = {
-                                        "success": False,
-                                        "error": user_friendly_error,
-                                        "originalError": result.get('error')
-                                    }
-                                    response = {
-                                        "jsonrpc": "2.0",
-                                        "id": request_id,
-                                        "result": {
-                                            "content": [
-                                                {
-                                                    "type": "text",
-                                                    "text": json.dumps(error_result, indent=2)
-                                                }
-                                            ]
-                                        }
-                                    }
-                                    logger.warning(f"Portfolio calculation returned error: {result.get('error')}")
-                                else:
-                                    # Success case - include fallback message if present
-                                    formatted_result = result.copy()
-                                    
-                                    # If there's a userMessage (fallback info), make it prominent
-                                    if result.get('userMessage'):
-                                        formatted_result['_note'] = result['userMessage']
-                                        logger.info(f"Portfolio calculation used fallbacks: {result.get('userMessage')}")
-                                    
-                                    response = {
-                                        "jsonrpc": "2.0",
-                                        "id": request_id,
-                                        "result": {
-                                            "content": [
-                                                {
-                                                    "type": "text",
-                                                    "text": json.dumps(formatted_result, indent=2)
-                                                }
-                                            ]
-                                        }
-                                    }
-                                
-                        except requests.exceptions.Timeout:
-                            user_friendly_error = format_user_friendly_error("Request timeout", arguments)
-                            error_result = {
-                                "success": False,
-                                "error": user_friendly_error
-                            }
-                            response = {
-                                "jsonrpc": "2.0",
-                                "id": request_id,
-                                "result": {
-                                    "content": [
-                                        {
-                                            "type": "text",
-                                            "text": json.dumps(error_result, indent=2)
-                                        }
-                                    ]
-                                }
-                            }
-                            logger.error(f"API request timeout to {API_ENDPOINT}")
-                            
-                        except requests.exceptions.RequestException as e:
-                            user_friendly_error = "I apologize, but I'm having trouble connecting to the portfolio calculator right now. This might be a temporary network issue. Please try again in a moment."
-                            error_result = {
-                                "success": False,
-                                "error": user_friendly_error,
-                                "technicalDetails": str(e)
-                            }
-                            response = {
-                                "jsonrpc": "2.0",
-                                "id": request_id,
-                                "result": {
-                                    "content": [
-                                        {
-                                            "type": "text",
-                                            "text": json.dumps(error_result, indent=2)
-                                        }
-                                    ]
-                                }
-                            }
-                            logger.error(f"API request failed: {e}")
-                            
-                        except Exception as e:
-                            user_friendly_error = "I apologize, but I'm having trouble processing your request right now. This might be a temporary issue. Please try again in a moment."
-                            error_result = {
-                                "success": False,
-                                "error": user_friendly_error,
-                                "technicalDetails": str(e)
-                            }
-                            response = {
-                                "jsonrpc": "2.0",
-                                "id": request_id,
-                                "result": {
-                                    "content": [
-                                        {
-                                            "type": "text",
-                                            "text": json.dumps(error_result, indent=2)
-                                        }
-                                    ]
-                                }
-                            }
-                            logger.error(f"Unexpected error in tool call: {e}")
+        # Dispatch to the handler for this MCP method
+        handler = _METHODS.get(method)
+        if handler:
+            response = handler(request_id, params)
         else:
-            response = {
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "error": {
-                    "code": -32601,
-                    "message": f"Method not found: {method}"
-                }
-            }
+            response = _err(request_id, -32601, f"Method not found: {method}")
         
         # Log request
         duration = time.time() - start_time
         log_request(method, params, client_ip, duration)
         
-        return jsonify(response), 200
-        
+        return Response(response, mimetype='application/json'), 200
+    
     except Exception as e:
         duration = time.time() - start_time
-        logger.error(f"Unexpected error in MCP handler: {e} (after {duration:.3f}s)")
+        logger.error("Unexpected error in MCP handler: %s (after %.3fs)", e, duration)
         
-        return jsonify({
-            "jsonrpc": "2.0",
-            "id": request.json.get("id") if request.json else None,
-            "error": {
-                "code": -32603,
-                "message": f"Internal server error: {str(e)}"
-            }
-        }), 500
+        request_id = data.get("id") if isinstance(data, dict) else None
+        body = _err(request_id, -32603, f"Internal server error: {str(e)}")
+        return Response(body, status=500, mimetype='application/json')
 
 @app.route('/tools', methods=['GET'])
 def list_tools_http():
     """HTTP GET endpoint for tools list"""
-    return jsonify({
-        "tools": [
-            {
-                "name": "calculate_portfolio_returns",
-                "description": "Calculates historical total returns for a portfolio of ETFs",
-                "version": SERVER_INFO["version"],
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "assets": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                            "description": "Array of ETF tickers"
-                        },
-                        "weights": {
-                            "type": "array",
-                            "items": {"type": "number"},
-                            "description": "Weights summing to 1.0"
-                        },
-                        "startDate": {
-                            "type": "string",
-                            "description": "Start date YYYY-MM-DD"
-                        },
-                        "endDate": {
-                            "type": "string",
-                            "description": "End date YYYY-MM-DD"
-                        }
-                    },
-                    "required": ["assets", "weights", "startDate", "endDate"]
-                }
-            }
-        ]
-    })
+    return Response(_TOOLS_HTTP_BYTES, mimetype='application/json')
 
 @app.route('/health', methods=['GET'])
 @app.route('/status', methods=['GET'])
 def health():
     """Health check endpoint with detailed status"""
-    return jsonify({
-        "status": "healthy",
-        "server": SERVER_INFO["name"],
-        "version": SERVER_INFO["version"],
-        "protocol": "MCP JSON-RPC 2.0",
-        "timestamp": datetime.now().isoformat(),
-        "uptime": "N/A",  # Would need to track start time
-        "rate_limit": {
-            "requests_per_hour": RATE_LIMIT_REQUESTS,
-            "window_seconds": RATE_LIMIT_WINDOW
-        },
-        "api_endpoint": API_ENDPOINT
-    })
+    # Only the timestamp changes between calls
+    body = _HEALTH_TEMPLATE % orjson.dumps(datetime.now().isoformat())
+    return Response(body, mimetype='application/json')
 
 @app.route('/metrics', methods=['GET'])
 def metrics():
     """Basic metrics endpoint"""
-    total_requests = sum(len(requests) for requests in rate_limit_storage.values())
-    unique_clients = len(rate_limit_storage)
+    window = int(time.time() // RATE_LIMIT_WINDOW)
+    with rate_limit_lock:
+        current = [entry[1] for entry in rate_limit_storage.values() if entry[0] == window]
+        storage_size = len(rate_limit_storage)
+    total_requests = sum(current)
+    unique_clients = len(current)
     
-    return jsonify({
+    return ojson({
         "total_requests_last_hour": total_requests,
         "unique_clients_last_hour": unique_clients,
-        "rate_limit_storage_size": len(rate_limit_storage),
+        "rate_limit_storage_size": storage_size,
         "timestamp": datetime.now().isoformat()
     })
 
@@ -625,9 +636,9 @@ if __name__ == '__main__':
     port = int(os.getenv('PORT', 8000))
     host = os.getenv('HOST', '0.0.0.0')
     
-    logger.info(f"Starting {SERVER_INFO['name']} v{SERVER_INFO['version']}")
-    logger.info(f"Debug mode: {debug_mode}")
-    logger.info(f"Rate limit: {RATE_LIMIT_REQUESTS} requests per {RATE_LIMIT_WINDOW} seconds")
-    logger.info(f"API endpoint: {API_ENDPOINT}")
+    logger.info("Starting %s v%s", SERVER_INFO['name'], SERVER_INFO['version'])
+    logger.info("Debug mode: %s", debug_mode)
+    logger.info("Rate limit: %s requests per %s seconds", RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW)
+    logger.info("API endpoint: %s", API_ENDPOINT)
     
     app.run(host=host, port=port, debug=debug_mode)
\ No newline at end of file
@@ -4,10 +4,19 @@ Simple MCP Server for Portfolio Calculator
 This is a clean, minimal implementation that just works.
 """
 
-from flask import Flask, request, jsonify
+# Patch sockets before requests/urllib3 are imported so upstream calls yield to other greenlets
+from gevent import monkey
+monkey.patch_all()
+
+from flask import Flask, Response, request
+from cachetools import TTLCache
+import hashlib
+import orjson
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
+import threading
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -18,6 +27,86 @@ app = Flask(__name__)
 # The correct API endpoint
 PORTFOLIO_API_URL = "https://fargason-capital-platform-ttgo.vercel.app/api/portfolio/calculate"
 
+# Shared session so tool calls reuse warm keep-alive connections to the API
+SESSION = requests.Session()
+SESSION.headers.update({"Connection": "keep-alive", "Content-Type": "application/json"})
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=50,
+    # allowed_methods=None lets the status retries apply to POST; the calculation is side-effect free
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504], allowed_methods=None)
+))
+
+# (connect, read) timeouts so a stalled handshake fails fast
+API_TIMEOUT = (3, 30)
+
+# Historical calculations are deterministic, so recent results are served from memory
+RESULT_CACHE = TTLCache(maxsize=2048, ttl=3600)
+RESULT_CACHE_LOCK = threading.Lock()
+
+def _cache_key(arguments):
+    """SHA-1 of the canonical arguments, so asset order does not matter"""
+    assets = arguments.get("assets") or []
+    weights = arguments.get("weights") or []
+    pairs = sorted(zip(assets, weights), key=repr)
+    # zip() drops unmatched items, so the lengths keep mismatched lists from sharing a valid call's key
+    canonical = orjson.dumps([pairs, len(assets), len(weights), arguments.get("startDate"), arguments.get("endDate")])
+    return hashlib.sha1(canonical).hexdigest()
+
+# Static MCP results, serialized once at import
+INITIALIZE_RESULT_BYTES = orjson.dumps({
+    "protocolVersion": "2024-11-05",
+    "capabilities": {
+        "tools": {"listChanged": True},
+        "logging": {}
+    },
+    "serverInfo": {
+        "name": "simple-portfolio-mcp",
+        "version": "1.0.0"
+    }
+})
+
+TOOLS_LIST_RESULT_BYTES = orjson.dumps({
+    "tools": [
+        {
+            "name": "calculate_portfolio_returns",
+            "description": "Calculate historical portfolio returns for ETFs",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "assets": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Array of ETF tickers"
+                    },
+                    "weights": {
+                        "type": "array",
+                        "items": {"type": "number"},
+                        "description": "Weights summing to 1.0"
+                    },
+                    "startDate": {
+                        "type": "string",
+                        "description": "Start date YYYY-MM-DD"
+                    },
+                    "endDate": {
+                        "type": "string",
+                        "description": "End date YYYY-MM-DD"
+                    }
+                },
+                "required": ["assets", "weights", "startDate", "endDate"]
+            }
+        }
+    ]
+})
+
+def _rpc_result_bytes(request_id, result_bytes):
+    """Wrap a pre-serialized result in a JSON-RPC envelope"""
+    return b'{"jsonrpc":"2.0","id":%s,"result":%s}' % (orjson.dumps(request_id), result_bytes)
+
+def ojson(obj, status=200):
+    """Serialize obj with orjson into a JSON response"""
+    return Response(orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS), status=status, mimetype='application/json')
+
 def handle_cors():
     """Handle CORS headers"""
     return {
@@ -30,15 +119,20 @@ def handle_cors():
 @app.route('/', methods=['POST'])
 def handle_mcp_request():
     """Handle MCP JSON-RPC requests"""
+    data = None
+    
     try:
-        data = request.json
+        try:
+            data = orjson.loads(request.get_data())
+        except orjson.JSONDecodeError:
+            data = None
         
-        if not data:
-            return jsonify({
+        if not isinstance(data, dict) or not data:
+            return ojson({
                 "jsonrpc": "2.0",
                 "id": None,
                 "error": {"code": -32700, "message": "Parse error"}
-            }), 400
+            }, 400)
         
         method = data.get("method")
         request_id = data.get("id")
@@ -48,59 +142,10 @@ def handle_mcp_request():
         
         # Handle MCP methods
         if method == "initialize":
-            response = {
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "result": {
-                    "protocolVersion": "2024-11-05",
-                    "capabilities": {
-                        "tools": {"listChanged": True},
-                        "logging": {}
-                    },
-                    "serverInfo": {
-                        "name": "simple-portfolio-mcp",
-                        "version": "1.0.0"
-                    }
-                }
-            }
+            response = _rpc_result_bytes(request_id, INITIALIZE_RESULT_BYTES)
             
         elif method == "tools/list":
-            response = {
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "result": {
-                    "tools": [
-                        {
-                            "name": "calculate_portfolio_returns",
-                            "description": "Calculate historical portfolio returns for ETFs",
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {
-                                    "assets": {
-                                        "type": "array",
-                                        "items": {"type": "string"},
-                                        "description": "Array of ETF tickers"
-                                    },
-                                    "weights": {
-                                        "type": "array",
-                                        "items": {"type": "number"},
-                                        "description": "Weights summing to 1.0"
-                                    },
-                                    "startDate": {
-                                        "type": "string",
-                                        "description": "Start date YYYY-MM-DD"
-                                    },
-                                    "endDate": {
-                                        "type": "string",
-                                        "description": "End date YYYY-MM-DD"
-                                    }
-                                },
-                                "required": ["assets", "weights", "startDate", "endDate"]
-                            }
-                        }
-                    ]
-                }
-            }
+            response = _rpc_result_bytes(request_id, TOOLS_LIST_RESULT_BYTES)
             
         elif method == "tools/call":
             tool_name = params.get("name")
@@ -116,26 +161,14 @@ def handle_mcp_request():
                     }
                 }
             else:
-                # Call the portfolio API
                 try:
-                    logger.info(f"Calling portfolio API with: {arguments}")
+                    # Serve repeat calculations from cache
+                    key = _cache_key(arguments)
+                    with RESULT_CACHE_LOCK:
+                        cached_text = RESULT_CACHE.get(key)
                     
-                    api_response = requests.post(
-                        PORTFOLIO_API_URL,
-                        json={
-                            "assets": arguments.get("assets"),
-                            "weights": arguments.get("weights"),
-                            "startDate": arguments.get("startDate"),
-                            "endDate": arguments.get("endDate")
-                        },
-                        headers={"Content-Type": "application/json"},
-                        timeout=30
-                    )
-                    
-                    logger.info(f"API Response Status: {api_response.status_code}")
-                    
-                    if api_response.status_code == 200:
-                        result = api_response.json()
+                    if cached_text is not None:
+                        logger.info("Serving cached portfolio result")
                         response = {
                             "jsonrpc": "2.0",
                             "id": request_id,
@@ -143,21 +176,57 @@ def handle_mcp_request():
                                 "content": [
                                     {
                                         "type": "text",
-                                        "text": json.dumps(result, indent=2)
+                                        "text": cached_text
                                     }
                                 ]
                             }
                         }
                     else:
-                        logger.error(f"API Error: {api_response.status_code} - {api_response.text}")
-                        response = {
-                            "jsonrpc": "2.0",
-                            "id": request_id,
-                            "error": {
-                                "code": -32603,
-                                "message": f"API Error {api_response.status_code}: {api_response.text}"
+                        # Call the portfolio API
+                        logger.info(f"Calling portfolio API with: {arguments}")
+                        
+                        api_response = SESSION.post(
+                            PORTFOLIO_API_URL,
+                            json={
+                                "assets": arguments.get("assets"),
+                                "weights": arguments.get("weights"),
+                                "startDate": arguments.get("startDate"),
+                                "endDate": arguments.get("endDate")
+                            },
+                            timeout=API_TIMEOUT
+                        )
+                        
+                        logger.info(f"API Response Status: {api_response.status_code}")
+                        
+                        if api_response.status_code == 200:
+                            result = orjson.loads(api_response.content)
+                            text = orjson.dumps(result, option=orjson.OPT_INDENT_2).decode()
+                            # Only confirmed successes are cached; a failure body must not be replayed for the TTL
+                            if result.get("success") is True:
+                                with RESULT_CACHE_LOCK:
+                                    RESULT_CACHE[key] = text
+                            response = {
+                                "jsonrpc": "2.0",
+                                "id": request_id,
+                                "result": {
+                                    "content": [
+                                        {
+                                            "type": "text",
+                                            "text": text
+                                        }
+                                    ]
+                                }
+                            }
+                        else:
+                            logger.error(f"API Error: {api_response.status_code} - {api_response.text}")
+                            response = {
+                                "jsonrpc": "2.0",
+                                "id": request_id,
+                                "error": {
+                                    "code": -32603,
+                                    "message": f"API Error {api_response.status_code}: {api_response.text}"
+                                }
                             }
-                        }
                         
                 except requests.exceptions.RequestException as e:
                     logger.error(f"Request error: {e}")
@@ -189,23 +258,25 @@ def handle_mcp_request():
                 }
             }
         
-        return jsonify(response), 200
+        if isinstance(response, bytes):
+            return Response(response, mimetype='application/json')
+        return ojson(response)
         
     except Exception as e:
         logger.error(f"Unexpected error in MCP handler: {e}")
-        return jsonify({
+        return ojson({
             "jsonrpc": "2.0",
-            "id": request.json.get("id") if request.json else None,
+            "id": data.get("id") if isinstance(data, dict) else None,
             "error": {
                 "code": -32603,
                 "message": f"Internal server error: {str(e)}"
             }
-        }), 500
+        }, 500)
 
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({
+    return ojson({
         "status": "healthy",
         "server": "simple-portfolio-mcp",
         "version": "1.0.0",
@@ -4,58 +4,75 @@ Quick script to add missing assets directly to Supabase
 """
 
 import yfinance as yf
-import pandas as pd
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
 from supabase import create_client
+from add_new_asset import upsert_in_batches
 
 # Supabase configuration
 SUPABASE_URL = 'https://rhysciwzmjleziieeugv.supabase.co'
 SUPABASE_KEY = 'sb_secret_czW-rrfW4crbk0v6GDPFBQ_EaM-N1dA'
 
-def add_asset_directly(ticker):
+def fetch_histories(tickers):
+    """Download daily history for all tickers in one threaded yfinance call"""
+    data = yf.download(
+        tickers,
+        start='2000-01-01',
+        end=datetime.today().strftime('%Y-%m-%d'),
+        group_by='ticker',
+        auto_adjust=True,  # Match Ticker.history(): Close is dividend-adjusted
+        threads=True,
+        progress=False
+    )
+    
+    # A single ticker may come back without the ticker column level
+    if data.columns.nlevels == 1:
+        return {tickers[0]: data}
+    return {t: data[t].dropna(how='all') for t in tickers if t in data.columns.get_level_values(0)}
+
+def add_asset_directly(client, ticker, data=None):
     """Add asset directly to Supabase without API calls"""
     print(f"Adding {ticker} directly to Supabase...")
     
     try:
-        # Create Supabase client
-        client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        
         # Check if asset already exists
         response = client.table('asset_returns').select('asset_ticker').eq('asset_ticker', ticker).limit(1).execute()
         if response.data:
             print(f"{ticker} already exists in database")
             return True
         
-        # Fetch data from Yahoo Finance
-        print(f"Fetching {ticker} from Yahoo Finance...")
-        stock = yf.Ticker(ticker)
-        data = stock.history(start='2000-01-01', end=datetime.today().strftime('%Y-%m-%d'))
+        # Fetch data from Yahoo Finance unless it was batch-downloaded already
+        if data is None:
+            print(f"Fetching {ticker} from Yahoo Finance...")
+            stock = yf.Ticker(ticker)
+            data = stock.history(start='2000-01-01', end=datetime.today().strftime('%Y-%m-%d'))
         
         if data.empty:
             print(f"No data found for {ticker}")
             return False
         
-        # Calculate monthly returns
-        monthly_prices = data['Close'].resample('ME').last()
-        monthly_returns = monthly_prices.pct_change().dropna()
+        # Calculate monthly returns (vectorized log-diff over month-end prices)
+        monthly_prices = data['Close'].resample('ME').last().dropna()
+        prices = monthly_prices.to_numpy()
+        monthly_returns = np.expm1(np.diff(np.log(prices)))
+        return_dates = monthly_prices.index[1:].strftime('%Y-%m-%d')
         
         if len(monthly_returns) < 12:
             print(f"Insufficient data for {ticker} ({len(monthly_returns)} months)")
             return False
         
-        # Create dataframe
-        df = pd.DataFrame({
-            'asset_ticker': ticker,
-            'return_date': monthly_returns.index.strftime('%Y-%m-%d'),
-            'monthly_return': monthly_returns.values
-        })
+        # Build upsert records directly from the arrays
+        records = [
+            {'asset_ticker': ticker, 'return_date': d, 'monthly_return': float(r)}
+            for d, r in zip(return_dates, monthly_returns)
+        ]
         
-        print(f"Got {len(df)} months of data for {ticker}")
+        print(f"Got {len(records)} months of data for {ticker}")
         
-        # Upload to Supabase
-        records = df.to_dict('records')
-        result = client.table('asset_returns').upsert(records).execute()
+        # Upload to Supabase in concurrent batches
+        upsert_in_batches(client, records)
         
         print(f"Successfully added {ticker} to database")
         return True
@@ -68,9 +85,20 @@ if __name__ == "__main__":
     # Add the missing assets
     missing_assets = ['GLDM', 'GDXJ']
     
-    for asset in missing_assets:
+    # One client and one batched download shared by every asset
+    client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    print(f"Fetching {', '.join(missing_assets)} from Yahoo Finance...")
+    histories = fetch_histories(missing_assets)
+    
+    # Existence checks, fallback fetches and uploads are independent per asset
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(
+            lambda asset: add_asset_directly(client, asset, histories.get(asset)),
+            missing_assets
+        ))
+    
+    for asset, success in zip(missing_assets, results):
         print(f"\n{'='*50}")
-        success = add_asset_directly(asset)
         if success:
             print(f"OK  {asset} added successfully")
         else:
@@ -1,8 +1,14 @@
 import yfinance as yf
+import numpy as np
+import orjson
 import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from supabase import create_client, Client
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import time
 from typing import List, Dict, Optional
@@ -16,6 +22,21 @@ logger = logging.getLogger(__name__)
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 
+# Shared keep-alive session for pre-encoded PostgREST upserts; sized for nested upload pools
+# (e.g. 4 tickers x 4 batches in dynamic_asset_fetcher.py). Upserts merge on the primary key,
+# so retrying a POST is safe
+REST_SESSION = requests.Session()
+REST_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=None
+    )
+))
+
 def create_supabase_client() -> Client:
     """Create Supabase client"""
     return create_client(SUPABASE_URL, SUPABASE_KEY)
@@ -48,8 +69,11 @@ def fetch_and_validate_asset(ticker: str) -> Optional[pd.DataFrame]:
             return None
         
         # Use 'ME' for month-end resampling (same as original)
-        monthly_prices = data['Close'].resample('ME').last()
-        monthly_returns = monthly_prices.pct_change().dropna()
+        monthly_prices = data['Close'].resample('ME').last().dropna()
+        
+        # Simple returns from a vectorized log-diff: r = exp(log(p1) - log(p0)) - 1
+        prices = monthly_prices.to_numpy()
+        monthly_returns = np.expm1(np.diff(np.log(prices)))
         
         if len(monthly_returns) < 12:  # Need at least 1 year
             logger.warning(f"Insufficient data for {ticker} ({len(monthly_returns)} months)")
@@ -58,8 +82,8 @@ def fetch_and_validate_asset(ticker: str) -> Optional[pd.DataFrame]:
         # Create dataframe with same structure as original (3 columns only)
         df = pd.DataFrame({
             'asset_ticker': ticker,
-            'return_date': monthly_returns.index.strftime('%Y-%m-%d'),
-            'monthly_return': monthly_returns.values
+            'return_date': monthly_prices.index[1:].strftime('%Y-%m-%d'),
+            'monthly_return': monthly_returns
         })
         
         logger.info(f"✓ Got {len(df)} months of data ({df['return_date'].min()} to {df['return_date'].max()})")
@@ -69,30 +93,51 @@ def fetch_and_validate_asset(ticker: str) -> Optional[pd.DataFrame]:
         logger.error(f"Error fetching {ticker}: {e}")
         return None
 
+def frame_to_records(df: pd.DataFrame) -> List[Dict]:
+    """Build upsert records column-wise, skipping DataFrame.to_dict('records')"""
+    columns = list(df.columns)
+    return [dict(zip(columns, row)) for row in zip(*(df[c].to_numpy() for c in columns))]
+
+def upsert_in_batches(client: Client, records: List[Dict], batch_size: int = 500, max_workers: int = 8) -> int:
+    """Upsert records into asset_returns in batches, overlapping requests on a thread pool
+    
+    Each batch is encoded once with orjson and posted straight to PostgREST.
+    Returns the number of records uploaded; the first failed batch raises.
+    """
+    batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+    if not batches:
+        return 0
+    total_batches = len(batches)
+    
+    url = f"{client.supabase_url}/rest/v1/asset_returns"
+    headers = {
+        'apikey': client.supabase_key,
+        'Authorization': f'Bearer {client.supabase_key}',
+        'Content-Type': 'application/json',
+        # Upsert like the original - existing rows are merged
+        'Prefer': 'resolution=merge-duplicates,return=minimal'
+    }
+    
+    def upload(numbered_batch):
+        batch_num, batch = numbered_batch
+        body = orjson.dumps(batch, option=orjson.OPT_SERIALIZE_NUMPY)
+        response = REST_SESSION.post(url, data=body, headers=headers, timeout=60)
+        response.raise_for_status()
+        logger.info(f"✓ Batch {batch_num}/{total_batches} uploaded ({len(batch)} rows)")
+        return len(batch)
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, total_batches)) as executor:
+        return sum(executor.map(upload, enumerate(batches, 1)))
+
 def upload_asset_data(client: Client, df: pd.DataFrame, ticker: str) -> bool:
     """Upload asset data to Supabase using the proven batch approach"""
     logger.info(f"Uploading {len(df)} records for {ticker}...")
     
     try:
-        records = df.to_dict('records')
+        records = frame_to_records(df)
         
-        # Upload in batches like the original (batch size 1000)
-        batch_size = 1000
-        total_batches = (len(records) + batch_size - 1) // batch_size
-        uploaded_count = 0
-        
-        for i in range(0, len(records), batch_size):
-            batch = records[i:i + batch_size]
-            batch_num = (i // batch_size) + 1
-            
-            try:
-                # Use upsert like the original - this will skip existing data
-                result = client.table('asset_returns').upsert(batch).execute()
-                uploaded_count += len(batch)
-                logger.info(f"✓ Batch {batch_num}/{total_batches} uploaded ({len(batch)} rows)")
-            except Exception as e:
-                logger.error(f"✗ ERROR in batch {batch_num}: {e}")
-                return False
+        # Upload in concurrent batches
+        uploaded_count = upsert_in_batches(client, records)
         
         logger.info(f"✓ Successfully uploaded {uploaded_count} records for {ticker}")
         return True
@@ -157,8 +202,11 @@ if __name__ == "__main__":
     # Test the function
     import sys
     if len(sys.argv) > 1:
-        ticker = sys.argv[1].upper()
-        result = add_new_asset(ticker)
-        print(json.dumps(result, indent=2))
+        tickers = [arg.upper() for arg in sys.argv[1:]]
+        # Each ticker is an independent fetch + upload, so run them side by side
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(add_new_asset, tickers))
+        for result in results:
+            print(json.dumps(result, indent=2))
     else:
-        print("Usage: python dynamic_asset_fetcher.py <TICKER>")
+        print("Usage: python dynamic_asset_fetcher.py <TICKER> [TICKER ...]")
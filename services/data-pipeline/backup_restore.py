@@ -1,10 +1,15 @@
 import pandas as pd
 from supabase import create_client, Client
+from add_new_asset import frame_to_records, upsert_in_batches
 import logging
 import os
-import json
+import csv
+import io
+import itertools
+import orjson
+from collections import Counter
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 import zipfile
 import shutil
 
@@ -16,6 +21,12 @@ logger = logging.getLogger(__name__)
 SUPABASE_URL = os.getenv('SUPABASE_URL', 'https://rhysciwzmjleziieeugv.supabase.co')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY', 'sb_secret_czW-rrfW4crbk0v6GDPFBQ_EaM-N1dA')
 
+# Rows per range query (PostgREST caps responses at 1000 rows by default)
+PAGE_SIZE = 1000
+
+# Deflate level for backup archives (1 is ~3x cheaper than zlib's default 6 on numeric CSV); 0 stores uncompressed
+BACKUP_COMPRESSLEVEL = int(os.getenv('BACKUP_COMPRESSLEVEL', '1'))
+
 def create_supabase_client() -> Client:
     """Create and test Supabase client connection"""
     try:
@@ -28,6 +39,16 @@ def create_supabase_client() -> Client:
         logger.error(f"Failed to connect to Supabase: {e}")
         raise
 
+def iter_asset_returns(client: Client, page_size: int = PAGE_SIZE) -> Iterator[Dict]:
+    """Yield every asset_returns row using stable, paginated range queries"""
+    offset = 0
+    while True:
+        page = client.table('asset_returns').select('*').order('asset_ticker').order('return_date').range(offset, offset + page_size - 1).execute().data
+        yield from page
+        if len(page) < page_size:
+            return
+        offset += page_size
+
 def backup_data(client: Client, backup_dir: str = 'backups') -> str:
     """Create a complete backup of all data from Supabase"""
     logger.info("Starting data backup...")
@@ -37,83 +58,87 @@ def backup_data(client: Client, backup_dir: str = 'backups') -> str:
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     backup_name = f"portfolio_data_backup_{timestamp}"
     backup_path = os.path.join(backup_dir, backup_name)
-    os.makedirs(backup_path, exist_ok=True)
+    zip_file = f"{backup_path}.zip"
     
     try:
-        # Fetch all data
+        # Fetch all data page by page
         logger.info("Fetching all data from Supabase...")
-        result = client.table('asset_returns').select('*').execute()
+        rows = iter_asset_returns(client)
+        first_row = next(rows, None)
         
-        if not result.data:
+        if first_row is None:
             logger.warning("No data found in Supabase")
             return backup_path
         
-        # Convert to DataFrame
-        df = pd.DataFrame(result.data)
-        logger.info(f"✓ Fetched {len(df)} rows of data")
-        
-        # Save main data file
-        data_file = os.path.join(backup_path, 'asset_returns.csv')
-        df.to_csv(data_file, index=False)
-        logger.info(f"✓ Saved data to {data_file}")
-        
-        # Generate metadata
-        metadata = {
-            'backup_timestamp': timestamp,
-            'backup_date': datetime.now().isoformat(),
-            'total_rows': len(df),
-            'unique_assets': df['asset_ticker'].nunique(),
-            'date_range': {
-                'start': df['return_date'].min(),
-                'end': df['return_date'].max()
-            },
-            'assets': sorted(df['asset_ticker'].unique().tolist()),
-            'columns': df.columns.tolist()
-        }
-        
-        # Save metadata
-        metadata_file = os.path.join(backup_path, 'metadata.json')
-        with open(metadata_file, 'w') as f:
-            json.dump(metadata, f, indent=2)
-        logger.info(f"✓ Saved metadata to {metadata_file}")
-        
-        # Generate summary report
-        summary_file = os.path.join(backup_path, 'summary.txt')
-        with open(summary_file, 'w') as f:
-            f.write("PORTFOLIO DATA BACKUP SUMMARY\n")
-            f.write("="*50 + "\n")
-            f.write(f"Backup Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"Total Rows: {len(df)}\n")
-            f.write(f"Unique Assets: {df['asset_ticker'].nunique()}\n")
-            f.write(f"Date Range: {df['return_date'].min()} to {df['return_date'].max()}\n")
-            f.write(f"\nAssets:\n")
-            for asset in sorted(df['asset_ticker'].unique()):
-                asset_count = len(df[df['asset_ticker'] == asset])
-                f.write(f"  {asset}: {asset_count} rows\n")
+        # Running summary instead of holding the whole table in memory
+        columns = list(first_row.keys())
+        asset_counts = Counter()
+        start_date = end_date = first_row['return_date']
         
-        logger.info(f"✓ Saved summary to {summary_file}")
+        if BACKUP_COMPRESSLEVEL > 0:
+            compression, compresslevel = zipfile.ZIP_DEFLATED, BACKUP_COMPRESSLEVEL
+        else:
+            compression, compresslevel = zipfile.ZIP_STORED, None
         
-        # Create zip archive
-        zip_file = f"{backup_path}.zip"
-        with zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(backup_path):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, backup_path)
-                    zipf.write(file_path, arcname)
+        with zipfile.ZipFile(zip_file, 'w', compression, compresslevel=compresslevel) as zipf:
+            # Stream the main data file straight into the archive
+            with zipf.open('asset_returns.csv', 'w') as raw, io.TextIOWrapper(raw, encoding='utf-8', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=columns, lineterminator='\n')
+                writer.writeheader()
+                for row in itertools.chain([first_row], rows):
+                    writer.writerow(row)
+                    asset_counts[row['asset_ticker']] += 1
+                    return_date = row['return_date']
+                    if return_date < start_date:
+                        start_date = return_date
+                    elif return_date > end_date:
+                        end_date = return_date
+            
+            total_rows = sum(asset_counts.values())
+            logger.info(f"✓ Fetched and saved {total_rows} rows of data")
+            
+            # Generate metadata
+            metadata = {
+                'backup_timestamp': timestamp,
+                'backup_date': datetime.now(),  # orjson writes ISO 8601 natively
+                'total_rows': total_rows,
+                'unique_assets': len(asset_counts),
+                'date_range': {
+                    'start': start_date,
+                    'end': end_date
+                },
+                'assets': sorted(asset_counts),
+                'columns': columns
+            }
+            
+            # Save metadata
+            zipf.writestr('metadata.json', orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
+            logger.info("✓ Saved metadata")
+            
+            # Generate summary report
+            summary = [
+                "PORTFOLIO DATA BACKUP SUMMARY\n",
+                "="*50 + "\n",
+                f"Backup Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n",
+                f"Total Rows: {total_rows}\n",
+                f"Unique Assets: {len(asset_counts)}\n",
+                f"Date Range: {start_date} to {end_date}\n",
+                f"\nAssets:\n"
+            ]
+            for asset in sorted(asset_counts):
+                summary.append(f"  {asset}: {asset_counts[asset]} rows\n")
+            zipf.writestr('summary.txt', ''.join(summary))
+            logger.info("✓ Saved summary")
         
         logger.info(f"✓ Created zip archive: {zip_file}")
         
-        # Clean up temporary directory
-        shutil.rmtree(backup_path)
-        
         return zip_file
         
     except Exception as e:
         logger.error(f"Backup failed: {e}")
-        # Clean up on error
-        if os.path.exists(backup_path):
-            shutil.rmtree(backup_path)
+        # Clean up partial archive on error
+        if os.path.exists(zip_file):
+            os.remove(zip_file)
         raise
 
 def restore_data(client: Client, backup_file: str) -> bool:
@@ -133,13 +158,16 @@ def restore_data(client: Client, backup_file: str) -> bool:
         # Load metadata
         metadata_file = os.path.join(extract_dir, 'metadata.json')
         if os.path.exists(metadata_file):
-            with open(metadata_file, 'r') as f:
-                metadata = json.load(f)
+            with open(metadata_file, 'rb') as f:
+                metadata = orjson.loads(f.read())
             logger.info(f"Backup metadata: {metadata['total_rows']} rows, {metadata['unique_assets']} assets")
         
         # Load data
         data_file = os.path.join(extract_dir, 'asset_returns.csv')
-        df = pd.read_csv(data_file)
+        df = pd.read_csv(data_file, engine='pyarrow')
+        # row_hash is NULL for rows other writers inserted, so the CSV column loads as float64 and
+        # would post rounded values into a bigint; leave it out and let the next upload rehash
+        df = df.drop(columns=['row_hash'], errors='ignore')
         logger.info(f"✓ Loaded {len(df)} rows from backup")
         
         # Clear existing data (optional - comment out if you want to keep existing data)
@@ -148,18 +176,10 @@ def restore_data(client: Client, backup_file: str) -> bool:
         
         # Upload restored data
         logger.info("Uploading restored data...")
-        records = df.to_dict('records')
+        records = frame_to_records(df)
         
-        # Upload in batches
-        batch_size = 1000
-        total_batches = (len(records) + batch_size - 1) // batch_size
-        
-        for i in range(0, len(records), batch_size):
-            batch = records[i:i + batch_size]
-            batch_num = (i // batch_size) + 1
-            
-            logger.info(f"Uploading batch {batch_num}/{total_batches}")
-            client.table('asset_returns').upsert(batch).execute()
+        # Upload in pre-encoded, concurrent batches
+        upsert_in_batches(client, records, batch_size=1000)
         
         logger.info("✓ Data restore completed successfully")
         
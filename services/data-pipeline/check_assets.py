@@ -3,7 +3,12 @@
 Check what assets are available in Supabase database
 """
 
+import hashlib
 import os
+import time
+from datetime import date
+from pathlib import Path
+import orjson
 from supabase import create_client
 import pandas as pd
 
@@ -11,16 +16,75 @@ import pandas as pd
 SUPABASE_URL = os.getenv('SUPABASE_URL', 'https://rhysciwzmjleziieeugv.supabase.co')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY', 'sb_secret_czW-rrfW4crbk0v6GDPFBQ_EaM-N1dA')
 
+# PostgREST caps each response, so multi-ticker queries are read in pages
+PAGE_SIZE = 1000
+
+# Local snapshot cache so repeated CLI runs skip the network
+CACHE_DIR = Path(os.getenv('FARGASON_CACHE_DIR', Path.home() / '.cache' / 'fargason'))
+ASSET_LIST_TTL = 3600  # seconds
+DATE_RANGE_TTL = 86400  # monthly bars do not change intraday
+
+def _cached_call(key, ttl, fn):
+    """Return fn() from an orjson file under CACHE_DIR, refreshing it after ttl seconds"""
+    path = CACHE_DIR / hashlib.sha256(key.encode()).hexdigest()
+    try:
+        if time.time() - path.stat().st_mtime < ttl:
+            return orjson.loads(path.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        pass
+    
+    result = fn()
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(orjson.dumps(result))
+    except OSError:
+        pass  # Cache is best-effort
+    return result
+
+def _fetch_date_rows(client, tickers):
+    """Fetch (asset_ticker, return_date) rows for the tickers with one paged IN query"""
+    rows = []
+    offset = 0
+    while True:
+        page = client.table('asset_returns').select('asset_ticker,return_date').in_('asset_ticker', list(tickers)).order('asset_ticker').order('return_date').range(offset, offset + PAGE_SIZE - 1).execute().data
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            break
+        offset += PAGE_SIZE
+    return rows
+
+def _fetch_date_range_rows(client, tickers):
+    """Aggregate min/max/count per ticker, server-side when the RPC is installed"""
+    try:
+        # See sql/asset_date_range.sql
+        return client.rpc('asset_date_range', {'tickers': list(tickers)}).execute().data
+    except Exception:
+        rows = _fetch_date_rows(client, tickers)
+        if not rows:
+            return []
+        ranges = pd.DataFrame(rows).groupby('asset_ticker')['return_date'].agg(['min', 'max', 'count'])
+        return ranges.reset_index().to_dict('records')
+
+def fetch_date_ranges(client, tickers):
+    """Return first/last date and month count per ticker, cached for the day"""
+    key = f"{SUPABASE_URL}|date_ranges|{','.join(sorted(tickers))}|{date.today()}"
+    rows = _cached_call(key, DATE_RANGE_TTL, lambda: _fetch_date_range_rows(client, tickers))
+    
+    if not rows:
+        return pd.DataFrame(columns=['min', 'max', 'count'])
+    return pd.DataFrame(rows).set_index('asset_ticker')[['min', 'max', 'count']].sort_index()
+
 def check_available_assets():
     """Check what assets are available in the database"""
     try:
         client = create_client(SUPABASE_URL, SUPABASE_KEY)
         
         # Get all unique assets
-        response = client.table('asset_returns').select('asset_ticker').execute()
+        key = f"{SUPABASE_URL}|asset_returns|asset_ticker"
+        rows = _cached_call(key, ASSET_LIST_TTL, lambda: client.table('asset_returns').select('asset_ticker').execute().data)
         
-        if response.data:
-            assets_df = pd.DataFrame(response.data)
+        if rows:
+            assets_df = pd.DataFrame(rows)
             unique_assets = sorted(assets_df['asset_ticker'].unique())
             
             print(f"Found {len(unique_assets)} assets in database:")
@@ -35,12 +99,9 @@ def check_available_assets():
             print("\nDate ranges for each asset:")
             print("=" * 70)
             
-            for asset in unique_assets[:10]:  # Show first 10 assets
-                asset_response = client.table('asset_returns').select('return_date').eq('asset_ticker', asset).order('return_date').execute()
-                
-                if asset_response.data:
-                    dates = [row['return_date'] for row in asset_response.data]
-                    print(f"{asset:6s}: {dates[0]} to {dates[-1]} ({len(dates)} months)")
+            ranges = fetch_date_ranges(client, unique_assets[:10])  # Show first 10 assets
+            for asset, row in ranges.iterrows():
+                print(f"{asset:6s}: {row['min']} to {row['max']} ({row['count']} months)")
             
             if len(unique_assets) > 10:
                 print(f"... and {len(unique_assets) - 10} more assets")
@@ -62,12 +123,12 @@ def check_specific_assets(requested_assets):
         print(f"\nChecking requested assets: {requested_assets}")
         print("=" * 50)
         
+        ranges = fetch_date_ranges(client, requested_assets)
+        
         for asset in requested_assets:
-            response = client.table('asset_returns').select('return_date').eq('asset_ticker', asset).order('return_date').execute()
-            
-            if response.data:
-                dates = [row['return_date'] for row in response.data]
-                print(f"OK  {asset:6s}: {dates[0]} to {dates[-1]} ({len(dates)} months)")
+            if asset in ranges.index:
+                row = ranges.loc[asset]
+                print(f"OK  {asset:6s}: {row['min']} to {row['max']} ({row['count']} months)")
             else:
                 print(f"NO  {asset:6s}: NOT FOUND")
         
@@ -1,14 +1,20 @@
+import os
 import pandas as pd
 
-df = pd.read_csv('all_asset_returns.csv')
+# fetch_all_assets.py writes Parquet (CSV only with --csv); Arrow-backed columns keep asset_ticker cheap to group
+if os.path.exists('all_asset_returns.parquet'):
+    df = pd.read_parquet('all_asset_returns.parquet', dtype_backend='pyarrow')
+else:
+    df = pd.read_csv('all_asset_returns.csv', engine='pyarrow', dtype_backend='pyarrow')
 
 print("="*60)
 print("CSV FILE CONTENTS")
 print("="*60)
 print(f"Total rows: {len(df)}")
 print(f"\nAssets in CSV:")
-print(df.groupby('asset_ticker').size().sort_index())
-print(f"\nTotal assets: {df['asset_ticker'].nunique()}")
+counts = df.groupby('asset_ticker', sort=True).size()
+print(counts)
+print(f"\nTotal assets: {len(counts)}")
 print("\nFirst few rows:")
 print(df.head(10))
 print("\nLast few rows:")
@@ -4,6 +4,7 @@ Script to check the current database schema
 """
 
 import os
+import sys
 import logging
 from supabase import create_client
 
@@ -11,6 +12,36 @@ from supabase import create_client
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+PAGE_SIZE = 1000
+
+def _fetch_columns(client):
+    """Column names of asset_returns, from the catalog when the RPC is installed"""
+    try:
+        # See sql/table_columns.sql
+        return client.rpc('table_columns', {'tbl': 'asset_returns'}).execute().data
+    except Exception as e:
+        logger.warning(f"table_columns RPC unavailable (apply sql/table_columns.sql), reading a sample row: {e}")
+        result = client.table('asset_returns').select('*').limit(1).execute()
+        return list(result.data[0].keys()) if result.data else []
+
+def _fetch_summary(client):
+    """Row count, distinct ticker count and sample tickers, in one round-trip when the RPC is installed"""
+    try:
+        # See sql/asset_summary.sql
+        return client.rpc('asset_summary').execute().data[0]
+    except Exception as e:
+        logger.warning(f"asset_summary RPC unavailable (apply sql/asset_summary.sql), querying the table: {e}")
+        count_result = client.table('asset_returns').select('asset_ticker', count='exact').limit(1).execute()
+        tickers = set()
+        offset = 0
+        while True:
+            page = client.table('asset_returns').select('asset_ticker').order('asset_ticker').order('return_date').range(offset, offset + PAGE_SIZE - 1).execute().data
+            tickers.update(row['asset_ticker'] for row in page)
+            if len(page) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+        return {'n_rows': count_result.count, 'n_tickers': len(tickers), 'sample': sorted(tickers)[:10]}
+
 def check_database_schema():
     """Check what columns exist in the asset_returns table"""
     logger.info("Checking database schema...")
@@ -25,24 +56,18 @@ def check_database_schema():
         
         client = create_client(supabase_url, supabase_key)
         
-        # Get a sample record to see the schema
-        result = client.table('asset_returns').select('*').limit(1).execute()
+        columns = _fetch_columns(client)
+        logger.info("✓ Database connection successful")
+        logger.info("Current columns in asset_returns table:")
+        for column in columns:
+            logger.info(f"  - {column}")
         
-        if result.data:
-            logger.info("✓ Database connection successful")
-            logger.info("Current columns in asset_returns table:")
-            for column in result.data[0].keys():
-                logger.info(f"  - {column}")
-            
-            # Check if we have any data
-            count_result = client.table('asset_returns').select('asset_ticker', count='exact').execute()
-            logger.info(f"Total records: {count_result.count}")
-            
-            # Get unique assets
-            assets_result = client.table('asset_returns').select('asset_ticker').execute()
-            unique_assets = set(row['asset_ticker'] for row in assets_result.data)
-            logger.info(f"Unique assets: {len(unique_assets)}")
-            logger.info(f"Sample assets: {list(unique_assets)[:10]}")
+        summary = _fetch_summary(client)
+        
+        if summary['n_rows']:
+            logger.info(f"Total records: {summary['n_rows']}")
+            logger.info(f"Unique assets: {summary['n_tickers']}")
+            logger.info(f"Sample assets: {summary['sample']}")
             
             return True
         else:
@@ -69,4 +94,5 @@ def main():
     return success
 
 if __name__ == "__main__":
-    main()
+    success = main()
+    sys.exit(0 if success else 1)
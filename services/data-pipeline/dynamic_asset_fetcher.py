@@ -1,13 +1,22 @@
 import yfinance as yf
+import numpy as np
 import pandas as pd
 from supabase import create_client, Client
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-import time
-from typing import List, Dict, Optional, Set
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Dict, FrozenSet, Optional, Set
 import json
 import requests
+from add_new_asset import frame_to_records, upsert_in_batches
+
+try:
+    from numba import njit
+except ImportError:  # Optional: compute_monthly_returns falls back to pandas resampling
+    njit = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -17,29 +26,63 @@ logger = logging.getLogger(__name__)
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 
+# Upsert tuning: one request covers a typical ticker; bulk backfills fan out
+UPLOAD_BATCH_SIZE = 10000
+UPLOAD_WORKERS = 4
+
+# Per-ticker stages: fallback Yahoo fetches and validate+upload jobs run on separate pools
+FETCH_WORKERS = 8
+TICKER_UPLOAD_WORKERS = 4
+
+# Bulk loads (BULK=1) go through Postgres COPY over SUPABASE_DB_URL instead of REST upserts
+SUPABASE_DB_URL = os.getenv('SUPABASE_DB_URL')
+BULK_UPLOAD = os.getenv('BULK') == '1'
+
+# Download window end, computed once per run (refreshed by main())
+END_DATE = datetime.today().strftime('%Y-%m-%d')
+
+# Daily Close history per ticker, so re-runs only download the tail
+PRICE_CACHE_DIR = Path(os.getenv('FARGASON_CACHE_DIR', Path.home() / '.cache' / 'fargason')) / 'prices'
+
 # Create Supabase client
 def create_supabase_client() -> Client:
-    """Create and test Supabase client connection"""
+    """Create the Supabase client (connectivity is checked by the first real query)"""
     try:
         client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        # Test connection
-        result = client.table('asset_returns').select('*').limit(1).execute()
-        logger.info("✓ Successfully connected to Supabase")
+        logger.info("✓ Created Supabase client")
         return client
     except Exception as e:
         logger.error(f"Failed to connect to Supabase: {e}")
         raise
 
-def get_existing_assets(client: Client) -> Set[str]:
+def _scan_asset_tickers(client: Client, page_size: int = 1000) -> FrozenSet[str]:
+    """Distinct tickers from a paged scan of every row (past PostgREST's row cap)"""
+    tickers = set()
+    offset = 0
+    while True:
+        page = client.table('asset_returns').select('asset_ticker').order('asset_ticker').order('return_date').range(offset, offset + page_size - 1).execute().data
+        tickers.update(row['asset_ticker'] for row in page)
+        if len(page) < page_size:
+            return frozenset(tickers)
+        offset += page_size
+
+def get_existing_assets(client: Client) -> FrozenSet[str]:
     """Get list of assets already in the database"""
     try:
-        result = client.table('asset_returns').select('asset_ticker').execute()
-        existing_assets = set(row['asset_ticker'] for row in result.data)
+        try:
+            # Server-side DISTINCT (see sql/distinct_asset_tickers.sql)
+            # First round-trip of a run, so it doubles as the connection check
+            result = client.rpc('distinct_asset_tickers').execute()
+            existing_assets = frozenset(row['asset_ticker'] for row in result.data)
+        except Exception as e:
+            # Without this fallback every requested asset would look new and be re-fetched daily
+            logger.warning(f"distinct_asset_tickers RPC failed (apply sql/distinct_asset_tickers.sql), scanning asset_returns instead: {e}")
+            existing_assets = _scan_asset_tickers(client)
         logger.info(f"Found {len(existing_assets)} existing assets in database")
         return existing_assets
     except Exception as e:
-        logger.error(f"Error fetching existing assets: {e}")
-        return set()
+        logger.error(f"Error fetching existing assets (check Supabase connectivity): {e}")
+        return frozenset()
 
 def get_requested_assets(client: Client) -> Set[str]:
     """Get list of assets that have been requested but not found"""
@@ -53,16 +96,122 @@ def get_requested_assets(client: Client) -> Set[str]:
         logger.warning(f"Asset requests table not found or empty: {e}")
         return set()
 
-def fetch_asset_data(ticker: str, start_date: str = '2000-01-01') -> Optional[pd.DataFrame]:
+@lru_cache(maxsize=None)
+def _ticker(symbol: str) -> yf.Ticker:
+    """Reuse one yf.Ticker handle (and its cached state) per symbol"""
+    return yf.Ticker(symbol)
+
+def clear_caches():
+    """Drop cached Ticker handles (for long-running processes)"""
+    _ticker.cache_clear()
+
+def _tz_naive(close: pd.Series) -> pd.Series:
+    """Drop the exchange timezone from a daily index (Ticker.history is tz-aware, yf.download is not)"""
+    if close.index.tz is not None:
+        return close.tz_localize(None)
+    return close
+
+def _load_cached_close(ticker: str) -> Optional[pd.Series]:
+    """Return the cached daily Close series for a ticker, or None if nothing usable is on disk"""
+    try:
+        close = pd.read_parquet(PRICE_CACHE_DIR / f"{ticker}.parquet")['Close']
+    except Exception:
+        return None
+    # Files written before the index was normalized may still carry a timezone
+    return _tz_naive(close) if not close.empty else None
+
+def _cache_start(cached: Optional[pd.Series], start_date: str) -> str:
+    """Download from the last cached day (kept as an overlap for the splice), else from start_date"""
+    return cached.index.max().strftime('%Y-%m-%d') if cached is not None else start_date
+
+def _merge_cached_close(ticker: str, cached: Optional[pd.Series], fresh: pd.Series) -> pd.Series:
+    """Splice freshly downloaded closes onto the cached history and write the result back"""
+    # Both download paths share one cache file, so compare and store on a tz-naive index
+    fresh = _tz_naive(fresh)
+    if cached is not None:
+        overlap = fresh.index.intersection(cached.index)
+        if len(overlap):
+            # Yahoo back-adjusts history after new dividends/splits; rescale the cache to match
+            first = overlap[0]
+            cached = cached * (fresh.loc[first] / cached.loc[first])
+        fresh = pd.concat([cached[cached.index < fresh.index[0]], fresh])
+    
+    try:
+        PRICE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        fresh.to_frame('Close').to_parquet(PRICE_CACHE_DIR / f"{ticker}.parquet", compression='zstd')
+    except Exception as e:
+        logger.warning(f"Could not cache prices for {ticker}: {e}")  # Cache is best-effort
+    return fresh
+
+if njit is not None:
+    @njit(cache=True)
+    def _month_end_closes(months, closes):
+        """Last non-NaN close of each month in one pass over date-sorted daily bars"""
+        out_months = np.empty(months.size, np.int64)
+        out_closes = np.empty(months.size, np.float64)
+        k = 0
+        current = -1
+        for i in range(months.size):
+            if np.isnan(closes[i]):
+                continue
+            if k == 0 or months[i] != current:
+                k += 1
+                current = months[i]
+            out_months[k - 1] = current
+            out_closes[k - 1] = closes[i]
+        return out_months[:k], out_closes[:k]
+else:
+    _month_end_closes = None
+
+def compute_monthly_returns(close: pd.Series, ticker: str) -> Optional[pd.DataFrame]:
+    """Turn a daily (dividend-adjusted) Close series into the 3-column monthly returns frame"""
+    if _month_end_closes is not None:
+        # Compiled single pass over month numbers (same result as resample('ME').last().dropna())
+        months = close.index.values.astype('datetime64[M]').astype(np.int64)
+        month_ids, prices = _month_end_closes(months, close.to_numpy(dtype=np.float64))
+        month_ends = (month_ids + 1).astype('datetime64[M]').astype('datetime64[D]') - np.timedelta64(1, 'D')
+    else:
+        # Use 'ME' for month-end resampling (same as original)
+        monthly_prices = close.resample('ME').last().dropna()
+        prices = monthly_prices.to_numpy(dtype=np.float64)
+        month_ends = monthly_prices.index.values
+    
+    # Simple returns straight on the price array: p[t] / p[t-1] - 1
+    if len(prices) < 2:
+        logger.warning(f"No monthly returns calculated for {ticker}")
+        return None
+    
+    monthly_returns = np.empty(len(prices) - 1)
+    np.divide(prices[1:], prices[:-1], out=monthly_returns)
+    monthly_returns -= 1.0
+    
+    # Create dataframe with same structure as original (3 columns only); float32 is ample
+    # for a monthly return and halves the numeric payload, ISO dates are formatted in C
+    df = pd.DataFrame({
+        'asset_ticker': ticker,
+        'return_date': np.datetime_as_string(month_ends[1:], unit='D'),
+        'monthly_return': monthly_returns.astype(np.float32)
+    })
+    
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"✓ Got {len(df)} months of data for {ticker} ({df['return_date'].iat[0]} to {df['return_date'].iat[-1]})")
+    return df
+
+def fetch_asset_data(ticker: str, start_date: str = '2000-01-01', end_date: Optional[str] = None) -> Optional[pd.DataFrame]:
     """Fetch data for a single asset using the proven approach"""
-    logger.info(f"Fetching {ticker}...")
+    logger.debug(f"Fetching {ticker}...")
     
     try:
+        # Only download what the on-disk cache does not already have
+        cached = _load_cached_close(ticker)
+        
         # Create a Ticker object and use history() - Close is already dividend-adjusted
-        stock = yf.Ticker(ticker)
-        data = stock.history(start=start_date, end=datetime.today().strftime('%Y-%m-%d'))
+        stock = _ticker(ticker)
+        data = stock.history(start=_cache_start(cached, start_date), end=end_date or END_DATE)
         
         if data.empty:
+            if cached is not None:
+                return compute_monthly_returns(cached, ticker)
             logger.warning(f"No data for {ticker}")
             return None
         
@@ -71,78 +220,126 @@ def fetch_asset_data(ticker: str, start_date: str = '2000-01-01') -> Optional[pd
             logger.error(f"No Close price data for {ticker}")
             return None
         
-        # Use 'ME' for month-end resampling (same as original)
-        monthly_prices = data['Close'].resample('ME').last()
-        monthly_returns = monthly_prices.pct_change().dropna()
-        
-        if len(monthly_returns) == 0:
-            logger.warning(f"No monthly returns calculated for {ticker}")
-            return None
-        
-        # Create dataframe with same structure as original (3 columns only)
-        df = pd.DataFrame({
-            'asset_ticker': ticker,
-            'return_date': monthly_returns.index.strftime('%Y-%m-%d'),
-            'monthly_return': monthly_returns.values
-        })
-        
-        logger.info(f"✓ Got {len(df)} months of data ({df['return_date'].min()} to {df['return_date'].max()})")
-        return df
+        return compute_monthly_returns(_merge_cached_close(ticker, cached, data['Close']), ticker)
         
     except Exception as e:
         logger.error(f"Error fetching {ticker}: {e}")
         return None
 
+def fetch_assets_data(tickers: List[str], start_date: str = '2000-01-01', end_date: Optional[str] = None) -> Dict[str, Optional[pd.DataFrame]]:
+    """Fetch several assets with one batched, threaded yfinance download"""
+    logger.info(f"Fetching {len(tickers)} assets in one batch...")
+    
+    # One download window covering the ticker with the least cached history
+    cached = {ticker: _load_cached_close(ticker) for ticker in tickers}
+    batch_start = min(_cache_start(cached[ticker], start_date) for ticker in tickers)
+    
+    data = yf.download(
+        tickers,
+        start=batch_start,
+        end=end_date or END_DATE,
+        group_by='ticker',
+        auto_adjust=True,  # Match Ticker.history(): Close is dividend-adjusted
+        threads=True,
+        progress=False
+    )
+    
+    results = {}
+    for ticker in tickers:
+        try:
+            # A single ticker may come back without the ticker column level
+            frame = data if data.columns.nlevels == 1 else data[ticker]
+            close = frame['Close'].dropna()
+        except KeyError:
+            close = None
+        
+        if close is not None and not close.empty:
+            close = _merge_cached_close(ticker, cached[ticker], close)
+        else:
+            close = cached[ticker]
+        
+        if close is None:
+            logger.warning(f"No data for {ticker}")
+            results[ticker] = None
+        else:
+            results[ticker] = compute_monthly_returns(close, ticker)
+    
+    return results
+
 def validate_asset_data(df: pd.DataFrame, ticker: str) -> bool:
     """Validate asset data quality"""
     if df is None or len(df) == 0:
         return False
     
+    # Single NumPy pass over the returns column (no filtered DataFrame copies)
+    arr = df['monthly_return'].to_numpy(dtype=np.float64, copy=False)
+    n = arr.size
+    
     # Check for reasonable data
-    if len(df) < 12:  # Need at least 1 year of data
-        logger.warning(f"{ticker}: Insufficient data ({len(df)} months)")
+    if n < 12:  # Need at least 1 year of data
+        logger.warning(f"{ticker}: Insufficient data ({n} months)")
         return False
     
-    # Check for extreme values
-    extreme_returns = df[(df['monthly_return'] < -0.5) | (df['monthly_return'] > 1.0)]
-    if len(extreme_returns) > len(df) * 0.1:  # More than 10% extreme values
-        logger.warning(f"{ticker}: Too many extreme returns ({len(extreme_returns)}/{len(df)})")
+    nan_mask = np.isnan(arr)
+    
+    # Check for extreme values (NaN compares False, so no separate mask is needed)
+    extreme_count = int(np.count_nonzero((arr < -0.5) | (arr > 1.0)))
+    if extreme_count > n * 0.1:  # More than 10% extreme values
+        logger.warning(f"{ticker}: Too many extreme returns ({extreme_count}/{n})")
         return False
     
     # Check for missing data
-    missing_data = df['monthly_return'].isnull().sum()
-    if missing_data > len(df) * 0.05:  # More than 5% missing
-        logger.warning(f"{ticker}: Too much missing data ({missing_data}/{len(df)})")
+    missing_data = int(np.count_nonzero(nan_mask))
+    if missing_data > n * 0.05:  # More than 5% missing
+        logger.warning(f"{ticker}: Too much missing data ({missing_data}/{n})")
         return False
     
     return True
 
+def upload_asset_data_bulk(df: pd.DataFrame) -> None:
+    """Load asset data over a direct Postgres connection using binary COPY"""
+    import psycopg
+    
+    dates = pd.to_datetime(df['return_date']).dt.date.to_numpy()
+    rows = zip(df['asset_ticker'].to_numpy(), dates, df['monthly_return'].to_numpy())
+    
+    with psycopg.connect(SUPABASE_DB_URL) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "CREATE TEMP TABLE tmp_asset_returns "
+                "(asset_ticker text, return_date date, monthly_return double precision) ON COMMIT DROP"
+            )
+            with cur.copy(
+                "COPY tmp_asset_returns (asset_ticker, return_date, monthly_return) FROM STDIN WITH (FORMAT binary)"
+            ) as copy:
+                copy.set_types(['text', 'date', 'float8'])
+                for ticker, return_date, monthly_return in rows:
+                    copy.write_row((ticker, return_date, float(monthly_return)))
+            
+            # Same semantics as the REST upsert: new rows inserted, existing rows updated
+            cur.execute(
+                "INSERT INTO asset_returns (asset_ticker, return_date, monthly_return) "
+                "SELECT asset_ticker, return_date, monthly_return FROM tmp_asset_returns "
+                "ON CONFLICT (asset_ticker, return_date) DO UPDATE SET monthly_return = EXCLUDED.monthly_return"
+            )
+
 def upload_asset_data(client: Client, df: pd.DataFrame, ticker: str) -> bool:
     """Upload asset data to Supabase using the proven batch approach"""
-    logger.info(f"Uploading {len(df)} records for {ticker}...")
+    logger.debug(f"Uploading {len(df)} records for {ticker}...")
     
     try:
-        records = df.to_dict('records')
+        if BULK_UPLOAD and SUPABASE_DB_URL:
+            upload_asset_data_bulk(df)
+            logger.debug(f"✓ Successfully copied {len(df)} records for {ticker}")
+            return True
         
-        # Upload in batches like the original (batch size 1000)
-        batch_size = 1000
-        total_batches = (len(records) + batch_size - 1) // batch_size
-        uploaded_count = 0
+        # Keeps NumPy scalars, so orjson writes float32 returns at float32 precision
+        records = frame_to_records(df)
         
-        for i in range(0, len(records), batch_size):
-            batch = records[i:i + batch_size]
-            batch_num = (i // batch_size) + 1
-            
-            try:
-                # Use upsert like the original - this will skip existing data
-                result = client.table('asset_returns').upsert(batch).execute()
-                uploaded_count += len(batch)
-                logger.info(f"✓ Batch {batch_num}/{total_batches} uploaded ({len(batch)} rows)")
-            except Exception as e:
-                logger.error(f"✗ ERROR in batch {batch_num}: {e}")
-                return False
+        # Large batches, upserted concurrently (idempotent on the primary key, so order does not matter)
+        uploaded_count = upsert_in_batches(client, records, batch_size=UPLOAD_BATCH_SIZE, max_workers=UPLOAD_WORKERS)
         
-        logger.info(f"✓ Successfully uploaded {uploaded_count} records for {ticker}")
+        logger.debug(f"✓ Successfully uploaded {uploaded_count} records for {ticker}")
         return True
         
     except Exception as e:
@@ -161,14 +358,32 @@ def log_asset_request(client: Client, ticker: str, status: str, error: str = Non
         }
         
         # For now, we'll just log it
-        logger.info(f"Asset request logged: {ticker} - {status}")
+        logger.debug(f"Asset request logged: {ticker} - {status}")
         
     except Exception as e:
         logger.error(f"Error logging request for {ticker}: {e}")
 
-def process_requested_assets(client: Client, requested_assets: Set[str], existing_assets: Set[str]):
+def _validate_and_upload(client: Client, ticker: str, df: Optional[pd.DataFrame]) -> bool:
+    """Validate one fetched asset, upload it and log the outcome; True on success"""
+    try:
+        if df is not None and validate_asset_data(df, ticker):
+            # Upload to database
+            if upload_asset_data(client, df, ticker):
+                log_asset_request(client, ticker, 'success')
+                return True
+            log_asset_request(client, ticker, 'upload_failed')
+        else:
+            log_asset_request(client, ticker, 'validation_failed')
+        
+    except Exception as e:
+        logger.error(f"Error processing {ticker}: {e}")
+        log_asset_request(client, ticker, 'error', str(e))
+    return False
+
+def process_requested_assets(client: Client, requested_assets: Set[str], existing_assets: FrozenSet[str]):
     """Process assets that have been requested but not found"""
-    new_assets = requested_assets - existing_assets
+    # Single pass over the requests; sorted so logs and fetch order are deterministic
+    new_assets = [t for t in sorted(requested_assets) if t not in existing_assets]
     
     if not new_assets:
         logger.info("No new assets to process")
@@ -176,41 +391,43 @@ def process_requested_assets(client: Client, requested_assets: Set[str], existin
     
     logger.info(f"Processing {len(new_assets)} new assets: {', '.join(new_assets)}")
     
-    successful_fetches = []
-    failed_fetches = []
+    # Fetch every new asset in one batched download (yfinance throttles internally)
+    tickers = new_assets
+    fetched = None
+    try:
+        fetched = fetch_assets_data(tickers)
+    except Exception as e:
+        logger.error(f"Batch download failed, falling back to per-asset fetches: {e}")
+    
+    # Validate+upload (Supabase) runs on its own pool, so each ticker is uploaded as soon as
+    # its data is in while the remaining fetches (Yahoo) continue
+    with ThreadPoolExecutor(max_workers=TICKER_UPLOAD_WORKERS) as upload_pool:
+        uploads = {}
+        if fetched is not None:
+            for ticker in tickers:
+                uploads[ticker] = upload_pool.submit(_validate_and_upload, client, ticker, fetched.get(ticker))
+        else:
+            with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as fetch_pool:
+                fetches = {fetch_pool.submit(fetch_asset_data, ticker): ticker for ticker in tickers}
+                for future in as_completed(fetches):
+                    ticker = fetches[future]
+                    uploads[ticker] = upload_pool.submit(_validate_and_upload, client, ticker, future.result())
+        
+        results = {ticker: uploads[ticker].result() for ticker in tickers}
     
-    for ticker in new_assets:
-        try:
-            # Fetch data
-            df = fetch_asset_data(ticker)
-            
-            if df is not None and validate_asset_data(df, ticker):
-                # Upload to database
-                if upload_asset_data(client, df, ticker):
-                    successful_fetches.append(ticker)
-                    log_asset_request(client, ticker, 'success')
-                else:
-                    failed_fetches.append(ticker)
-                    log_asset_request(client, ticker, 'upload_failed')
-            else:
-                failed_fetches.append(ticker)
-                log_asset_request(client, ticker, 'validation_failed')
-            
-            # Be respectful to Yahoo Finance
-            time.sleep(1)
-            
-        except Exception as e:
-            logger.error(f"Error processing {ticker}: {e}")
-            failed_fetches.append(ticker)
-            log_asset_request(client, ticker, 'error', str(e))
+    successful_fetches = [ticker for ticker in tickers if results[ticker]]
+    failed_fetches = [ticker for ticker in tickers if not results[ticker]]
     
     # Summary
-    logger.info(f"✓ Successfully processed: {', '.join(successful_fetches)}")
+    logger.info(f"✓ Successfully processed {len(successful_fetches)}/{len(tickers)} assets: {', '.join(successful_fetches)}")
     if failed_fetches:
         logger.warning(f"✗ Failed to process: {', '.join(failed_fetches)}")
 
 def main():
     """Main function to run the enhanced data pipeline"""
+    global END_DATE
+    END_DATE = datetime.today().strftime('%Y-%m-%d')
+    
     logger.info("="*80)
     logger.info("ENHANCED DYNAMIC DATA PIPELINE")
     logger.info("="*80)
@@ -218,9 +435,12 @@ def main():
     # Create Supabase client
     client = create_supabase_client()
     
-    # Get existing and requested assets
-    existing_assets = get_existing_assets(client)
-    requested_assets = get_requested_assets(client)
+    # Get existing and requested assets (independent queries, so overlap the round-trips)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        existing_future = executor.submit(get_existing_assets, client)
+        requested_future = executor.submit(get_requested_assets, client)
+        existing_assets = existing_future.result()
+        requested_assets = requested_future.result()
     
     # Process new assets
     process_requested_assets(client, requested_assets, existing_assets)
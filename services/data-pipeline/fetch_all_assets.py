@@ -1,10 +1,20 @@
 import yfinance as yf
+import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+import threading
 import time
 import logging
 from typing import List, Dict, Optional, Tuple
 import json
+from price_cache import cached_history, load_history, store_history
+from add_new_asset import create_supabase_client, frame_to_records, upsert_in_batches
+
+try:
+    from numba import njit
+except ImportError:  # Optional: calculate_performance_metrics falls back to pandas groupby
+    njit = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -51,8 +61,18 @@ ASSETS = {
     'DIVIDEND': ['VYM', 'DVY', 'SCHD', 'DGRO'],
 }
 
-# Flatten the asset list
-ALL_ASSETS = [asset for category in ASSETS.values() for asset in category]
+# Flatten the asset list (deduplicated: VYM and DVY sit in both US_VALUE and DIVIDEND)
+ALL_ASSETS = sorted({asset for category in ASSETS.values() for asset in category})
+
+# Download window end, fixed once per run so cache keys cannot drift across midnight
+END_DATE = datetime.today().strftime('%Y-%m-%d')
+
+# Symbols per batched yf.download call (Yahoo serves ~20 symbols per request)
+BULK_CHUNK_SIZE = 20
+
+# Fallback per-ticker fetches; the semaphore caps in-flight Yahoo requests to avoid HTTP 429s
+FETCH_WORKERS = 16
+YAHOO_SEMAPHORE = threading.Semaphore(8)
 
 # Asset metadata for better tracking
 ASSET_METADATA = {
@@ -68,7 +88,39 @@ ASSET_METADATA = {
     'IBIT': {'name': 'iShares Bitcoin Trust', 'category': 'Cryptocurrency', 'expense_ratio': 0.25},
 }
 
-def fetch_asset_returns(ticker: str, start_date: str = '2000-01-01', retries: int = 3) -> Optional[pd.DataFrame]:
+def build_monthly_frame(ticker: str, data: pd.DataFrame) -> Optional[pd.DataFrame]:
+    """Turn daily price history for one asset into its monthly returns frame"""
+    # Month-end close and average volume in one groupby on calendar month (the index is already
+    # sorted trading days, so the general resampler's reindexing is not needed); tz dropped, wall date kept
+    index = data.index.tz_localize(None) if data.index.tz is not None else data.index
+    agg = {'Close': 'last', 'Volume': 'mean'} if 'Volume' in data.columns else {'Close': 'last'}
+    monthly = data[list(agg)].groupby(index.to_period('M')).agg(agg).dropna(subset=['Close'])
+    monthly.index = monthly.index.to_timestamp(how='end').normalize()
+    
+    # Calculate monthly returns over the month-end price array
+    prices = monthly['Close'].to_numpy()
+    monthly_returns = np.expm1(np.diff(np.log(prices)))
+    
+    if len(monthly_returns) == 0:
+        logger.warning(f"No monthly returns calculated for {ticker}")
+        return None
+    
+    # Month-end dates stay datetime64; strings are only made when writing CSV
+    return_dates = monthly.index[1:]
+    
+    # Create dataframe (asset metadata is joined once in main(), not repeated per row here)
+    df = pd.DataFrame({
+        'asset_ticker': ticker,
+        'return_date': return_dates,
+        'monthly_return': monthly_returns.astype(np.float32, copy=False),
+        'price': prices[1:].astype(np.float32, copy=False),  # First month has no return
+        'volume': monthly['Volume'].to_numpy(dtype=np.float32)[1:] if 'Volume' in monthly.columns else np.float32(np.nan)
+    })
+    
+    logger.info(f"✓ Got {len(df)} months of data for {ticker} ({return_dates[0]:%Y-%m-%d} to {return_dates[-1]:%Y-%m-%d})")
+    return df
+
+def fetch_asset_returns(ticker: str, start_date: str = '2000-01-01', retries: int = 3, end_date: str = END_DATE) -> Optional[pd.DataFrame]:
     """Fetch monthly returns for a single asset with retry logic"""
     logger.info(f"Fetching {ticker}...")
     
@@ -79,7 +131,8 @@ def fetch_asset_returns(ticker: str, start_date: str = '2000-01-01', retries: in
                 time.sleep(2 ** attempt)  # Exponential backoff
             
             stock = yf.Ticker(ticker)
-            data = stock.history(start=start_date, end=datetime.today().strftime('%Y-%m-%d'))
+            with YAHOO_SEMAPHORE:
+                data = cached_history(ticker, start_date, end_date, lambda: stock.history(start=start_date, end=end_date))
             
             if data.empty:
                 logger.warning(f"No data for {ticker} (attempt {attempt + 1})")
@@ -89,30 +142,10 @@ def fetch_asset_returns(ticker: str, start_date: str = '2000-01-01', retries: in
                 logger.error(f"No Close price data for {ticker}")
                 continue
             
-            # Calculate monthly returns
-            monthly_prices = data['Close'].resample('ME').last()
-            monthly_returns = monthly_prices.pct_change().dropna()
-            
-            if len(monthly_returns) == 0:
-                logger.warning(f"No monthly returns calculated for {ticker}")
+            df = build_monthly_frame(ticker, data)
+            if df is None:
                 continue
             
-            # Create dataframe with additional metadata
-            df = pd.DataFrame({
-                'asset_ticker': ticker,
-                'return_date': monthly_returns.index.strftime('%Y-%m-%d'),
-                'monthly_return': monthly_returns.values,
-                'price': monthly_prices.values[1:],  # Skip first NaN
-                'volume': data['Volume'].resample('ME').mean().values[1:] if 'Volume' in data.columns else None
-            })
-            
-            # Add metadata
-            if ticker in ASSET_METADATA:
-                df['asset_name'] = ASSET_METADATA[ticker]['name']
-                df['asset_category'] = ASSET_METADATA[ticker]['category']
-                df['expense_ratio'] = ASSET_METADATA[ticker]['expense_ratio']
-            
-            logger.info(f"✓ Got {len(df)} months of data for {ticker} ({df['return_date'].min()} to {df['return_date'].max()})")
             return df
             
         except Exception as e:
@@ -122,8 +155,90 @@ def fetch_asset_returns(ticker: str, start_date: str = '2000-01-01', retries: in
     
     return None
 
+def fetch_assets_bulk(tickers: List[str], start_date: str = '2000-01-01', end_date: str = END_DATE) -> Dict[str, pd.DataFrame]:
+    """Fetch monthly returns for many assets with one batched download per BULK_CHUNK_SIZE symbols"""
+    results = {}
+    
+    # Tickers already cached for today's window skip the download entirely
+    pending = []
+    for ticker in tickers:
+        cached = load_history(ticker, start_date, end_date, variant='download')
+        df = build_monthly_frame(ticker, cached) if cached is not None else None
+        if df is not None:
+            results[ticker] = df
+        else:
+            pending.append(ticker)
+    
+    for i in range(0, len(pending), BULK_CHUNK_SIZE):
+        chunk = pending[i:i + BULK_CHUNK_SIZE]
+        logger.info(f"Downloading {len(chunk)} assets in one batch: {' '.join(chunk)}")
+        
+        try:
+            data = yf.download(
+                " ".join(chunk),
+                start=start_date,
+                end=end_date,
+                group_by='ticker',
+                auto_adjust=True,  # Match Ticker.history(): Close is dividend-adjusted
+                threads=True,
+                progress=False
+            )
+        except Exception as e:
+            logger.error(f"Batch download failed for {', '.join(chunk)}: {e}")
+            continue
+        
+        for ticker in chunk:
+            try:
+                # A single ticker may come back without the ticker column level
+                frame = data if data.columns.nlevels == 1 else data[ticker]
+            except KeyError:
+                continue
+            
+            frame = frame.dropna(how='all')
+            if frame.empty or 'Close' not in frame.columns:
+                continue
+            
+            store_history(ticker, start_date, end_date, frame, variant='download')
+            df = build_monthly_frame(ticker, frame)
+            if df is not None:
+                results[ticker] = df
+    
+    return results
+
+def combine_asset_frames(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """Stack per-asset frames by filling preallocated column arrays (one copy per value, unlike pd.concat)"""
+    total_rows = sum(len(df) for df in frames)
+    columns = {
+        'asset_ticker': np.empty(total_rows, dtype=object),
+        'return_date': np.empty(total_rows, dtype='datetime64[ns]'),
+        'monthly_return': np.empty(total_rows, dtype=np.float32),
+        'price': np.empty(total_rows, dtype=np.float32),
+        'volume': np.empty(total_rows, dtype=np.float32)
+    }
+    
+    offset = 0
+    for df in frames:
+        end = offset + len(df)
+        for name, values in columns.items():
+            values[offset:end] = df[name].to_numpy()
+        offset = end
+    
+    return pd.DataFrame(columns, copy=False)
+
+def upsert_returns(client, df: pd.DataFrame, chunk: int = 1000) -> int:
+    """Upsert the asset_returns columns of the combined frame in chunked, concurrent requests"""
+    returns_df = pd.DataFrame({
+        'asset_ticker': df['asset_ticker'].astype(str),
+        'return_date': df['return_date'].dt.strftime('%Y-%m-%d'),
+        'monthly_return': df['monthly_return']
+    })
+    return upsert_in_batches(client, frame_to_records(returns_df), batch_size=chunk)
+
 def validate_data_quality(df: pd.DataFrame) -> Dict[str, any]:
     """Validate data quality and return statistics"""
+    # Counts straight off the returns array, without materializing filtered DataFrames
+    returns = df['monthly_return'].to_numpy()
+    
     stats = {
         'total_rows': len(df),
         'unique_assets': df['asset_ticker'].nunique(),
@@ -132,65 +247,119 @@ def validate_data_quality(df: pd.DataFrame) -> Dict[str, any]:
             'end': df['return_date'].max()
         },
         'data_quality': {
-            'missing_returns': df['monthly_return'].isna().sum(),
-            'extreme_returns': len(df[(df['monthly_return'] < -0.5) | (df['monthly_return'] > 1.0)]),
-            'zero_returns': len(df[df['monthly_return'] == 0])
+            'missing_returns': int(np.isnan(returns).sum()),
+            'extreme_returns': int(((returns < -0.5) | (returns > 1.0)).sum()),
+            'zero_returns': int((returns == 0.0).sum())
         },
         'asset_coverage': {}
     }
     
-    # Asset coverage analysis
-    for asset in df['asset_ticker'].unique():
-        asset_data = df[df['asset_ticker'] == asset]
-        stats['asset_coverage'][asset] = {
-            'months': len(asset_data),
-            'start_date': asset_data['return_date'].min(),
-            'end_date': asset_data['return_date'].max(),
-            'avg_return': asset_data['monthly_return'].mean(),
-            'volatility': asset_data['monthly_return'].std()
-        }
+    # Asset coverage analysis (one grouped pass instead of a filtered copy per asset)
+    by_asset = df.groupby('asset_ticker', sort=False, observed=True)
+    coverage = pd.DataFrame({
+        'months': by_asset.size(),
+        'start_date': by_asset['return_date'].min(),
+        'end_date': by_asset['return_date'].max(),
+        'avg_return': by_asset['monthly_return'].mean(),
+        'volatility': by_asset['monthly_return'].std()
+    })
+    stats['asset_coverage'] = coverage.to_dict('index')
     
     return stats
 
+if njit is not None:
+    @njit(cache=True)
+    def _asset_metrics(returns, starts):
+        """Total/annualized return, annualized volatility, Sharpe and max drawdown per contiguous asset block"""
+        out = np.empty((starts.size, 5))
+        for g in range(starts.size):
+            end = starts[g + 1] if g + 1 < starts.size else returns.size
+            log_growth = 0.0
+            log_peak = -np.inf
+            max_drawdown = np.nan
+            count = 0
+            mean = 0.0
+            m2 = 0.0
+            for i in range(starts[g], end):
+                r = returns[i]
+                if np.isnan(r):
+                    continue
+                # Welford update for mean/std, running peak for drawdown
+                count += 1
+                delta = r - mean
+                mean += delta / count
+                m2 += delta * (r - mean)
+                # Compound in log space: sums are more stable than long products
+                log_growth += np.log1p(r)
+                log_peak = max(log_peak, log_growth)
+                drawdown = np.expm1(log_growth - log_peak)
+                if not drawdown >= max_drawdown:
+                    max_drawdown = drawdown
+            
+            annualized_return = (1.0 + mean) ** 12 - 1.0 if count > 0 else np.nan
+            annualized_volatility = np.sqrt(m2 / (count - 1)) * np.sqrt(12.0) if count > 1 else np.nan
+            out[g, 0] = np.expm1(log_growth)
+            out[g, 1] = annualized_return
+            out[g, 2] = annualized_volatility
+            out[g, 3] = annualized_return / annualized_volatility if annualized_volatility > 0 else 0.0
+            out[g, 4] = max_drawdown
+        return out
+else:
+    _asset_metrics = None
+
 def calculate_performance_metrics(df: pd.DataFrame) -> pd.DataFrame:
     """Calculate performance metrics for each asset"""
-    metrics = []
+    df = df.sort_values(['asset_ticker', 'return_date'])
+    by_asset = df['asset_ticker']
+    returns = df.groupby(by_asset, sort=False, observed=True)['monthly_return']
+    dates = df.groupby(by_asset, sort=False, observed=True)['return_date']
     
-    for asset in df['asset_ticker'].unique():
-        asset_data = df[df['asset_ticker'] == asset].copy()
-        asset_data = asset_data.sort_values('return_date')
-        
-        if len(asset_data) < 12:  # Need at least 1 year of data
-            continue
-        
-        # Calculate metrics
-        monthly_returns = asset_data['monthly_return']
-        total_return = (1 + monthly_returns).prod() - 1
-        annualized_return = (1 + monthly_returns.mean()) ** 12 - 1
-        annualized_volatility = monthly_returns.std() * (12 ** 0.5)
-        sharpe_ratio = annualized_return / annualized_volatility if annualized_volatility > 0 else 0
+    if _asset_metrics is not None:
+        # Compiled single pass over each asset's block of the sorted return array
+        tickers = by_asset.to_numpy(dtype=object)
+        new_block = np.ones(len(tickers), dtype=bool)
+        new_block[1:] = tickers[1:] != tickers[:-1]
+        starts = np.flatnonzero(new_block)
+        metrics = pd.DataFrame(
+            _asset_metrics(df['monthly_return'].to_numpy(dtype=np.float64), starts),
+            index=tickers[starts],
+            columns=['total_return', 'annualized_return', 'annualized_volatility', 'sharpe_ratio', 'max_drawdown']
+        )
+    else:
+        # Compound in log space: sums are more stable than long products
+        log_growth = np.log1p(df['monthly_return'].astype(np.float64))
         
-        # Calculate max drawdown
-        cumulative_returns = (1 + monthly_returns).cumprod()
-        running_max = cumulative_returns.expanding().max()
-        drawdown = (cumulative_returns - running_max) / running_max
-        max_drawdown = drawdown.min()
+        # Calculate max drawdown against each asset's running peak (log cum - log peak = log(cum / peak))
+        log_cumulative = log_growth.groupby(by_asset, sort=False, observed=True).cumsum()
+        log_running_max = log_cumulative.groupby(by_asset, sort=False, observed=True).cummax()
+        drawdown = np.expm1(log_cumulative - log_running_max)
         
-        metrics.append({
-            'asset_ticker': asset,
-            'total_return': total_return,
-            'annualized_return': annualized_return,
-            'annualized_volatility': annualized_volatility,
-            'sharpe_ratio': sharpe_ratio,
-            'max_drawdown': max_drawdown,
-            'months_of_data': len(asset_data),
-            'start_date': asset_data['return_date'].min(),
-            'end_date': asset_data['return_date'].max()
+        # Calculate metrics for every asset in one grouped pass per statistic
+        metrics = pd.DataFrame({
+            'total_return': np.expm1(log_growth.groupby(by_asset, sort=False, observed=True).sum()),
+            'annualized_return': (1 + returns.mean()) ** 12 - 1,
+            'annualized_volatility': returns.std() * (12 ** 0.5),
+            'max_drawdown': drawdown.groupby(by_asset, sort=False, observed=True).min()
         })
+        volatility = metrics['annualized_volatility']
+        metrics.insert(3, 'sharpe_ratio', (metrics['annualized_return'] / volatility).where(volatility > 0, 0))
     
-    return pd.DataFrame(metrics)
+    metrics['months_of_data'] = returns.size()
+    metrics['start_date'] = dates.min()
+    metrics['end_date'] = dates.max()
+    
+    # Need at least 1 year of data
+    metrics = metrics[metrics['months_of_data'] >= 12]
+    return metrics.rename_axis('asset_ticker').reset_index()
 
 def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Fetch monthly returns for all tracked assets')
+    parser.add_argument('--csv', action='store_true', help='Also write CSV copies of the outputs (read by upload_to_supabase.py and check_csv.py)')
+    parser.add_argument('--upload', action='store_true', help='Upsert the monthly returns into Supabase (needs SUPABASE_URL and SUPABASE_KEY)')
+    args = parser.parse_args()
+    
     logger.info("="*80)
     logger.info("ENHANCED ASSET DATA FETCHER")
     logger.info("="*80)
@@ -199,31 +368,40 @@ def main():
     logger.info("")
     
     all_data = []
-    failed_assets = []
-    successful_assets = []
+    failed_assets = set()
+    successful_assets = set()
     
-    # Fetch data for each asset
-    for i, ticker in enumerate(ALL_ASSETS, 1):
-        logger.info(f"[{i}/{len(ALL_ASSETS)}] Processing {ticker}")
-        df = fetch_asset_returns(ticker)
-        
-        if df is not None:
-            all_data.append(df)
-            successful_assets.append(ticker)
-        else:
-            failed_assets.append(ticker)
-        
-        # Add delay between requests to be respectful
-        if i < len(ALL_ASSETS):
-            time.sleep(0.5)
+    # Batched downloads first; anything they missed is retried per ticker with backoff
+    bulk_data = fetch_assets_bulk(ALL_ASSETS)
+    for ticker, df in bulk_data.items():
+        all_data.append(df)
+        successful_assets.add(ticker)
+    
+    remaining = [ticker for ticker in ALL_ASSETS if ticker not in bulk_data]
+    if remaining:
+        logger.info(f"Retrying {len(remaining)} assets individually")
+        with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(remaining))) as executor:
+            futures = {executor.submit(fetch_asset_returns, ticker): ticker for ticker in remaining}
+            for i, future in enumerate(as_completed(futures), 1):
+                ticker = futures[future]
+                df = future.result()
+                logger.info(f"[{i}/{len(remaining)}] Processed {ticker}")
+                
+                if df is not None:
+                    all_data.append(df)
+                    successful_assets.add(ticker)
+                else:
+                    failed_assets.add(ticker)
     
     if not all_data:
         logger.error("No data retrieved for any assets!")
         return
     
     # Combine all data
-    combined_df = pd.concat(all_data, ignore_index=True)
+    combined_df = combine_asset_frames(all_data)
+    combined_df['asset_ticker'] = combined_df['asset_ticker'].astype('category')  # ~90 tickers -> 1-byte codes
     combined_df = combined_df.sort_values(['asset_ticker', 'return_date'])
+    logger.info(f"Combined data: {len(combined_df)} rows, {combined_df.memory_usage(deep=True).sum() / 1e6:.1f} MB in memory")
     
     # Validate data quality
     logger.info("\n" + "="*80)
@@ -234,7 +412,7 @@ def main():
     logger.info(f"Total rows: {quality_stats['total_rows']}")
     logger.info(f"Successful assets: {quality_stats['unique_assets']}")
     logger.info(f"Failed assets: {len(failed_assets)}")
-    logger.info(f"Date range: {quality_stats['date_range']['start']} to {quality_stats['date_range']['end']}")
+    logger.info(f"Date range: {quality_stats['date_range']['start']:%Y-%m-%d} to {quality_stats['date_range']['end']:%Y-%m-%d}")
     
     if quality_stats['data_quality']['missing_returns'] > 0:
         logger.warning(f"Missing returns: {quality_stats['data_quality']['missing_returns']}")
@@ -255,22 +433,42 @@ def main():
     # Save data
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     
-    # Main data file
-    main_filename = 'all_asset_returns.csv'
-    combined_df.to_csv(main_filename, index=False)
+    # Attach asset metadata once as low-cardinality categoricals
+    metadata_df = pd.DataFrame.from_dict(ASSET_METADATA, orient='index').rename(columns={'name': 'asset_name', 'category': 'asset_category'})
+    metadata_df = metadata_df.astype({'asset_name': 'category', 'asset_category': 'category'})
+    output_df = combined_df.merge(metadata_df, left_on='asset_ticker', right_index=True, how='left')
+    
+    # Main data file (Parquet stores return_date as a native timestamp column)
+    main_filename = 'all_asset_returns.parquet'
+    output_df.to_parquet(main_filename, compression='snappy', index=False)
     logger.info(f"\n✓ Main data saved to: {main_filename}")
     
     # Performance metrics
-    metrics_filename = f'asset_performance_metrics_{timestamp}.csv'
-    performance_df.to_csv(metrics_filename, index=False)
+    metrics_filename = f'asset_performance_metrics_{timestamp}.parquet'
+    performance_df.to_parquet(metrics_filename, compression='snappy', index=False)
     logger.info(f"✓ Performance metrics saved to: {metrics_filename}")
     
+    if args.csv:
+        output_df.to_csv('all_asset_returns.csv', index=False, date_format='%Y-%m-%d')
+        performance_df.to_csv(f'asset_performance_metrics_{timestamp}.csv', index=False, date_format='%Y-%m-%d')
+        logger.info("✓ CSV copies saved")
+    
     # Quality report
     quality_filename = f'data_quality_report_{timestamp}.json'
     with open(quality_filename, 'w') as f:
-        json.dump(quality_stats, f, indent=2, default=str)
+        json.dump(quality_stats, f, indent=2, default=lambda o: o.strftime('%Y-%m-%d') if isinstance(o, pd.Timestamp) else str(o))
     logger.info(f"✓ Quality report saved to: {quality_filename}")
     
+    if args.upload:
+        logger.info("\n" + "="*80)
+        logger.info("SUPABASE UPLOAD")
+        logger.info("="*80)
+        try:
+            uploaded = upsert_returns(create_supabase_client(), combined_df)
+            logger.info(f"✓ Upserted {uploaded} rows into asset_returns")
+        except Exception as e:
+            logger.error(f"Upload failed: {e}")
+    
     # Summary by category
     logger.info("\n" + "="*80)
     logger.info("SUMMARY BY CATEGORY")
@@ -1,20 +1,7 @@
-import yfinance as yf
-import pandas as pd
-from datetime import datetime
+from spy_fetcher import fetch_spy
 
-# Fetch data with auto_adjust=False to get 'Adj Close' column
-spy = yf.download('SPY', start='2000-01-01', end=datetime.today().strftime('%Y-%m-%d'), auto_adjust=False)
-
-# Now 'Adj Close' exists
-monthly_prices = spy['Adj Close'].resample('M').last()
-monthly_returns = monthly_prices.pct_change().dropna()
-
-# Create dataframe
-df = pd.DataFrame({
-    'date': monthly_returns.index.strftime('%Y-%m-%d'),
-    'asset': 'SPY',
-    'monthly_return': monthly_returns.values
-})
+# Monthly returns from Yahoo's 'Adj Close' column (cached per day on disk)
+df = fetch_spy('adj_close')
 
 # Statistics
 mean_return = df['monthly_return'].mean()
@@ -0,0 +1,53 @@
+"""
+On-disk parquet cache for daily Yahoo Finance history, shared by the fetch scripts
+"""
+
+import os
+import logging
+from pathlib import Path
+from typing import Callable, Optional
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Keyed by (ticker, variant, start, end); end is a day, so re-runs on the same day skip Yahoo.
+# Storing a new end replaces the older ends for the same (ticker, variant, start)
+HISTORY_CACHE_DIR = Path(os.getenv('FARGASON_CACHE_DIR', Path.home() / '.cache' / 'fargason')) / 'history'
+
+def _history_path(ticker: str, start: str, end: str, variant: str) -> Path:
+    return HISTORY_CACHE_DIR / f"{ticker}_{variant}_{start}_{end}.parquet"
+
+def load_history(ticker: str, start: str, end: str, variant: str = 'history') -> Optional[pd.DataFrame]:
+    """Return cached daily history, or None on a miss"""
+    try:
+        return pd.read_parquet(_history_path(ticker, start, end, variant))
+    except Exception:
+        return None
+
+def store_history(ticker: str, start: str, end: str, data: pd.DataFrame, variant: str = 'history') -> None:
+    """Write daily history to the cache (best-effort), dropping entries with an older end"""
+    if data.empty:
+        return
+    path = _history_path(ticker, start, end, variant)
+    try:
+        HISTORY_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        data.to_parquet(path)
+    except Exception as e:
+        logger.warning(f"Could not cache history for {ticker}: {e}")
+        return
+    
+    # Earlier days' files for this key are superseded, so the cache holds one file per key
+    for stale in HISTORY_CACHE_DIR.glob(f"{ticker}_{variant}_{start}_*.parquet"):
+        if stale != path:
+            try:
+                stale.unlink()
+            except OSError:
+                pass
+
+def cached_history(ticker: str, start: str, end: str, fetch: Callable[[], pd.DataFrame], variant: str = 'history') -> pd.DataFrame:
+    """Return daily history from the cache, calling fetch() and caching its result on a miss"""
+    data = load_history(ticker, start, end, variant)
+    if data is None:
+        data = fetch()
+        store_history(ticker, start, end, data, variant)
+    return data
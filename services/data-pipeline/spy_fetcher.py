@@ -0,0 +1,73 @@
+"""
+Shared SPY history fetch and monthly-return calculation for the fetch_spy_*.py scripts
+"""
+
+import yfinance as yf
+import pandas as pd
+from datetime import datetime
+from typing import Literal
+from price_cache import cached_history
+
+# Download window end, fixed once per run
+END_DATE = datetime.today().strftime('%Y-%m-%d')
+
+# 'close': raw Close, 'adj_close': Yahoo's Adj Close, 'auto_adjust': Close adjusted by yfinance (total return)
+SpyMode = Literal['close', 'adj_close', 'auto_adjust']
+
+def fetch_spy_history(mode: SpyMode = 'auto_adjust', start: str = '2000-01-01', end: str = END_DATE) -> pd.DataFrame:
+    """Daily SPY history (cached per day on disk); see SpyMode for what the price columns hold"""
+    spy = yf.Ticker('SPY')
+    if mode == 'auto_adjust':
+        return cached_history('SPY', start, end, lambda: spy.history(start=start, end=end, auto_adjust=True))
+    # Unadjusted history carries both the raw Close and Adj Close
+    return cached_history('SPY', start, end, lambda: spy.history(start=start, end=end, auto_adjust=False), variant='history_unadjusted')
+
+def monthly_returns_frame(prices: pd.Series) -> pd.DataFrame:
+    """Month-end simple returns in the date/asset/monthly_return layout of the spy_*.csv files"""
+    monthly_prices = prices.resample('ME').last()
+    monthly_returns = monthly_prices.pct_change().dropna()
+    return pd.DataFrame({
+        'date': monthly_returns.index.strftime('%Y-%m-%d'),
+        'asset': 'SPY',
+        'monthly_return': monthly_returns.values
+    })
+
+def fetch_spy(mode: SpyMode = 'auto_adjust', start: str = '2000-01-01', end: str = END_DATE) -> pd.DataFrame:
+    """Monthly SPY returns for the given price mode (empty if Yahoo returned no data)"""
+    hist = fetch_spy_history(mode, start, end)
+    if hist.empty:
+        return monthly_returns_frame(pd.Series(dtype='float64', index=pd.DatetimeIndex([])))
+    return monthly_returns_frame(hist['Adj Close' if mode == 'adj_close' else 'Close'])
+
+def print_return_report(df: pd.DataFrame, statistics_title: str = "RETURN STATISTICS:") -> None:
+    """Print the head/tail, date range and return statistics shared by the SPY scripts"""
+    print("\n" + "="*60)
+    print("FIRST 10 ROWS OF DATA:")
+    print("="*60)
+    print(df.head(10))
+    
+    print("\n" + "="*60)
+    print("LAST 10 ROWS OF DATA:")
+    print("="*60)
+    print(df.tail(10))
+    
+    # Show summary statistics
+    print("\n" + "="*60)
+    print("DATA SUMMARY:")
+    print("="*60)
+    print(f"Total months of data: {len(df)}")
+    print(f"Date range: {df['date'].min()} to {df['date'].max()}")
+    
+    print("\n" + "="*60)
+    print(statistics_title)
+    print("="*60)
+    mean_return = df['monthly_return'].mean()
+    std_return = df['monthly_return'].std()
+    best_month = df['monthly_return'].max()
+    worst_month = df['monthly_return'].min()
+    
+    print(f"Mean monthly return: {mean_return:.4f} ({mean_return*100:.2f}%)")
+    print(f"Annualized return (approximate): {(pow(1 + mean_return, 12) - 1)*100:.2f}%")
+    print(f"Monthly std deviation: {std_return:.4f} ({std_return*100:.2f}%)")
+    print(f"Best month: {best_month:.4f} ({best_month*100:.2f}%)")
+    print(f"Worst month: {worst_month:.4f} ({worst_month*100:.2f}%)")
@@ -0,0 +1,12 @@
+-- First/last return date and month count per ticker, used by check_assets.py.
+-- Aggregating server-side returns one row per ticker instead of every monthly row.
+create or replace function asset_date_range(tickers text[])
+returns table (asset_ticker text, min date, max date, count bigint)
+language sql
+stable
+as $$
+    select r.asset_ticker, min(r.return_date), max(r.return_date), count(*)
+    from asset_returns r
+    where r.asset_ticker = any(tickers)
+    group by r.asset_ticker;
+$$;
@@ -0,0 +1,14 @@
+-- Content hash per (asset_ticker, return_date), used by upload_to_supabase.py to skip unchanged rows.
+-- row_hash is written by the uploader (pandas hash_pandas_object over the data columns), so only
+-- rows that are new or whose hash differs are re-sent.
+alter table asset_returns add column if not exists row_hash bigint;
+
+create or replace function asset_return_hashes()
+returns table (asset_ticker text, return_date date, row_hash bigint)
+language sql
+stable
+as $$
+    -- Stable order so the caller's LIMIT/OFFSET pages neither skip nor repeat rows
+    select r.asset_ticker, r.return_date, r.row_hash from asset_returns r
+    order by r.asset_ticker, r.return_date;
+$$;
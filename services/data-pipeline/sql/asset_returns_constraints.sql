@@ -0,0 +1,6 @@
+-- Return sanity rules for asset_returns, enforced on every insert/upsert/COPY.
+-- upload_to_supabase.py relies on these instead of scanning returns client-side;
+-- a violating row fails its batch (or the COPY), which is reported as an upload error.
+alter table asset_returns
+    alter column monthly_return set not null,
+    add constraint monthly_return_range check (monthly_return between -1 and 5);
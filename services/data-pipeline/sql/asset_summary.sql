@@ -0,0 +1,15 @@
+-- Row count, distinct ticker count and a sample of tickers, used by check_schema.py.
+-- One round-trip instead of a count query plus a full distinct-ticker download.
+create or replace function asset_summary()
+returns table (n_rows bigint, n_tickers bigint, sample text[])
+language sql
+stable
+as $$
+    select
+        count(*),
+        count(distinct r.asset_ticker),
+        (select array_agg(t.asset_ticker) from (
+            select distinct asset_ticker from asset_returns order by asset_ticker limit 10
+        ) t)
+    from asset_returns r;
+$$;
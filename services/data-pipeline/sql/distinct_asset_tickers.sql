@@ -0,0 +1,9 @@
+-- Distinct tickers in asset_returns, used by dynamic_asset_fetcher.py.
+-- Returns one row per ticker instead of shipping every monthly row to the client.
+create or replace function distinct_asset_tickers()
+returns table (asset_ticker text)
+language sql
+stable
+as $$
+    select distinct r.asset_ticker from asset_returns r;
+$$;
@@ -0,0 +1,10 @@
+-- Row count, distinct ticker count and date range of asset_returns, used by upload_to_supabase.py.
+-- Verifies an upload in one round-trip over a single row instead of selecting every ticker and date.
+create or replace function get_asset_returns_summary()
+returns table (n_rows bigint, distinct_assets bigint, min_date date, max_date date)
+language sql
+stable
+as $$
+    select count(*), count(distinct r.asset_ticker), min(r.return_date), max(r.return_date)
+    from asset_returns r;
+$$;
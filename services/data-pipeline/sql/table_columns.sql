@@ -0,0 +1,12 @@
+-- Column names of a public table in ordinal order, used by check_schema.py.
+-- Reads the catalog instead of fetching a sample row just to inspect its keys.
+create or replace function table_columns(tbl text)
+returns setof text
+language sql
+stable
+as $$
+    select c.column_name::text
+    from information_schema.columns c
+    where c.table_schema = 'public' and c.table_name = tbl
+    order by c.ordinal_position;
+$$;
@@ -1,11 +1,25 @@
+import numpy as np
+import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from supabase import create_client, Client
 import logging
 import os
-from typing import Dict, List, Optional
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, TextIO
+import io
 import json
 from datetime import datetime
 import time
+from collections import deque
+from pathlib import Path
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -15,18 +29,78 @@ logger = logging.getLogger(__name__)
 SUPABASE_URL = os.getenv('SUPABASE_URL', 'https://rhysciwzmjleziieeugv.supabase.co')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY', 'sb_secret_czW-rrfW4crbk0v6GDPFBQ_EaM-N1dA')
 
+# Initial loads into an empty table go through Postgres COPY over SUPABASE_DB_URL when it is set
+SUPABASE_DB_URL = os.getenv('SUPABASE_DB_URL')
+
+# Worker processes for the batched upload (each with its own client and thread pool);
+# 1 keeps everything in-process
+UPLOAD_PROCESSES = int(os.getenv('UPLOAD_PROCESSES', '1'))
+
+# Tuned batch sizes, keyed by table and average row payload size, so later runs skip tuning
+BATCH_SIZE_CACHE = Path(os.getenv('FARGASON_CACHE_DIR', Path.home() / '.cache' / 'fargason')) / 'batch_sizes.json'
+
+# One keep-alive pool for all batch upserts, sized above the upload concurrency so
+# concurrent batches reuse warm connections instead of re-handshaking TLS. Throttling
+# (429/503) is handled reactively with exponential backoff (honouring Retry-After);
+# upserts merge on the primary key, so retrying a POST is safe
+UPLOAD_SESSION = requests.Session()
+UPLOAD_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=32,
+    max_retries=Retry(
+        total=5,
+        backoff_factor=1,
+        status_forcelist=[429, 503],
+        allowed_methods=None
+    )
+))
+
 def create_supabase_client() -> Client:
-    """Create and test Supabase client connection"""
+    """Create the Supabase client (connectivity is checked by the first real request)"""
     try:
         client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        # Test connection
-        result = client.table('asset_returns').select('*').limit(1).execute()
-        logger.info("✓ Successfully connected to Supabase")
+        logger.info("✓ Created Supabase client")
         return client
     except Exception as e:
         logger.error(f"Failed to connect to Supabase: {e}")
         raise
 
+def load_returns_csv(path: str) -> pd.DataFrame:
+    """Parse the returns CSV with PyArrow's multithreaded reader, keeping return_date as the ISO string that gets uploaded"""
+    # Only the asset_returns columns are parsed; the price/volume/metadata columns in the file are skipped
+    table = pa_csv.read_csv(
+        path,
+        read_options=pa_csv.ReadOptions(use_threads=True, block_size=8 << 20),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=['asset_ticker', 'return_date', 'monthly_return'],
+            column_types={'asset_ticker': pa.string(), 'return_date': pa.string(), 'monthly_return': pa.float64()}
+        )
+    )
+    return table.to_pandas()
+
+def load_returns_parquet(path: str) -> pd.DataFrame:
+    """Read the asset_returns columns of fetch_all_assets.py's Parquet output, with return_date as an ISO string"""
+    table = pq.read_table(path, columns=['asset_ticker', 'return_date', 'monthly_return'])
+    # Parquet stores return_date as a timestamp; date32 casts to string as YYYY-MM-DD
+    return_date = pc.cast(pc.cast(table['return_date'], pa.date32(), safe=False), pa.string())
+    return table.set_column(table.schema.get_field_index('return_date'), 'return_date', return_date).to_pandas()
+
+def upsert_batch(client: Client, body: bytes, table: str = 'asset_returns') -> None:
+    """Upsert one pre-encoded JSON batch straight to PostgREST over the shared session"""
+    response = UPLOAD_SESSION.post(
+        f"{client.supabase_url}/rest/v1/{table}",
+        data=body,
+        headers={
+            'apikey': client.supabase_key,
+            'Authorization': f'Bearer {client.supabase_key}',
+            'Content-Type': 'application/json',
+            # Upsert - existing rows are merged
+            'Prefer': 'resolution=merge-duplicates,return=minimal'
+        },
+        timeout=60
+    )
+    response.raise_for_status()
+
 def validate_data(df: pd.DataFrame) -> Dict[str, any]:
     """Validate data before upload"""
     validation_results = {
@@ -46,74 +120,282 @@ def validate_data(df: pd.DataFrame) -> Dict[str, any]:
     if not validation_results['valid']:
         return validation_results
     
+    # Missing and out-of-range returns are rejected by the database (sql/asset_returns_constraints.sql)
+    tickers = df['asset_ticker'].to_numpy()
+    
+    # Duplicates on the upsert key are what matter; hashing two columns is cheaper than whole rows
+    duplicate_keys = int(df.duplicated(subset=['asset_ticker', 'return_date']).sum())
+    
+    # Type checks the database would otherwise reject row by row: a parseable ISO date and a non-empty ticker
+    bad_dates = int(pd.to_datetime(df['return_date'], format='%Y-%m-%d', errors='coerce').isna().sum())
+    bad_tickers = int((df['asset_ticker'].fillna('').str.len() == 0).sum())
+    for count, what in ((bad_dates, 'unparseable return_date values'),
+                        (bad_tickers, 'empty asset_ticker values')):
+        if count > 0:
+            validation_results['errors'].append(f"Found {count} {what}")
+            validation_results['valid'] = False
+    
     # Data quality checks
     validation_results['stats'] = {
         'total_rows': len(df),
-        'unique_assets': df['asset_ticker'].nunique(),
+        'unique_assets': pd.unique(tickers).size,
         'date_range': {
             'start': df['return_date'].min(),
             'end': df['return_date'].max()
         },
-        'missing_values': df.isnull().sum().to_dict(),
-        'duplicate_rows': df.duplicated().sum()
+        'missing_values': dict(zip(df.columns, df.isna().to_numpy().sum(axis=0).tolist())),
+        'duplicate_rows': duplicate_keys
     }
     
-    # Check for extreme values
-    extreme_returns = df[(df['monthly_return'] < -0.5) | (df['monthly_return'] > 1.0)]
-    if len(extreme_returns) > 0:
-        validation_results['warnings'].append(f"Found {len(extreme_returns)} extreme returns (>50% or >100%)")
-    
-    # Check for missing returns
-    missing_returns = df['monthly_return'].isnull().sum()
-    if missing_returns > 0:
-        validation_results['warnings'].append(f"Found {missing_returns} missing returns")
+    # Postgres rejects a batch that upserts the same key twice
+    if duplicate_keys > 0:
+        validation_results['warnings'].append(f"Found {duplicate_keys} duplicate (asset_ticker, return_date) rows")
     
     return validation_results
 
-def upload_data_in_batches(client: Client, df: pd.DataFrame, batch_size: int = 1000) -> Dict[str, any]:
-    """Upload data in batches with progress tracking"""
-    logger.info(f"Starting upload of {len(df)} rows in batches of {batch_size}")
+def upload_data_in_batches(client: Client, df: pd.DataFrame, batch_size: int = 2000, concurrency: int = 8) -> Dict[str, any]:
+    """Upload data in batches with progress tracking, keeping up to `concurrency` batches in flight"""
+    logger.info(f"Starting upload of {len(df)} rows in batches of {batch_size} ({concurrency} concurrent)")
+    t0 = time.perf_counter_ns()
     
     upload_stats = {
         'total_rows': len(df),
         'batches_processed': 0,
         'rows_uploaded': 0,
         'rows_failed': 0,
-        'errors': [],
+        # Bounded, so a run of failing batches can't grow the report without limit
+        'errors': deque(maxlen=100),
         'start_time': datetime.now()
     }
     
-    # Convert to list of dictionaries
-    records = df.to_dict('records')
-    total_batches = (len(records) + batch_size - 1) // batch_size
+    # Pull each column out once as native Python values (dates as strings for JSON);
+    # per-row dicts are only built one batch at a time
+    columns = list(df.columns)
+    column_values = [
+        (df[c].astype(str) if c == 'return_date' else df[c]).to_numpy().tolist()
+        for c in columns
+    ]
+    total_rows = len(df)
+    total_batches = (total_rows + batch_size - 1) // batch_size
+    dict_ = dict
     
-    for i in range(0, len(records), batch_size):
-        batch = records[i:i + batch_size]
-        batch_num = (i // batch_size) + 1
+    # Per-batch request latency and outcome, indexed by batch number - 1
+    latency_ns = np.zeros(total_batches, dtype=np.int64)
+    ok = np.zeros(total_batches, dtype=bool)
+    
+    def upload_batch(start: int) -> int:
+        batch = [dict_(zip(columns, row)) for row in zip(*(values[start:start + batch_size] for values in column_values))]
+        
+        # Encoded once with orjson; transport retries resend the same bytes
+        body = orjson.dumps(batch)
         
+        # Use upsert to handle duplicates
+        t_start = time.perf_counter_ns()
         try:
-            logger.info(f"Uploading batch {batch_num}/{total_batches} ({len(batch)} rows)")
-            
-            # Use upsert to handle duplicates
-            result = client.table('asset_returns').upsert(batch).execute()
-            
-            upload_stats['rows_uploaded'] += len(batch)
-            upload_stats['batches_processed'] += 1
-            
-            logger.info(f"✓ Batch {batch_num} uploaded successfully")
+            upsert_batch(client, body)
+        finally:
+            latency_ns[start // batch_size] = time.perf_counter_ns() - t_start
+        return len(batch)
+    
+    # Batches are independent upserts, so they can overlap on a bounded thread pool
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, total_batches))) as executor:
+        futures = {executor.submit(upload_batch, i): i for i in range(0, total_rows, batch_size)}
+        for future in as_completed(futures):
+            start = futures[future]
+            batch_num = (start // batch_size) + 1
             
-            # Add small delay between batches to be respectful
-            if batch_num < total_batches:
-                time.sleep(0.5)
+            try:
+                uploaded = future.result()
+                ok[batch_num - 1] = True
+                upload_stats['rows_uploaded'] += uploaded
+                upload_stats['batches_processed'] += 1
+                
+                logger.info(f"✓ Batch {batch_num}/{total_batches} uploaded successfully ({uploaded} rows, {latency_ns[batch_num - 1] / 1e6:.0f} ms)")
                 
+            except Exception as e:
+                error_msg = f"Error in batch {batch_num}: {str(e)}"
+                logger.error(error_msg)
+                upload_stats['errors'].append(error_msg)
+                upload_stats['rows_failed'] += min(batch_size, total_rows - start)
+    
+    # Connections opened vs batches sent shows whether keep-alive held across the upload
+    pool = UPLOAD_SESSION.get_adapter(client.supabase_url).poolmanager.connection_from_url(client.supabase_url)
+    logger.info(f"Uploaded {total_batches} batches over {pool.num_connections} HTTP connections")
+    
+    upload_stats['latency_ns'] = latency_ns[ok]
+    if ok.any():
+        p50, p95, p99 = np.percentile(latency_ns[ok], [50, 95, 99]) / 1e6
+        upload_stats['batch_latency_ms'] = {'p50': p50, 'p95': p95, 'p99': p99}
+    
+    upload_stats['end_time'] = datetime.now()
+    upload_stats['duration'] = (time.perf_counter_ns() - t0) / 1e9
+    
+    return upload_stats
+
+def _upload_shard(shard: pd.DataFrame, batch_size: int) -> Dict[str, any]:
+    """Process-pool worker: upload one shard with its own client and connection pool"""
+    return upload_data_in_batches(create_client(SUPABASE_URL, SUPABASE_KEY), shard, batch_size=batch_size)
+
+def upload_data_in_processes(df: pd.DataFrame, batch_size: int, processes: int) -> Dict[str, any]:
+    """Split the frame into contiguous shards and upload them from separate processes
+    
+    Row-dict building and JSON encoding hold the GIL, so past a point threads in one
+    process stop scaling; each worker process runs the normal threaded batch upload.
+    """
+    logger.info(f"Uploading {len(df)} rows from {processes} processes")
+    t0 = time.perf_counter_ns()
+    start_time = datetime.now()
+    
+    shards = [df.iloc[idx] for idx in np.array_split(np.arange(len(df)), processes) if idx.size]
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=multiprocessing.get_context('spawn')) as executor:
+        results = list(executor.map(_upload_shard, shards, [batch_size] * len(shards)))
+    
+    upload_stats = {
+        'total_rows': len(df),
+        'batches_processed': sum(r['batches_processed'] for r in results),
+        'rows_uploaded': sum(r['rows_uploaded'] for r in results),
+        'rows_failed': sum(r['rows_failed'] for r in results),
+        'errors': deque((e for r in results for e in r['errors']), maxlen=100),
+        'start_time': start_time
+    }
+    
+    latency_ns = np.concatenate([r['latency_ns'] for r in results])
+    upload_stats['latency_ns'] = latency_ns
+    if latency_ns.size:
+        p50, p95, p99 = np.percentile(latency_ns, [50, 95, 99]) / 1e6
+        upload_stats['batch_latency_ms'] = {'p50': p50, 'p95': p95, 'p99': p99}
+    
+    upload_stats['end_time'] = datetime.now()
+    upload_stats['duration'] = (time.perf_counter_ns() - t0) / 1e9
+    
+    return upload_stats
+
+def _records(df: pd.DataFrame) -> List[Dict]:
+    """JSON-ready row dicts (dates as strings)"""
+    columns = list(df.columns)
+    column_values = [
+        (df[c].astype(str) if c == 'return_date' else df[c]).to_numpy().tolist()
+        for c in columns
+    ]
+    return [dict(zip(columns, row)) for row in zip(*column_values)]
+
+def tune_batch_size(client: Client, sample_df: pd.DataFrame, candidates: List[int] = [500, 2000, 5000, 10000], table: str = 'asset_returns') -> int:
+    """Time upserting the sample at each candidate batch size and return the fastest (cached per table, row size and sample size)"""
+    if len(sample_df) < max(candidates):
+        # Too few rows to tell the larger candidates apart (they would all send one request), so
+        # skip tuning rather than cache noise; the smallest size covering the sample sends it whole
+        size = min(c for c in candidates if c >= len(sample_df))
+        logger.info(f"Sample of {len(sample_df)} rows is too small to tune, using batch size {size}")
+        return size
+    
+    records = _records(sample_df)
+    
+    # Rows of similar width share a tuned size; bucket to 16 bytes so small drift doesn't retune
+    avg_row_bytes = len(orjson.dumps(records[:100])) // min(len(records), 100)
+    key = f"{table}:{avg_row_bytes // 16 * 16}:{len(records)}"
+    try:
+        cache = json.loads(BATCH_SIZE_CACHE.read_text())
+    except Exception:
+        cache = {}
+    if key in cache:
+        logger.info(f"Using cached batch size {cache[key]} for {key}")
+        return cache[key]
+    
+    # Upserts are idempotent, so the sample rows can be written once per candidate
+    rows_per_second = {}
+    for size in candidates:
+        start = time.perf_counter()
+        try:
+            for i in range(0, len(records), size):
+                upsert_batch(client, orjson.dumps(records[i:i + size]), table)
         except Exception as e:
-            error_msg = f"Error in batch {batch_num}: {str(e)}"
-            logger.error(error_msg)
-            upload_stats['errors'].append(error_msg)
-            upload_stats['rows_failed'] += len(batch)
+            logger.warning(f"Batch size {size} failed during tuning: {e}")
+            continue
+        rows_per_second[size] = len(records) / (time.perf_counter() - start)
+        logger.info(f"Batch size {size}: {rows_per_second[size]:.0f} rows/s")
+    
+    if not rows_per_second:
+        return candidates[0]
+    best = max(rows_per_second, key=rows_per_second.get)
+    logger.info(f"✓ Tuned batch size: {best}")
+    
+    cache[key] = best
+    try:
+        BATCH_SIZE_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        BATCH_SIZE_CACHE.write_text(json.dumps(cache, indent=2))
+    except Exception as e:
+        logger.warning(f"Could not cache tuned batch size: {e}")
+    return best
+
+def add_row_hashes(df: pd.DataFrame) -> pd.DataFrame:
+    """Attach a stable 64-bit content hash of each row's data columns (stored as asset_returns.row_hash)"""
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return df.assign(row_hash=hashes.view(np.int64))
+
+def fetch_existing_hashes(client: Client, page_size: int = 1000) -> pd.DataFrame:
+    """Fetch (asset_ticker, return_date, row_hash) for every stored row, paging past PostgREST's row cap"""
+    pages = []
+    start = 0
+    while True:
+        page = client.rpc('asset_return_hashes').range(start, start + page_size - 1).execute().data
+        pages.extend(page)
+        if len(page) < page_size:
+            break
+        start += page_size
+    
+    existing = pd.DataFrame(pages, columns=['asset_ticker', 'return_date', 'row_hash'])
+    # Concurrent writes can still shift rows between pages; a repeated key would fan out the merge
+    existing = existing.drop_duplicates(subset=['asset_ticker', 'return_date'], keep='last')
+    # Nullable integer keeps the full 64 bits and marks rows stored before hashing as missing
+    return existing.astype({'row_hash': 'Int64'})
+
+def changed_rows(df: pd.DataFrame, existing: pd.DataFrame) -> pd.DataFrame:
+    """Rows of df that are missing from the database or whose content hash differs"""
+    stored = df[['asset_ticker', 'return_date']].merge(
+        existing.rename(columns={'row_hash': 'stored_hash'}),
+        on=['asset_ticker', 'return_date'],
+        how='left'
+    )['stored_hash']
+    changed = stored.ne(df['row_hash'].to_numpy()).fillna(True).to_numpy(dtype=bool)
+    return df[changed]
+
+def bulk_copy_load(df: pd.DataFrame, chunk_rows: int = 50_000) -> Dict[str, any]:
+    """Load the frame into an empty asset_returns with COPY FROM STDIN over a direct Postgres connection"""
+    import psycopg
+    
+    logger.info(f"Starting COPY of {len(df)} rows into empty asset_returns")
+    t0 = time.perf_counter_ns()
+    upload_stats = {
+        'total_rows': len(df),
+        'batches_processed': 0,
+        'rows_uploaded': 0,
+        'rows_failed': 0,
+        'errors': [],
+        'start_time': datetime.now()
+    }
+    
+    columns = ', '.join(df.columns)
+    try:
+        with psycopg.connect(SUPABASE_DB_URL) as conn:
+            with conn.cursor() as cur:
+                with cur.copy(f"COPY asset_returns ({columns}) FROM STDIN WITH (FORMAT csv)") as copy:
+                    # Stream the CSV in chunks so the whole file is never held as one string
+                    for i in range(0, len(df), chunk_rows):
+                        buf = io.StringIO()
+                        df.iloc[i:i + chunk_rows].to_csv(buf, index=False, header=False)
+                        copy.write(buf.getvalue())
+                        upload_stats['batches_processed'] += 1
+        upload_stats['rows_uploaded'] = len(df)
+        logger.info(f"✓ Copied {len(df)} rows")
+    except Exception as e:
+        # COPY runs in one transaction, so a failure loads nothing
+        error_msg = f"COPY failed: {str(e)}"
+        logger.error(error_msg)
+        upload_stats['errors'].append(error_msg)
+        upload_stats['rows_failed'] = len(df)
     
     upload_stats['end_time'] = datetime.now()
-    upload_stats['duration'] = (upload_stats['end_time'] - upload_stats['start_time']).total_seconds()
+    upload_stats['duration'] = (time.perf_counter_ns() - t0) / 1e9
     
     return upload_stats
 
@@ -122,25 +404,17 @@ def verify_upload(client: Client, original_df: pd.DataFrame) -> Dict[str, any]:
     logger.info("Verifying upload...")
     
     try:
-        # Get total count
-        result = client.table('asset_returns').select("*", count='exact').execute()
-        total_rows = result.count
-        
-        # Get unique assets
-        asset_result = client.table('asset_returns').select("asset_ticker").execute()
-        assets_in_db = pd.DataFrame(asset_result.data)['asset_ticker'].unique()
-        
-        # Get date range
-        date_result = client.table('asset_returns').select("return_date").execute()
-        dates_in_db = pd.DataFrame(date_result.data)['return_date']
+        # Count, distinct assets and date range are aggregated server-side in one call
+        summary = client.rpc('get_asset_returns_summary').execute().data[0]
+        total_rows = summary['n_rows']
         
         verification = {
             'success': True,
             'total_rows_in_db': total_rows,
-            'unique_assets_in_db': len(assets_in_db),
+            'unique_assets_in_db': summary['distinct_assets'],
             'date_range_in_db': {
-                'start': dates_in_db.min(),
-                'end': dates_in_db.max()
+                'start': summary['min_date'],
+                'end': summary['max_date']
             },
             'original_stats': {
                 'total_rows': len(original_df),
@@ -157,81 +431,83 @@ def verify_upload(client: Client, original_df: pd.DataFrame) -> Dict[str, any]:
             verification['warnings'] = verification.get('warnings', [])
             verification['warnings'].append(f"Database has fewer rows ({total_rows}) than original ({len(original_df)})")
         
-        logger.info(f"✓ Verification complete: {total_rows} rows, {len(assets_in_db)} assets")
+        logger.info(f"✓ Verification complete: {total_rows} rows, {summary['distinct_assets']} assets")
         return verification
         
     except Exception as e:
         logger.error(f"Verification failed: {e}")
         return {'success': False, 'error': str(e)}
 
-def generate_upload_report(upload_stats: Dict, validation_results: Dict, verification: Dict) -> str:
-    """Generate a comprehensive upload report"""
-    report = []
-    report.append("="*80)
-    report.append("SUPABASE UPLOAD REPORT")
-    report.append("="*80)
-    report.append(f"Upload completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    report.append("")
+def generate_upload_report(upload_stats: Dict, validation_results: Dict, verification: Dict, out: TextIO) -> None:
+    """Write a comprehensive upload report to `out`, one line at a time"""
+    print("="*80, file=out)
+    print("SUPABASE UPLOAD REPORT", file=out)
+    print("="*80, file=out)
+    print(f"Upload completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", file=out)
+    print(file=out)
     
     # Validation results
-    report.append("DATA VALIDATION:")
-    report.append(f"  Valid: {validation_results['valid']}")
+    print("DATA VALIDATION:", file=out)
+    print(f"  Valid: {validation_results['valid']}", file=out)
     if validation_results['errors']:
-        report.append("  Errors:")
+        print("  Errors:", file=out)
         for error in validation_results['errors']:
-            report.append(f"    - {error}")
+            print(f"    - {error}", file=out)
     if validation_results['warnings']:
-        report.append("  Warnings:")
+        print("  Warnings:", file=out)
         for warning in validation_results['warnings']:
-            report.append(f"    - {warning}")
+            print(f"    - {warning}", file=out)
     
     # Upload statistics
-    report.append("")
-    report.append("UPLOAD STATISTICS:")
-    report.append(f"  Total rows processed: {upload_stats['total_rows']}")
-    report.append(f"  Rows uploaded: {upload_stats['rows_uploaded']}")
-    report.append(f"  Rows failed: {upload_stats['rows_failed']}")
-    report.append(f"  Batches processed: {upload_stats['batches_processed']}")
-    report.append(f"  Duration: {upload_stats['duration']:.2f} seconds")
+    print(file=out)
+    print("UPLOAD STATISTICS:", file=out)
+    print(f"  Total rows processed: {upload_stats['total_rows']}", file=out)
+    print(f"  Rows uploaded: {upload_stats['rows_uploaded']}", file=out)
+    print(f"  Rows failed: {upload_stats['rows_failed']}", file=out)
+    print(f"  Batches processed: {upload_stats['batches_processed']}", file=out)
+    print(f"  Duration: {upload_stats['duration']:.2f} seconds", file=out)
+    if upload_stats.get('batch_latency_ms'):
+        latency = upload_stats['batch_latency_ms']
+        print(f"  Batch latency: p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms, p99 {latency['p99']:.1f} ms", file=out)
     
     if upload_stats['errors']:
-        report.append("  Upload errors:")
+        print("  Upload errors:", file=out)
         for error in upload_stats['errors']:
-            report.append(f"    - {error}")
+            print(f"    - {error}", file=out)
     
     # Verification results
-    report.append("")
-    report.append("VERIFICATION:")
-    report.append(f"  Success: {verification['success']}")
+    print(file=out)
+    print("VERIFICATION:", file=out)
+    print(f"  Success: {verification['success']}", file=out)
     if verification['success']:
-        report.append(f"  Rows in database: {verification['total_rows_in_db']}")
-        report.append(f"  Assets in database: {verification['unique_assets_in_db']}")
-        report.append(f"  Date range: {verification['date_range_in_db']['start']} to {verification['date_range_in_db']['end']}")
+        print(f"  Rows in database: {verification['total_rows_in_db']}", file=out)
+        print(f"  Assets in database: {verification['unique_assets_in_db']}", file=out)
+        print(f"  Date range: {verification['date_range_in_db']['start']} to {verification['date_range_in_db']['end']}", file=out)
     
     if verification.get('warnings'):
-        report.append("  Warnings:")
+        print("  Warnings:", file=out)
         for warning in verification['warnings']:
-            report.append(f"    - {warning}")
-    
-    return "\n".join(report)
+            print(f"    - {warning}", file=out)
 
 def main():
     logger.info("="*80)
     logger.info("ENHANCED SUPABASE DATA UPLOADER")
     logger.info("="*80)
     
-    # Check if data file exists
-    data_file = 'all_asset_returns.csv'
+    # fetch_all_assets.py writes Parquet (CSV only with --csv); an older CSV is the fallback
+    data_file = 'all_asset_returns.parquet'
     if not os.path.exists(data_file):
-        logger.error(f"Data file '{data_file}' not found!")
+        data_file = 'all_asset_returns.csv'
+    if not os.path.exists(data_file):
+        logger.error("Data file 'all_asset_returns.parquet' not found!")
         logger.error("Please run fetch_all_assets.py first to generate the data file.")
         return
     
     # Load data
     logger.info(f"Loading data from {data_file}...")
     try:
-        df = pd.read_csv(data_file)
-        logger.info(f"✓ Loaded {len(df)} rows from CSV")
+        df = load_returns_parquet(data_file) if data_file.endswith('.parquet') else load_returns_csv(data_file)
+        logger.info(f"✓ Loaded {len(df)} rows from {data_file}")
         logger.info(f"Assets: {df['asset_ticker'].unique().tolist()}")
     except Exception as e:
         logger.error(f"Failed to load CSV file: {e}")
@@ -260,25 +536,56 @@ def main():
         logger.error(f"Failed to connect to Supabase: {e}")
         return
     
-    # Upload data
-    logger.info("\nStarting data upload...")
-    upload_stats = upload_data_in_batches(client, df, batch_size=1000)
+    # row_hash is only sent once sql/asset_return_hashes.sql has added the column and its RPC;
+    # before that, PostgREST and COPY would reject every row for the unknown column
+    existing_hashes = None
+    try:
+        existing_hashes = fetch_existing_hashes(client)
+    except Exception as e:
+        logger.warning(f"Row hashes unavailable (apply sql/asset_return_hashes.sql), uploading all rows without them: {e}")
+    
+    if existing_hashes is not None:
+        # Hash after validation so the stats only cover the data columns
+        df = add_row_hashes(df)
+    
+    # An empty table is a cold initial load: COPY it in one set-oriented pass instead of upserting batches
+    table_empty = False
+    if SUPABASE_DB_URL:
+        table_empty = not client.table('asset_returns').select('asset_ticker').limit(1).execute().data
+    
+    if table_empty:
+        logger.info("\nasset_returns is empty, bulk loading with COPY...")
+        upload_stats = bulk_copy_load(df)
+    else:
+        # Only rows that are new or whose content changed need to be sent
+        upload_df = df
+        if existing_hashes is not None:
+            upload_df = changed_rows(df, existing_hashes)
+            logger.info(f"✓ {len(upload_df)} of {len(df)} rows are new or changed")
+        
+        # Pick the batch size on a sample before the full upload
+        logger.info("\nTuning batch size...")
+        batch_size = tune_batch_size(client, upload_df.head(10_000))
+        
+        # Upload data
+        logger.info("\nStarting data upload...")
+        if UPLOAD_PROCESSES > 1 and len(upload_df) > batch_size:
+            upload_stats = upload_data_in_processes(upload_df, batch_size, min(UPLOAD_PROCESSES, os.cpu_count() or 1))
+        else:
+            upload_stats = upload_data_in_batches(client, upload_df, batch_size=batch_size)
     
     # Verify upload
     logger.info("\nVerifying upload...")
     verification = verify_upload(client, df)
     
-    # Generate and save report
-    report = generate_upload_report(upload_stats, validation_results, verification)
-    
-    # Save report to file
+    # Write the report straight to its file
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     report_filename = f'upload_report_{timestamp}.txt'
     with open(report_filename, 'w') as f:
-        f.write(report)
+        generate_upload_report(upload_stats, validation_results, verification, f)
     
     logger.info(f"\n✓ Upload report saved to: {report_filename}")
-    logger.info("\n" + report)
+    logger.info(f"Uploaded {upload_stats['rows_uploaded']} rows ({upload_stats['rows_failed']} failed) in {upload_stats['duration']:.2f} seconds")
     
     # Final status
     if upload_stats['rows_failed'] == 0 and verification['success']:
@@ -0,0 +1,21 @@
+"""
+Gunicorn settings for the MCP server: gunicorn -c gunicorn_conf.py portfolio_mcp_server:app
+"""
+
+import multiprocessing
+import os
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+
+# Requests mostly wait on the portfolio API, so each worker runs a thread per in-flight call.
+# In-process rate limits are per worker; only scale out to 2*cpu+1 workers when Redis shares them
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
+workers = int(os.getenv('WEB_CONCURRENCY', 2 * multiprocessing.cpu_count() + 1 if os.getenv('REDIS_URL') else 1))
+
+# Upstream calls time out at 30s (plus retries); keep client connections open between requests
+timeout = 60
+keepalive = 30
+
+# Pending-connection queue handed to listen(); deeper than the 2048 default to absorb bursts
+backlog = int(os.getenv('GUNICORN_BACKLOG', '4096'))
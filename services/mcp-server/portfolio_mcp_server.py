@@ -1,27 +1,79 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request
+import fastjsonschema
+import orjson
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 import logging
+import math
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import queue
 from datetime import datetime, timedelta
 from functools import wraps
 import time
 from typing import Dict, List, Optional, Any
-import hashlib
-import hmac
+import secrets
+import threading
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Hand records to a background listener so request threads never block on stderr
+_log_queue = queue.SimpleQueue()
+_root_logger = logging.getLogger()
+_log_listener = QueueListener(_log_queue, *_root_logger.handlers, respect_handler_level=True)
+for _handler in _root_logger.handlers[:]:
+    _root_logger.removeHandler(_handler)
+_root_logger.addHandler(QueueHandler(_log_queue))
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
 app = Flask(__name__)
 
+# Compress JSON responses (portfolio results run to hundreds of KB) for clients that accept it
+if Compress is not None:
+    app.config.update(
+        COMPRESS_MIMETYPES=['application/json'],
+        COMPRESS_ALGORITHM=['br', 'gzip'],
+        COMPRESS_LEVEL=5,
+        COMPRESS_BR_LEVEL=5,
+        COMPRESS_MIN_SIZE=1024
+    )
+    Compress(app)
+
 # Configuration from environment variables
 API_ENDPOINT = os.getenv('PORTFOLIO_API_ENDPOINT', 'https://investment-chatbot-1.vercel.app/api/portfolio/calculate')
 API_KEY = os.getenv('PORTFOLIO_API_KEY', '')  # Add API key for authentication
+API_KEY_BYTES = API_KEY.encode()  # encoded once for the constant-time comparison
 RATE_LIMIT_REQUESTS = int(os.getenv('RATE_LIMIT_REQUESTS', '100'))  # requests per hour
 RATE_LIMIT_WINDOW = int(os.getenv('RATE_LIMIT_WINDOW', '3600'))  # 1 hour in seconds
 ALLOWED_ORIGINS = os.getenv('ALLOWED_ORIGINS', '*').split(',')
+REDIS_URL = os.getenv('REDIS_URL', '')  # Shared rate-limit state across workers when set
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv('RATE_LIMIT_MAX_CLIENTS', '100000'))  # tracked IPs before new ones get 503
+
+# CORS preflight headers, built once; every variant lets browsers cache the preflight for a day
+_CORS_COMMON = {
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, X-API-Key',
+    'Access-Control-Max-Age': '86400'
+}
+CORS_HEADERS_WILDCARD = {'Access-Control-Allow-Origin': '*', **_CORS_COMMON} if ALLOWED_ORIGINS == ['*'] else None
+CORS_HEADERS_BY_ORIGIN = {origin: {'Access-Control-Allow-Origin': origin, **_CORS_COMMON} for origin in ALLOWED_ORIGINS}
+CORS_HEADERS_NULL = {'Access-Control-Allow-Origin': 'null', **_CORS_COMMON}
 
 # Server info
 SERVER_INFO = {
@@ -30,37 +82,313 @@ SERVER_INFO = {
     "description": "Enhanced MCP server for portfolio calculations with security and rate limiting"
 }
 
-# Rate limiting storage (in production, use Redis or similar)
-rate_limit_storage = {}
+# Static MCP results, serialized once at import
+_INITIALIZE_RESULT = {
+    "protocolVersion": "2024-11-05",
+    "capabilities": {
+        "tools": {
+            "listChanged": True
+        },
+        "logging": {}
+    },
+    "serverInfo": SERVER_INFO
+}
+_INITIALIZE_RESULT_BYTES = orjson.dumps(_INITIALIZE_RESULT)
+
+_TOOLS_LIST_RESULT = {
+    "tools": [
+        {
+            "name": "calculate_portfolio_returns",
+            "description": (
+                "Calculates historical total returns for a portfolio of ETFs with specified "
+                "asset allocation over a given time period. Returns total return, annualized "
+                "return, volatility, and Sharpe ratio. Use when users ask about portfolio "
+                "performance or want to compare asset allocations. "
+                "Available assets: SPY (S&P 500), AGG (US Bonds), VTI (Total US Stock), "
+                "VXUS (International), BND (Bonds), GLD (Gold), VNQ (Real Estate), "
+                "QQQ (Nasdaq), EEM (Emerging Markets), TLT (Long Treasury), and more."
+            ),
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "assets": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Array of ETF tickers (e.g., ['SPY', 'AGG'])",
+                        "minItems": 1,
+                        "maxItems": 10
+                    },
+                    "weights": {
+                        "type": "array",
+                        "items": {"type": "number", "minimum": 0, "maximum": 1},
+                        "description": "Weights in decimal format summing to 1.0 (e.g., [0.6, 0.4])",
+                        "minItems": 1,
+                        "maxItems": 10
+                    },
+                    "startDate": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "Start date in YYYY-MM-DD format (e.g., '2020-01-01')"
+                    },
+                    "endDate": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "End date in YYYY-MM-DD format (e.g., '2023-12-31')"
+                    },
+                    "rebalanceMonths": {
+                        "type": "integer",
+                        "description": "Rebalancing frequency in months (-1 for never, 12 for annual)",
+                        "minimum": -1,
+                        "maximum": 12,
+                        "default": -1
+                    }
+                },
+                "required": ["assets", "weights", "startDate", "endDate"]
+            }
+        }
+    ]
+}
+_TOOLS_LIST_RESULT_BYTES = orjson.dumps(_TOOLS_LIST_RESULT)
+
+# Checker generated once from the advertised input schema (types, array bounds, date format)
+_validate_tool_args = fastjsonschema.compile(_TOOLS_LIST_RESULT["tools"][0]["inputSchema"])
+
+_TOOLS_HTTP_RESULT = {
+    "tools": [
+        {
+            "name": "calculate_portfolio_returns",
+            "description": "Calculates historical total returns for a portfolio of ETFs",
+            "version": SERVER_INFO["version"],
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "assets": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Array of ETF tickers"
+                    },
+                    "weights": {
+                        "type": "array",
+                        "items": {"type": "number"},
+                        "description": "Weights summing to 1.0"
+                    },
+                    "startDate": {
+                        "type": "string",
+                        "description": "Start date YYYY-MM-DD"
+                    },
+                    "endDate": {
+                        "type": "string",
+                        "description": "End date YYYY-MM-DD"
+                    }
+                },
+                "required": ["assets", "weights", "startDate", "endDate"]
+            }
+        }
+    ]
+}
+_TOOLS_HTTP_BYTES = orjson.dumps(_TOOLS_HTTP_RESULT)
+
+def _rpc_result_bytes(request_id: Any, result_bytes: bytes) -> bytes:
+    """Wrap a pre-serialized result in a JSON-RPC envelope"""
+    return b'{"jsonrpc":"2.0","id":%s,"result":%s}' % (orjson.dumps(request_id), result_bytes)
+
+def _text_result(request_id: Any, text: str) -> bytes:
+    """Serialize a JSON-RPC tool result holding a single text content item"""
+    return _rpc_result_bytes(request_id, b'{"content":[{"type":"text","text":%s}]}' % orjson.dumps(text))
+
+def _err_bytes(request_id: Any, error_bytes: bytes) -> bytes:
+    """Wrap a pre-serialized error object in a JSON-RPC envelope"""
+    return b'{"jsonrpc":"2.0","id":%s,"error":%s}' % (orjson.dumps(request_id), error_bytes)
+
+def _err(request_id: Any, code: int, message: str) -> bytes:
+    """Serialize a JSON-RPC error envelope"""
+    return _err_bytes(request_id, orjson.dumps({"code": code, "message": message}))
+
+# Error objects with fixed messages, serialized once; only the id varies per response
+ERR_NO_DATA = orjson.dumps({"code": -32700, "message": "Parse error: No data provided"})
+ERR_INVALID_JSON = orjson.dumps({"code": -32700, "message": "Parse error: Invalid JSON"})
+ERR_INVALID_VERSION = orjson.dumps({"code": -32600, "message": "Invalid Request: Missing or invalid jsonrpc version"})
+ERR_MISSING_METHOD = orjson.dumps({"code": -32600, "message": "Invalid Request: Missing method"})
+ERR_INVALID_API_KEY = orjson.dumps({"code": -32001, "message": "Invalid API key"})
+ERR_RATE_LIMITED = orjson.dumps({"code": -32002, "message": f"Rate limit exceeded. Maximum {RATE_LIMIT_REQUESTS} requests per hour."})
+ERR_SERVER_BUSY = orjson.dumps({"code": -32003, "message": "Server busy. Please retry later."})
+ERR_LENGTH_MISMATCH = orjson.dumps({"code": -32602, "message": "Assets and weights arrays must have the same length"})
+ERR_NON_NUMERIC_WEIGHTS = orjson.dumps({"code": -32602, "message": "Weights must be finite numbers"})
+ERR_TIMEOUT = orjson.dumps({"code": -32603, "message": "Request timeout: Portfolio calculation took too long"})
+
+def ojson(obj: Any, status: int = 200) -> Response:
+    """Serialize obj with orjson into a JSON response"""
+    return Response(orjson.dumps(obj), status=status, mimetype='application/json')
+
+def _json_response(body: bytes, status: int = 200) -> Response:
+    """Wrap an already serialized JSON body in a response"""
+    return Response(body, status=status, mimetype='application/json')
+
+# Keep-alive connection pool to the portfolio API, so tool calls skip the TCP/TLS handshake.
+# The calculation is a pure function of its inputs, so retrying a POST on a gateway error is safe.
+# Plain http:// gets the same pool, for an endpoint behind a local TLS-originating sidecar
+api_session = requests.Session()
+api_adapter = HTTPAdapter(
+    pool_connections=50,
+    pool_maxsize=50,
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.1,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=None
+    )
+)
+api_session.mount('https://', api_adapter)
+api_session.mount('http://', api_adapter)
+api_session.headers.update({
+    "Content-Type": "application/json",
+    "User-Agent": f"Portfolio-MCP-Server/{SERVER_INFO['version']}"
+})
+
+# Rate limiting storage (in production, use Redis or similar): client IP -> (window_id, current, previous).
+# Sliding window counter: the previous fixed window's count is weighted by how much of it still
+# overlaps the sliding window, which avoids the 2x burst at fixed-window boundaries in O(1) per client.
+# Kept in least-recently-seen order so idle clients are evicted from the front on each check.
+# Striped by IP hash, each stripe with its own lock, so checks for unrelated clients don't serialize
+RATE_LIMIT_SHARDS = 64
+rate_limit_shards: List["OrderedDict[str, tuple]"] = [OrderedDict() for _ in range(RATE_LIMIT_SHARDS)]
+rate_limit_locks = [threading.Lock() for _ in range(RATE_LIMIT_SHARDS)]
+RATE_LIMIT_MAX_CLIENTS_PER_SHARD = max(1, RATE_LIMIT_MAX_CLIENTS // RATE_LIMIT_SHARDS)
+
+# Per-stripe running totals for /metrics, replaced whole under the stripe lock: (window_id, current,
+# previous) counts of admitted requests, and of clients admitted at least once in each window
+rate_limit_request_totals: List[tuple] = [(0, 0, 0)] * RATE_LIMIT_SHARDS
+rate_limit_client_totals: List[tuple] = [(0, 0, 0)] * RATE_LIMIT_SHARDS
+
+# With REDIS_URL set, all workers/processes count against one quota in Redis. The same sliding
+# window estimate and the increment run as one Lua script (EVALSHA, one round trip per check);
+# keys live for two windows so the previous window's count is still there to weight
+RATE_LIMIT_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+if previous * tonumber(ARGV[2]) + current >= tonumber(ARGV[3]) then
+    return 1
+end
+redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 0
+"""
+redis_client = None
+rate_limit_script = None
+if REDIS_URL and redis is not None:
+    redis_client = redis.Redis(connection_pool=redis.ConnectionPool.from_url(REDIS_URL, socket_keepalive=True))
+    rate_limit_script = redis_client.register_script(RATE_LIMIT_SCRIPT)
+elif REDIS_URL:
+    logger.warning("REDIS_URL is set but redis is not installed; using in-process rate limiting")
+
+# Static /health body with a %s slot for the timestamp
+_HEALTH_TEMPLATE = orjson.dumps({
+    "status": "healthy",
+    "server": SERVER_INFO["name"],
+    "version": SERVER_INFO["version"],
+    "protocol": "MCP JSON-RPC 2.0",
+    "timestamp": None,
+    "uptime": "N/A",  # Would need to track start time
+    "rate_limit": {
+        "requests_per_hour": RATE_LIMIT_REQUESTS,
+        "window_seconds": RATE_LIMIT_WINDOW,
+        "backend": "redis" if redis_client is not None else "memory"
+    },
+    "api_endpoint": API_ENDPOINT
+}).replace(b'%', b'%%').replace(b'"timestamp":null', b'"timestamp":%s')
+
+# (second, ISO string) of the last formatted timestamp
+_timestamp_cache = (0, "")
+
+def _timestamp() -> str:
+    """Current local time in ISO format, formatted at most once per second"""
+    global _timestamp_cache
+    second = int(time.time())
+    cached_second, text = _timestamp_cache
+    if cached_second != second:
+        text = datetime.fromtimestamp(second).isoformat()
+        _timestamp_cache = (second, text)
+    return text
 
 def validate_api_key(api_key: str) -> bool:
     """Validate API key"""
-    if not API_KEY:
+    if not API_KEY_BYTES:
         return True  # No API key required if not set
     
-    return hmac.compare_digest(api_key, API_KEY)
+    return secrets.compare_digest(api_key.encode(), API_KEY_BYTES)
+
+class RateLimitStorageFull(Exception):
+    """Raised when a new client lands on a stripe already tracking its share of RATE_LIMIT_MAX_CLIENTS"""
+
+def _slide_window(entry: Optional[tuple], window_id: int) -> tuple:
+    """Advance a (window_id, current, previous) entry to window_id"""
+    if entry is None or window_id - entry[0] >= 2:
+        return (window_id, 0, 0)
+    if window_id - entry[0] == 1:
+        return (window_id, 0, entry[1])
+    return entry
+
+def _estimated_count(current: int, previous: int, now: float) -> float:
+    """Requests in the sliding window: all of this window plus the overlapping share of the last one"""
+    overlap = 1.0 - (now % RATE_LIMIT_WINDOW) / RATE_LIMIT_WINDOW
+    return previous * overlap + current
+
+def redis_rate_limit_exceeded(client_ip: str, now: float) -> bool:
+    """Check the client's sliding-window request count in Redis"""
+    window_id = int(now // RATE_LIMIT_WINDOW)
+    overlap = 1.0 - (now % RATE_LIMIT_WINDOW) / RATE_LIMIT_WINDOW
+    keys = [f"rl:{client_ip}:{window_id}", f"rl:{client_ip}:{window_id - 1}"]
+    return rate_limit_script(keys=keys, args=[2 * RATE_LIMIT_WINDOW, overlap, RATE_LIMIT_REQUESTS]) == 1
 
 def rate_limit_exceeded(client_ip: str) -> bool:
-    """Check if client has exceeded rate limit"""
+    """Check if client has exceeded rate limit (O(1) sliding window counter per client)"""
     now = time.time()
-    window_start = now - RATE_LIMIT_WINDOW
-    
-    # Clean old entries
-    if client_ip in rate_limit_storage:
-        rate_limit_storage[client_ip] = [
-            req_time for req_time in rate_limit_storage[client_ip] 
-            if req_time > window_start
-        ]
-    else:
-        rate_limit_storage[client_ip] = []
     
-    # Check if limit exceeded
-    if len(rate_limit_storage[client_ip]) >= RATE_LIMIT_REQUESTS:
-        return True
+    if rate_limit_script is not None:
+        try:
+            return redis_rate_limit_exceeded(client_ip, now)
+        except redis.RedisError as e:
+            # Fail over to the local counter rather than rejecting or waving through traffic
+            logger.warning("Redis rate limit check failed, using in-process limit: %s", e)
     
-    # Add current request
-    rate_limit_storage[client_ip].append(now)
-    return False
+    shard_index = hash(client_ip) % RATE_LIMIT_SHARDS
+    storage = rate_limit_shards[shard_index]
+    with rate_limit_locks[shard_index]:
+        # Entries unseen for two full windows no longer affect any estimate
+        now_window = int(now // RATE_LIMIT_WINDOW)
+        while storage:
+            oldest_ip, oldest_entry = next(iter(storage.items()))
+            if oldest_entry[0] > now_window - 2:
+                break
+            del storage[oldest_ip]
+        
+        if client_ip in storage:
+            storage.move_to_end(client_ip)
+        elif len(storage) >= RATE_LIMIT_MAX_CLIENTS_PER_SHARD:
+            raise RateLimitStorageFull()
+        
+        window_id, current, previous = _slide_window(storage.get(client_ip), now_window)
+        
+        # Check if limit exceeded
+        if _estimated_count(current, previous, now) >= RATE_LIMIT_REQUESTS:
+            storage[client_ip] = (window_id, current, previous)
+            return True
+        
+        # Count the current request
+        storage[client_ip] = (window_id, current + 1, previous)
+        
+        # Running totals for /metrics; a client counts once per window, on its first admitted request
+        totals_window, total_current, total_previous = _slide_window(rate_limit_request_totals[shard_index], now_window)
+        rate_limit_request_totals[shard_index] = (totals_window, total_current + 1, total_previous)
+        if current == 0:
+            clients_window, clients_current, clients_previous = _slide_window(rate_limit_client_totals[shard_index], now_window)
+            rate_limit_client_totals[shard_index] = (clients_window, clients_current + 1, clients_previous)
+        return False
+
+def _request_id() -> Any:
+    """JSON-RPC id of the current request, or None if the body isn't a JSON object (body parsed once, then cached)"""
+    data = request.get_json(silent=True)
+    return data.get("id") if isinstance(data, dict) else None
 
 def require_auth(f):
     """Decorator to require API key authentication"""
@@ -69,15 +397,8 @@ def require_auth(f):
         api_key = request.headers.get('X-API-Key', '')
         
         if not validate_api_key(api_key):
-            logger.warning(f"Invalid API key from {request.remote_addr}")
-            return jsonify({
-                "jsonrpc": "2.0",
-                "id": request.json.get("id") if request.json else None,
-                "error": {
-                    "code": -32001,
-                    "message": "Invalid API key"
-                }
-            }), 401
+            logger.warning("Invalid API key from %s", request.remote_addr)
+            return _json_response(_err_bytes(_request_id(), ERR_INVALID_API_KEY), 401)
         
         return f(*args, **kwargs)
     return decorated_function
@@ -88,62 +409,49 @@ def check_rate_limit(f):
     def decorated_function(*args, **kwargs):
         client_ip = request.remote_addr
         
-        if rate_limit_exceeded(client_ip):
-            logger.warning(f"Rate limit exceeded for {client_ip}")
-            return jsonify({
-                "jsonrpc": "2.0",
-                "id": request.json.get("id") if request.json else None,
-                "error": {
-                    "code": -32002,
-                    "message": f"Rate limit exceeded. Maximum {RATE_LIMIT_REQUESTS} requests per hour."
-                }
-            }), 429
+        try:
+            exceeded = rate_limit_exceeded(client_ip)
+        except RateLimitStorageFull:
+            logger.warning("Rate limit storage full, rejecting new client %s", client_ip)
+            return _json_response(_err_bytes(_request_id(), ERR_SERVER_BUSY), 503)
+        
+        if exceeded:
+            logger.warning("Rate limit exceeded for %s", client_ip)
+            return _json_response(_err_bytes(_request_id(), ERR_RATE_LIMITED), 429)
         
         return f(*args, **kwargs)
     return decorated_function
 
-def validate_request_data(data: Dict) -> Optional[Dict]:
-    """Validate incoming request data"""
+def validate_request_data(data: Dict) -> Optional[bytes]:
+    """Validate incoming request data, returning the serialized error object on failure"""
     if not data:
-        return {"code": -32700, "message": "Parse error: No data provided"}
+        return ERR_NO_DATA
     
     if not isinstance(data, dict):
-        return {"code": -32700, "message": "Parse error: Invalid JSON"}
+        return ERR_INVALID_JSON
     
-    if "jsonrpc" not in data or data["jsonrpc"] != "2.0":
-        return {"code": -32600, "message": "Invalid Request: Missing or invalid jsonrpc version"}
+    if data.get("jsonrpc") != "2.0":
+        return ERR_INVALID_VERSION
     
     if "method" not in data:
-        return {"code": -32600, "message": "Invalid Request: Missing method"}
+        return ERR_MISSING_METHOD
     
     return None
 
 def log_request(method: str, params: Dict, client_ip: str, duration: float):
     """Log request details"""
-    logger.info(f"MCP Request: {method} from {client_ip} ({duration:.3f}s)")
+    logger.info("MCP Request: %s from %s (%.3fs)", method, client_ip, duration)
     if method == "tools/call":
         tool_name = params.get("name", "unknown")
-        logger.info(f"  Tool: {tool_name}")
+        logger.info("  Tool: %s", tool_name)
 
 def handle_cors():
     """Handle CORS headers"""
-    origin = request.headers.get('Origin', '')
-    
-    if ALLOWED_ORIGINS == ['*'] or origin in ALLOWED_ORIGINS:
-        return {
-            'Access-Control-Allow-Origin': origin if origin else '*',
-            'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type, X-API-Key',
-            'Access-Control-Max-Age': '86400'
-        }
-    else:
-        return {
-            'Access-Control-Allow-Origin': 'null',
-            'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type, X-API-Key'
-        }
+    if CORS_HEADERS_WILDCARD is not None:
+        return CORS_HEADERS_WILDCARD
+    return CORS_HEADERS_BY_ORIGIN.get(request.headers.get('Origin', ''), CORS_HEADERS_NULL)
 
-@app.route('/', methods=['POST'])
+@app.route('/', methods=['POST'], provide_automatic_options=False)
 @require_auth
 @check_rate_limit
 def handle_mcp_request():
@@ -151,151 +459,63 @@ def handle_mcp_request():
     start_time = time.time()
     client_ip = request.remote_addr
     
+    # Parse the body once; a missing or malformed body yields None instead of raising
+    data = request.get_json(silent=True)
+    request_id = data.get("id") if isinstance(data, dict) else None
+    
     try:
-        data = request.json
         validation_error = validate_request_data(data)
         
         if validation_error:
-            return jsonify({
-                "jsonrpc": "2.0",
-                "id": data.get("id") if data else None,
-                "error": validation_error
-            }), 400
+            return _json_response(_err_bytes(request_id, validation_error), 400)
         
         method = data.get("method")
-        request_id = data.get("id")
         params = data.get("params", {})
         
         # Handle different MCP methods
         if method == "initialize":
-            response = {
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "result": {
-                    "protocolVersion": "2024-11-05",
-                    "capabilities": {
-                        "tools": {
-                            "listChanged": True
-                        },
-                        "logging": {}
-                    },
-                    "serverInfo": SERVER_INFO
-                }
-            }
+            response = _rpc_result_bytes(request_id, _INITIALIZE_RESULT_BYTES)
             
         elif method == "tools/list":
-            response = {
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "result": {
-                    "tools": [
-                        {
-                            "name": "calculate_portfolio_returns",
-                            "description": (
-                                "Calculates historical total returns for a portfolio of ETFs with specified "
-                                "asset allocation over a given time period. Returns total return, annualized "
-                                "return, volatility, and Sharpe ratio. Use when users ask about portfolio "
-                                "performance or want to compare asset allocations. "
-                                "Available assets: SPY (S&P 500), AGG (US Bonds), VTI (Total US Stock), "
-                                "VXUS (International), BND (Bonds), GLD (Gold), VNQ (Real Estate), "
-                                "QQQ (Nasdaq), EEM (Emerging Markets), TLT (Long Treasury), and more."
-                            ),
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {
-                                    "assets": {
-                                        "type": "array",
-                                        "items": {"type": "string"},
-                                        "description": "Array of ETF tickers (e.g., ['SPY', 'AGG'])",
-                                        "minItems": 1,
-                                        "maxItems": 10
-                                    },
-                                    "weights": {
-                                        "type": "array",
-                                        "items": {"type": "number", "minimum": 0, "maximum": 1},
-                                        "description": "Weights in decimal format summing to 1.0 (e.g., [0.6, 0.4])",
-                                        "minItems": 1,
-                                        "maxItems": 10
-                                    },
-                                    "startDate": {
-                                        "type": "string",
-                                        "format": "date",
-                                        "description": "Start date in YYYY-MM-DD format (e.g., '2020-01-01')"
-                                    },
-                                    "endDate": {
-                                        "type": "string",
-                                        "format": "date",
-                                        "description": "End date in YYYY-MM-DD format (e.g., '2023-12-31')"
-                                    },
-                                    "rebalanceMonths": {
-                                        "type": "integer",
-                                        "description": "Rebalancing frequency in months (-1 for never, 12 for annual)",
-                                        "minimum": -1,
-                                        "maximum": 12,
-                                        "default": -1
-                                    }
-                                },
-                                "required": ["assets", "weights", "startDate", "endDate"]
-                            }
-                        }
-                    ]
-                }
-            }
+            response = _rpc_result_bytes(request_id, _TOOLS_LIST_RESULT_BYTES)
             
         elif method == "tools/call":
             tool_name = params.get("name")
             arguments = params.get("arguments", {})
             
             if tool_name != "calculate_portfolio_returns":
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "error": {
-                        "code": -32601,
-                        "message": f"Unknown tool: {tool_name}"
-                    }
-                }
+                response = _err(request_id, -32601, f"Unknown tool: {tool_name}")
             else:
-                # Validate tool arguments
-                required_args = ["assets", "weights", "startDate", "endDate"]
-                missing_args = [arg for arg in required_args if arg not in arguments]
+                # Validate tool arguments against the input schema
+                try:
+                    _validate_tool_args(arguments)
+                    schema_error = None
+                except fastjsonschema.JsonSchemaException as e:
+                    schema_error = e.message
                 
-                if missing_args:
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": request_id,
-                        "error": {
-                            "code": -32602,
-                            "message": f"Missing required parameters: {', '.join(missing_args)}"
-                        }
-                    }
+                if schema_error:
+                    response = _err(request_id, -32602, f"Invalid arguments: {schema_error}")
                 else:
-                    # Validate asset and weight arrays
-                    assets = arguments.get("assets", [])
-                    weights = arguments.get("weights", [])
+                    # The schema guarantees numeric weights; cross-field checks remain
+                    assets = arguments["assets"]
+                    weights = arguments["weights"]
+                    
+                    # Sum once; NaN weights or an overflowing sum come out non-finite
+                    try:
+                        total = math.fsum(weights)
+                    except OverflowError:
+                        total = math.inf
                     
                     if len(assets) != len(weights):
-                        response = {
-                            "jsonrpc": "2.0",
-                            "id": request_id,
-                            "error": {
-                                "code": -32602,
-                                "message": "Assets and weights arrays must have the same length"
-                            }
-                        }
-                    elif abs(sum(weights) - 1.0) > 0.01:
-                        response = {
-                            "jsonrpc": "2.0",
-                            "id": request_id,
-                            "error": {
-                                "code": -32602,
-                                "message": f"Weights must sum to 1.0 (currently {sum(weights):.3f})"
-                            }
-                        }
+                        response = _err_bytes(request_id, ERR_LENGTH_MISMATCH)
+                    elif not math.isfinite(total):
+                        response = _err_bytes(request_id, ERR_NON_NUMERIC_WEIGHTS)
+                    elif abs(total - 1.0) > 0.01:
+                        response = _err(request_id, -32602, f"Weights must sum to 1.0 (currently {total:.3f})")
                     else:
                         # Call the portfolio calculator API
                         try:
-                            api_response = requests.post(
+                            api_response = api_session.post(
                                 API_ENDPOINT,
                                 json={
                                     "assets": assets,
@@ -305,166 +525,78 @@ def handle_mcp_request():
                                     "rebalanceMonths": arguments.get("rebalanceMonths", -1),
                                     "generateCSV": False  # Disable CSV for MCP calls
                                 },
-                                headers={
-                                    "Content-Type": "application/json",
-                                    "User-Agent": f"Portfolio-MCP-Server/{SERVER_INFO['version']}"
-                                },
                                 timeout=30
                             )
                             
                             api_response.raise_for_status()
-                            result = api_response.json()
+                            raw = api_response.content
+                            result = orjson.loads(raw)
                             
                             if result.get("success"):
-                                response = {
-                                    "jsonrpc": "2.0",
-                                    "id": request_id,
-                                    "result": {
-                                        "content": [
-                                            {
-                                                "type": "text",
-                                                "text": json.dumps(result, indent=2)
-                                            }
-                                        ]
-                                    }
-                                }
+                                # Upstream body is already JSON text, pass it through as-is
+                                response = _text_result(request_id, raw.decode())
                             else:
-                                response = {
-                                    "jsonrpc": "2.0",
-                                    "id": request_id,
-                                    "error": {
-                                        "code": -32603,
-                                        "message": f"Portfolio calculation failed: {result.get('error', 'Unknown error')}"
-                                    }
-                                }
+                                response = _err(request_id, -32603, f"Portfolio calculation failed: {result.get('error', 'Unknown error')}")
                                 
                         except requests.exceptions.Timeout:
-                            response = {
-                                "jsonrpc": "2.0",
-                                "id": request_id,
-                                "error": {
-                                    "code": -32603,
-                                    "message": "Request timeout: Portfolio calculation took too long"
-                                }
-                            }
+                            response = _err_bytes(request_id, ERR_TIMEOUT)
                         except requests.exceptions.RequestException as e:
-                            logger.error(f"API request failed: {e}")
-                            response = {
-                                "jsonrpc": "2.0",
-                                "id": request_id,
-                                "error": {
-                                    "code": -32603,
-                                    "message": f"External API error: {str(e)}"
-                                }
-                            }
+                            logger.error("API request failed: %s", e)
+                            response = _err(request_id, -32603, f"External API error: {str(e)}")
                         except Exception as e:
-                            logger.error(f"Unexpected error in tool call: {e}")
-                            response = {
-                                "jsonrpc": "2.0",
-                                "id": request_id,
-                                "error": {
-                                    "code": -32603,
-                                    "message": f"Internal error: {str(e)}"
-                                }
-                            }
+                            logger.error("Unexpected error in tool call: %s", e)
+                            response = _err(request_id, -32603, f"Internal error: {str(e)}")
         else:
-            response = {
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "error": {
-                    "code": -32601,
-                    "message": f"Method not found: {method}"
-                }
-            }
+            response = _err(request_id, -32601, f"Method not found: {method}")
         
         # Log request
         duration = time.time() - start_time
         log_request(method, params, client_ip, duration)
         
-        return jsonify(response), 200
+        return _json_response(response)
         
     except Exception as e:
         duration = time.time() - start_time
-        logger.error(f"Unexpected error in MCP handler: {e} (after {duration:.3f}s)")
+        logger.error("Unexpected error in MCP handler: %s (after %.3fs)", e, duration)
         
-        return jsonify({
-            "jsonrpc": "2.0",
-            "id": request.json.get("id") if request.json else None,
-            "error": {
-                "code": -32603,
-                "message": f"Internal server error: {str(e)}"
-            }
-        }), 500
+        return _json_response(_err(request_id, -32603, f"Internal server error: {str(e)}"), 500)
 
-@app.route('/tools', methods=['GET'])
+@app.route('/tools', methods=['GET'], provide_automatic_options=False)
 def list_tools_http():
     """HTTP GET endpoint for tools list"""
-    return jsonify({
-        "tools": [
-            {
-                "name": "calculate_portfolio_returns",
-                "description": "Calculates historical total returns for a portfolio of ETFs",
-                "version": SERVER_INFO["version"],
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "assets": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                            "description": "Array of ETF tickers"
-                        },
-                        "weights": {
-                            "type": "array",
-                            "items": {"type": "number"},
-                            "description": "Weights summing to 1.0"
-                        },
-                        "startDate": {
-                            "type": "string",
-                            "description": "Start date YYYY-MM-DD"
-                        },
-                        "endDate": {
-                            "type": "string",
-                            "description": "End date YYYY-MM-DD"
-                        }
-                    },
-                    "required": ["assets", "weights", "startDate", "endDate"]
-                }
-            }
-        ]
-    })
+    return Response(_TOOLS_HTTP_BYTES, mimetype='application/json')
 
-@app.route('/health', methods=['GET'])
-@app.route('/status', methods=['GET'])
+@app.route('/health', methods=['GET'], provide_automatic_options=False)
+@app.route('/status', methods=['GET'], provide_automatic_options=False)
 def health():
     """Health check endpoint with detailed status"""
-    return jsonify({
-        "status": "healthy",
-        "server": SERVER_INFO["name"],
-        "version": SERVER_INFO["version"],
-        "protocol": "MCP JSON-RPC 2.0",
-        "timestamp": datetime.now().isoformat(),
-        "uptime": "N/A",  # Would need to track start time
-        "rate_limit": {
-            "requests_per_hour": RATE_LIMIT_REQUESTS,
-            "window_seconds": RATE_LIMIT_WINDOW
-        },
-        "api_endpoint": API_ENDPOINT
-    })
+    # Only the timestamp changes between calls
+    return _json_response(_HEALTH_TEMPLATE % orjson.dumps(_timestamp()))
 
-@app.route('/metrics', methods=['GET'])
+@app.route('/metrics', methods=['GET'], provide_automatic_options=False)
 def metrics():
     """Basic metrics endpoint"""
-    total_requests = sum(len(requests) for requests in rate_limit_storage.values())
-    unique_clients = len(rate_limit_storage)
+    # Sliding-window estimates of the per-stripe running totals, advanced to now; O(stripes), not
+    # O(clients). Totals are swapped as whole tuples, so they can be read without taking the locks
+    now = time.time()
+    window_id = int(now // RATE_LIMIT_WINDOW)
+    total_requests = 0.0
+    unique_clients = 0.0
+    for request_totals, client_totals in zip(rate_limit_request_totals, rate_limit_client_totals):
+        _, current, previous = _slide_window(request_totals, window_id)
+        total_requests += _estimated_count(current, previous, now)
+        _, current, previous = _slide_window(client_totals, window_id)
+        unique_clients += _estimated_count(current, previous, now)
     
-    return jsonify({
-        "total_requests_last_hour": total_requests,
-        "unique_clients_last_hour": unique_clients,
-        "rate_limit_storage_size": len(rate_limit_storage),
-        "timestamp": datetime.now().isoformat()
+    return ojson({
+        "total_requests_last_hour": round(total_requests),
+        "unique_clients_last_hour": round(unique_clients),
+        "rate_limit_storage_size": sum(len(storage) for storage in rate_limit_shards),
+        "timestamp": _timestamp()
     })
 
-# Handle OPTIONS requests for CORS
+# Handle OPTIONS requests for CORS; the routes above opt out of Flask's automatic OPTIONS
+# responses, which would otherwise answer preflights first without these headers
 @app.route('/', methods=['OPTIONS'])
 @app.route('/tools', methods=['OPTIONS'])
 @app.route('/health', methods=['OPTIONS'])
@@ -475,7 +607,7 @@ def handle_options():
     return '', 200, handle_cors()
 
 if __name__ == '__main__':
-    # Production configuration
+    # Local development only; deployments run gunicorn -c gunicorn_conf.py portfolio_mcp_server:app
     debug_mode = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     port = int(os.getenv('PORT', 8000))
     host = os.getenv('HOST', '0.0.0.0')